@@ -0,0 +1,479 @@
+import argparse
+import json
+import math
+import platform
+import statistics
+import sys
+import time
+from collections import Counter
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from bitset_ccg import BitsetGrammar, bitset_parse
+from budget import BudgetExceeded, ParseBudget
+from ccg import cky_parse
+from derivations import iter_derivations, parse_items
+from fast_ccg import fast_ccg, recombine_chart
+from forest import ParseForest
+from goal_filter import GoalFilter
+from lattice import make_lattice
+from rule_table import RuleTable, CKY_RULES
+from wavefront import Wavefront
+
+Grammar = Tuple[Dict[str, str], List[str]]
+
+
+def composition_family(n: int, degree: int = 1) -> Grammar:
+    """
+    A chain of functors X0/X1, X1/X2, ... that can be composed in any order, followed by a functor
+    X_m/Z_d/.../Z_1 and its arguments Z_1 ... Z_d, so the last composition has the given degree.
+    The chain has a Catalan number of derivations.
+    :param n: the sentence length, at least degree + 2
+    :param degree: the degree of the last composition, 0 for plain application
+    """
+    m = n - 1 - degree
+    if m < 1:
+        raise ValueError(f"composition family of degree {degree} needs at least {degree + 2} words")
+    lexicon = {'w0': 'S/X1'}
+    for i in range(1, m):
+        lexicon[f'w{i}'] = f'X{i}/X{i + 1}'
+    lexicon[f'w{m}'] = f'X{m}' + ''.join(f'/Z{k}' for k in range(degree, 0, -1))
+    for k in range(1, degree + 1):
+        lexicon[f'z{k}'] = f'Z{k}'
+    return lexicon, [f'w{i}' for i in range(m + 1)] + [f'z{k}' for k in range(1, degree + 1)]
+
+
+def arity_family(n: int, arity: int = 2) -> Grammar:
+    """
+    A right branching sentence of heads with the given lexical arity: every head takes arity - 1 arguments
+    that follow it directly, and the next head (the rest of the sentence) as its last argument.
+    The sentence is cut to a whole number of heads, i.e. the largest multiple of arity not above n.
+    :param n: the maximal sentence length, at least arity
+    :param arity: the arity of the heads, at least 1
+    """
+    heads = n // arity
+    if arity < 1 or heads < 1:
+        raise ValueError(f"arity family of arity {arity} needs at least {max(arity, 1)} words")
+    lexicon, tokens = {}, []
+    for h in range(heads):
+        result = 'S' if h == 0 else f'H{h}'
+        category = result if h == heads - 1 else f'{result}/H{h + 1}'
+        category += ''.join(f'/A{h}_{k}' for k in range(arity - 1, 0, -1))
+        lexicon[f'h{h}'] = category
+        tokens.append(f'h{h}')
+        for k in range(1, arity):
+            lexicon[f'a{h}_{k}'] = f'A{h}_{k}'
+            tokens.append(f'a{h}_{k}')
+    return lexicon, tokens
+
+
+def exponential_family(n: int) -> Grammar:
+    """
+    A family with exponentially many derivations, in the spirit of section 3.2 of Kuhlmann, Satta 2014:
+    S/X1 followed by the functors X_i/X_i/X_i+1, which can be composed into categories S/X1/.../X_i whose length
+    grows with the span, and then the arguments X_m+1 ... X1 of the result.
+    Without a forest both parsers store every derivation, so both charts grow exponentially (at n=16 cky_parse
+    stores 187k edges and fast_ccg 210k, about 1.9^n and 2.2^n). With a forest both are polynomial: a span
+    only holds a few categories, so the derivation contexts share nothing and only add edges (87 against 607
+    at n=16). See crossover_family for the family on which fast_ccg overtakes cky_parse.
+    :param n: the sentence length, rounded down to an even number, at least 4
+    """
+    m = (n - 2) // 2
+    if m < 1:
+        raise ValueError("exponential family needs at least 4 words")
+    lexicon, tokens = {'w0': 'S/X1'}, ['w0']
+    for i in range(1, m + 1):
+        lexicon[f'a{i}'] = f'X{i}/X{i}/X{i + 1}'
+        tokens.append(f'a{i}')
+    for i in range(m + 1, 0, -1):
+        lexicon[f'b{i}'] = f'X{i}'
+        tokens.append(f'b{i}')
+    return lexicon, tokens
+
+
+def crossover_family(n: int) -> Grammar:
+    """
+    A family on which fast_ccg overtakes cky_parse with a forest, parsed with composition up to degree 2
+    (see FAMILY_RULES): S/A followed by functors that are each A/B/A or A/C/A, then A, then words that are each
+    B or C. The functors compose into S/X_1/.../X_k/A with every choice of the X_i, so the packed chart of
+    cky_parse holds 2^k categories over the first k + 1 words and grows exponentially.
+    fast_ccg keeps the categories longer than c_G as derivation contexts with a bounded β, which recombine with
+    the functors of their hole, so its packed chart grows polynomially. Up to n=12 cky_parse is faster, from
+    n=14 on fast_ccg is (about 1.55^n against n^3.6 up to n=24). Without a forest both store every
+    derivation, of which there are exponentially many.
+    :param n: the sentence length, rounded down to an even number, at least 4
+    """
+    m = (n - 2) // 2
+    if m < 1:
+        raise ValueError("crossover family needs at least 4 words")
+    lexicon = {'w0': 'S/A', 'f': [('A/B/A', 0.5), ('A/C/A', 0.5)], 'a': 'A', 'x': [('B', 0.5), ('C', 0.5)]}
+    return lexicon, ['w0'] + ['f'] * m + ['a'] + ['x'] * m
+
+
+FAMILIES: Dict[str, Callable[..., Grammar]] = {
+    'composition': composition_family,
+    'arity': arity_family,
+    'exponential': exponential_family,
+    'crossover': crossover_family,
+}
+
+# the rule table of the families that are not parsed with CKY_RULES
+FAMILY_RULES: Dict[str, RuleTable] = {
+    'crossover': RuleTable(max_degree=2),
+}
+
+
+def _naive(lexicon, tokens, rules=CKY_RULES):
+    return cky_parse(lexicon, tokens, rules=rules)[:2]
+
+
+def _fast(lexicon, tokens, rules=CKY_RULES):
+    return fast_ccg(lexicon, tokens, rules=rules)[:2]
+
+
+def _naive_packed(lexicon, tokens, rules=CKY_RULES):
+    return cky_parse(lexicon, tokens, forest=ParseForest(), rules=rules)[:2]
+
+
+def _fast_packed(lexicon, tokens, rules=CKY_RULES):
+    return fast_ccg(lexicon, tokens, forest=ParseForest(), rules=rules)[:2]
+
+
+def _fast_wavefront(lexicon, tokens, rules=CKY_RULES):
+    return fast_ccg(lexicon, tokens, wavefront=Wavefront(), rules=rules)[:2]
+
+
+def _grammar_key(lexicon, rules: RuleTable) -> tuple:
+    # a word of a family can have several categories, given as (category, probability) pairs
+    entries = frozenset((word, entry if isinstance(entry, str) else tuple(entry)) for word, entry in lexicon.items())
+    return entries, rules
+
+
+def _lexicon_categories(lexicon) -> List[str]:
+    return [category for entry in lexicon.values()
+            for category in ([entry] if isinstance(entry, str) else [category for category, _ in entry])]
+
+
+# the goal filter of a lexicon is built once and reused, like a grammar would be
+_GOAL_FILTERS: Dict[tuple, GoalFilter] = {}
+
+
+def _fast_goal_filter(lexicon, tokens, rules=CKY_RULES):
+    key = _grammar_key(lexicon, rules)
+    goal_filter = _GOAL_FILTERS.get(key)
+    if goal_filter is None:
+        goal_filter = _GOAL_FILTERS[key] = GoalFilter(_lexicon_categories(lexicon), rules=rules)
+    return fast_ccg(lexicon, tokens, goal_filter=goal_filter, rules=rules)[:2]
+
+
+def _naive_recognize(lexicon, tokens, rules=CKY_RULES):
+    return cky_parse(lexicon, tokens, recognize=True, rules=rules)[:2]
+
+
+def _fast_recognize(lexicon, tokens, rules=CKY_RULES):
+    return fast_ccg(lexicon, tokens, recognize=True, rules=rules)[:2]
+
+
+# the rule table of a lexicon is filled in the warmup runs and reused, like a grammar would be
+_GRAMMARS: Dict[tuple, BitsetGrammar] = {}
+
+
+def _bitset(lexicon, tokens, rules=CKY_RULES):
+    # only recognises, the number of parses is 1 or 0
+    grammar = _GRAMMARS.get(_grammar_key(lexicon, rules))
+    if grammar is None:
+        grammar = _GRAMMARS[_grammar_key(lexicon, rules)] = BitsetGrammar(rules=rules)
+    accepted, chart = bitset_parse(None, None, grammar=grammar, lattice=make_lattice(lexicon, tokens))
+    return int(accepted), chart
+
+
+# every variant returns (number of parses, chart), the rules are those of the family (see FAMILY_RULES)
+PARSERS: Dict[str, Callable[..., tuple]] = {
+    'naive': _naive,
+    'fast': _fast,
+    'naive_packed': _naive_packed,
+    'fast_packed': _fast_packed,
+    'fast_wavefront': _fast_wavefront,
+    'fast_goal_filter': _fast_goal_filter,
+    'naive_recognize': _naive_recognize,
+    'fast_recognize': _fast_recognize,
+    'bitset': _bitset,
+}
+
+# the variants that only recognise, their number of parses is 1 or 0
+RECOGNIZERS = {'naive_recognize', 'fast_recognize', 'bitset'}
+
+
+def count_edges(chart) -> int:
+    # a bitset cell holds one edge per category
+    return sum(bin(cell).count('1') if isinstance(cell, int) else len(cell) for row in chart for cell in row)
+
+
+def measure(parse: Callable, lexicon: Dict[str, str], tokens: List[str],
+            warmup: int = 1, repetitions: int = 5, rules: RuleTable = CKY_RULES) -> dict:
+    """
+    Times one parser on one sentence.
+    :param parse: one of PARSERS
+    :param warmup: untimed runs first, these also intern the categories of the grammar
+    :param repetitions: timed runs
+    :param rules: the rule table to parse with
+    :return: the number of parses and edges, and the min / median / mean time in ns
+    """
+    for _ in range(warmup):
+        parse(lexicon, tokens, rules)
+    times = []
+    for _ in range(repetitions):
+        start = time.perf_counter_ns()
+        num_parses, chart = parse(lexicon, tokens, rules)
+        times.append(time.perf_counter_ns() - start)
+    return {'parses': num_parses, 'edges': count_edges(chart),
+            'min_ns': min(times), 'median_ns': int(statistics.median(times)), 'mean_ns': int(statistics.fmean(times))}
+
+
+def fit_exponents(lengths: List[int], times_ns: List[int]) -> dict:
+    """
+    Fits time = c * n^k (a line in log t over log n) and time = c * b^n (a line in log t over n).
+    The model with the higher r^2 tells whether a parser behaves polynomially or exponentially on a family.
+    :return: the polynomial degree k, the exponential base b and the r^2 of both fits, None for too few points
+    """
+    if len(lengths) < 3 or len(set(lengths)) < 3:
+        return {'polynomial_degree': None, 'polynomial_r2': None, 'exponential_base': None, 'exponential_r2': None}
+    log_times = [math.log(max(t, 1)) for t in times_ns]
+    log_lengths = [math.log(n) for n in lengths]
+    polynomial = statistics.linear_regression(log_lengths, log_times)
+    exponential = statistics.linear_regression(lengths, log_times)
+    return {'polynomial_degree': polynomial.slope,
+            'polynomial_r2': statistics.correlation(log_lengths, log_times) ** 2,
+            'exponential_base': math.exp(exponential.slope),
+            'exponential_r2': statistics.correlation(lengths, log_times) ** 2}
+
+
+def run_benchmark(families: List[Tuple[str, dict]], lengths: Iterable[int], parsers: Iterable[str] = tuple(PARSERS),
+                  warmup: int = 1, repetitions: int = 5, max_seconds: Optional[float] = 2.0) -> dict:
+    """
+    Times every parser on every family for growing sentence lengths.
+    :param families: (family of FAMILIES, keyword arguments) pairs, e.g. [('composition', {'degree': 2})],
+                     a family can be given more than once with other arguments
+    :param lengths: the sentence lengths to try, in increasing order
+    :param parsers: names of PARSERS
+    :param max_seconds: a parser is not run on longer sentences of a family once a run took longer than this
+    :return: the measurements and fitted exponents per family and parser, ready to be written as json
+    """
+    lengths = sorted(set(lengths))
+    results = {'python': platform.python_version(), 'warmup': warmup, 'repetitions': repetitions, 'runs': []}
+    for family, kwargs in families:
+        for parser in parsers:
+            points = []
+            for n in lengths:
+                try:
+                    lexicon, tokens = FAMILIES[family](n, **kwargs)
+                except ValueError:
+                    continue
+                if points and len(tokens) == points[-1]['length']:
+                    # the family rounds n, this length was measured already
+                    continue
+                point = measure(PARSERS[parser], lexicon, tokens, warmup, repetitions,
+                                FAMILY_RULES.get(family, CKY_RULES))
+                point['length'] = len(tokens)
+                points.append(point)
+                if max_seconds is not None and point['min_ns'] > max_seconds * 1e9:
+                    break
+            results['runs'].append({'family': family, 'params': kwargs, 'parser': parser, 'points': points,
+                                    'fit': fit_exponents([p['length'] for p in points], [p['min_ns'] for p in points])})
+    return results
+
+
+def derivation_trees(parser: Callable, lexicon: Dict[str, str], tokens: List[str],
+                     rules: RuleTable = CKY_RULES) -> Counter:
+    """
+    :param parser: cky_parse or fast_ccg
+    :return: how often every derivation tree of the sentence is found, as the repr of derivations.Derivation
+    """
+    forest = ParseForest()
+    chart = parser(lexicon, tokens, forest=forest, rules=rules)[1]
+    return Counter(repr(derivation) for derivation in iter_derivations(forest, parse_items(chart), words=tokens))
+
+
+def forest_counts(parser: Callable, lexicon: Dict[str, str], tokens: List[str],
+                  rules: RuleTable = CKY_RULES) -> Counter:
+    """
+    :param parser: cky_parse or fast_ccg
+    :return: the number of derivations of every (category, i, j) of the packed chart. The derivations fast_ccg
+             builds through a derivation context are counted on the recombined items, which add up to the same,
+             all of them are built for it (see fast_ccg.recombine_chart)
+    """
+    forest = ParseForest()
+    chart = parser(lexicon, tokens, forest=forest, rules=rules)[1]
+    if parser is fast_ccg:
+        recombine_chart(chart, forest)
+    counts = Counter()
+    for row in chart:
+        for cell in row:
+            for item in cell:
+                if not hasattr(item, 'beta_id'):
+                    counts[(item.category, item.i, item.j)] += forest.count(item)
+    return counts
+
+
+def check_parsers(families: List[Tuple[str, dict]], lengths: Iterable[int], parsers: Iterable[str] = tuple(PARSERS)) -> List[str]:
+    """
+    Differential check against cky_parse: every parser has to find as many parses on every sentence
+    (the RECOGNIZERS only whether there is one), and fast_ccg has to find the same derivation trees, each of them once.
+    The packed charts of fast_ccg have to count as many derivations as those of cky_parse for every item.
+
+    >>> check_parsers([('exponential', {}), ('crossover', {})], range(4, 13, 2))
+    []
+    >>> check_parsers([('composition', {'degree': 1}), ('composition', {'degree': 2}), ('arity', {'arity': 3})],
+    ...               range(4, 11, 2))
+    []
+
+    :param families: as for run_benchmark
+    :param lengths: the sentence lengths to try
+    :param parsers: names of PARSERS
+    :return: a message for every difference
+    """
+    differences = []
+    for family, kwargs in families:
+        checked = set()
+        for n in sorted(set(lengths)):
+            try:
+                lexicon, tokens = FAMILIES[family](n, **kwargs)
+            except ValueError:
+                continue
+            if len(tokens) in checked:
+                continue
+            checked.add(len(tokens))
+            name = f"{family}{kwargs} n={len(tokens)}"
+            rules = FAMILY_RULES.get(family, CKY_RULES)
+            expected = cky_parse(lexicon, tokens, rules=rules)[0]
+            for parser in parsers:
+                found = PARSERS[parser](lexicon, tokens, rules)[0]
+                if found != (int(expected > 0) if parser in RECOGNIZERS else expected):
+                    differences.append(f"{name} {parser}: {found} parses, cky_parse finds {expected}")
+            counts = forest_counts(cky_parse, lexicon, tokens, rules)
+            fast_counts = forest_counts(fast_ccg, lexicon, tokens, rules)
+            for key in counts.keys() | fast_counts.keys():
+                if counts[key] != fast_counts[key]:
+                    differences.append(f"{name} {key}: fast_packed counts {fast_counts[key]} derivations, "
+                                       f"naive_packed {counts[key]}")
+            trees = derivation_trees(cky_parse, lexicon, tokens, rules)
+            fast_trees = derivation_trees(fast_ccg, lexicon, tokens, rules)
+            for tree in trees.keys() - fast_trees.keys():
+                differences.append(f"{name} fast_ccg misses {tree}")
+            for tree, times in fast_trees.items():
+                if tree not in trees:
+                    differences.append(f"{name} fast_ccg finds {tree}, cky_parse does not")
+                elif times > 1:
+                    differences.append(f"{name} fast_ccg finds {tree} {times} times")
+    return differences
+
+
+def check_budget(family: str, kwargs: dict, n: int, **limits) -> List[str]:
+    """
+    A parse over its budget has to stop in the same way with a wavefront as without, the BudgetExceeded
+    of a worker is sent back to the parent.
+
+    >>> check_budget('exponential', {}, 12, max_edges=300)
+    []
+
+    :param limits: as for budget.ParseBudget
+    :return: a message for every difference
+    """
+    lexicon, tokens = FAMILIES[family](n, **kwargs)
+    outcomes = []
+    for wavefront in (None, Wavefront(workers=2, min_length=0, min_pairs=0)):
+        try:
+            outcomes.append(fast_ccg(lexicon, tokens, wavefront=wavefront, budget=ParseBudget(**limits),
+                                     rules=FAMILY_RULES.get(family, CKY_RULES))[0])
+        except BudgetExceeded as exceeded:
+            outcomes.append((exceeded.reason, exceeded.edges, exceeded.length))
+    if outcomes[0] != outcomes[1]:
+        return [f"{family}{kwargs} n={len(tokens)}: {outcomes[1]} with a wavefront, {outcomes[0]} without"]
+    return []
+
+
+def compare(baseline: dict, results: dict, tolerance: float = 0.25) -> List[str]:
+    """
+    Compares two benchmark results point by point.
+    :param tolerance: allowed relative slowdown of the min time
+    :return: a message for every measurement that got slower by more than the tolerance or changed its output
+    """
+    def key(run):
+        return run['family'], json.dumps(run['params'], sort_keys=True), run['parser']
+
+    old_runs = {key(run): run for run in baseline['runs']}
+    regressions = []
+    for run in results['runs']:
+        old_run = old_runs.get(key(run))
+        if old_run is None:
+            continue
+        old_points = {point['length']: point for point in old_run['points']}
+        for point in run['points']:
+            old = old_points.get(point['length'])
+            if old is None:
+                continue
+            name = f"{run['family']}{run['params']} {run['parser']} n={point['length']}"
+            if (old['parses'], old['edges']) != (point['parses'], point['edges']):
+                regressions.append(f"{name}: parses/edges changed from {old['parses']}/{old['edges']} "
+                                   f"to {point['parses']}/{point['edges']}")
+            elif point['min_ns'] > old['min_ns'] * (1 + tolerance):
+                regressions.append(f"{name}: {old['min_ns'] / 1e6:.2f}ms -> {point['min_ns'] / 1e6:.2f}ms")
+    return regressions
+
+
+def _family_arguments(spec: str) -> Tuple[str, dict]:
+    # 'composition:degree=2' -> ('composition', {'degree': 2})
+    name, _, params = spec.partition(':')
+    kwargs = {}
+    for param in filter(None, params.split(',')):
+        key, _, value = param.partition('=')
+        kwargs[key] = int(value)
+    return name, kwargs
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Scaling benchmark of cky_parse and fast_ccg")
+    parser.add_argument('--families', nargs='+',
+                        default=['composition:degree=1', 'arity:arity=3', 'exponential', 'crossover'],
+                        help="families with their parameters, e.g. composition:degree=2")
+    parser.add_argument('--lengths', nargs='+', type=int, default=list(range(4, 17, 2)))
+    parser.add_argument('--parsers', nargs='+', default=list(PARSERS), choices=list(PARSERS))
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--repetitions', type=int, default=5)
+    parser.add_argument('--max-seconds', type=float, default=2.0)
+    parser.add_argument('--output', help="write the results to this json file")
+    parser.add_argument('--baseline', help="json file of an earlier run to check for regressions")
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--check', action='store_true',
+                        help="only check that the parsers find the parses of cky_parse, see check_parsers")
+    args = parser.parse_args(argv)
+
+    families = [_family_arguments(spec) for spec in args.families]
+    if args.check:
+        differences = check_parsers(families, args.lengths, args.parsers)
+        for family, kwargs in families:
+            differences.extend(check_budget(family, kwargs, max(args.lengths), max_edges=300))
+        for difference in differences:
+            print("DIFFERENCE", difference)
+        return 1 if differences else 0
+    results = run_benchmark(families, args.lengths, args.parsers, args.warmup, args.repetitions, args.max_seconds)
+    for run in results['runs']:
+        fit = run['fit']
+        lengths = [point['length'] for point in run['points']]
+        summary = "too few points" if fit['polynomial_degree'] is None else \
+            f"n^{fit['polynomial_degree']:.2f} (r2 {fit['polynomial_r2']:.3f}), " \
+            f"{fit['exponential_base']:.2f}^n (r2 {fit['exponential_r2']:.3f})"
+        print(f"{run['family']}{run['params']} {run['parser']}: n={lengths[:1] + lengths[-1:]} {summary}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(json.load(f), results, args.tolerance)
+        for regression in regressions:
+            print("REGRESSION", regression)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
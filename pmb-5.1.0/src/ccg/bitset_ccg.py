@@ -0,0 +1,224 @@
+from collections import OrderedDict
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from categories import CATEGORIES
+from rule_table import RuleTable, CKY_RULES
+
+
+def _bits(cell: int) -> Iterator[int]:
+    while cell:
+        lowest = cell & -cell
+        cell ^= lowest
+        yield lowest.bit_length() - 1
+
+
+class BitsetGrammar:
+    """
+    Numbers the categories of a grammar 0, 1, ... so that a chart cell is an int with one bit per category,
+    and keeps the rules of a RuleTable as a table from pairs of numbers to the bitset of their results.
+    A cell is then filled by or-ing together bitsets instead of building items.
+    Categories are numbered as they are derived, so a grammar works for any lexicon and can be shared
+    by all sentences over it. If the categories of the lexicon are closed, i.e. they only derive finitely many
+    categories, close() fills the whole table in advance.
+    With unary rules every bitset of lexical categories and of rule results also holds what they rewrite into.
+    """
+
+    def __init__(self, categories: Iterable[str] = (), rules: RuleTable = CKY_RULES,
+                 unary: Optional['UnaryRules'] = None, max_combined: Optional[int] = 1 << 16):
+        """
+        :param categories: the lexical categories, e.g. lexicon.values()
+        :param rules: the combinators, the ones of cky_parse by default
+        :param unary: the unary rules, see unary_rules.UnaryRules
+        :param max_combined: the number of pairs of cells combine keeps the result of, the least recently
+                             used one is evicted first. None keeps everything.
+        """
+        self.rules = rules
+        self.unary = unary
+        self.max_combined = max_combined
+        self.ids: List[int] = []
+        self.bits: Dict[int, int] = {}
+        self.closed = False
+        # (left number, right number) -> bitset of the results
+        self._pairs: Dict[Tuple[int, int], int] = {}
+        # (left cell, right cell) -> bitset of the results, in the order they were last used
+        self._combined: OrderedDict[Tuple[int, int], int] = OrderedDict()
+        # number -> bitset of the categories the unary rules rewrite it into
+        self._rewrites: Dict[int, int] = {}
+        for category in categories:
+            self.number(CATEGORIES.intern(category))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def number(self, cat_id: int) -> int:
+        """
+        :return: the number (bit) of a category, a new one if it has none yet
+        """
+        bit = self.bits.get(cat_id)
+        if bit is None:
+            bit = self.bits[cat_id] = len(self.ids)
+            self.ids.append(cat_id)
+        return bit
+
+    def rewrite(self, cell: int) -> int:
+        """
+        :return: the bitset with the categories the unary rules rewrite its categories into added
+        """
+        if not self.unary:
+            return cell
+        out = cell
+        for bit in _bits(cell):
+            rewrites = self._rewrites.get(bit)
+            if rewrites is None:
+                rewrites = 0
+                for category in self.unary.closure(self.ids[bit]):
+                    rewrites |= 1 << self.number(category)
+                self._rewrites[bit] = rewrites
+            out |= rewrites
+        return out
+
+    def _pair(self, left: int, right: int) -> int:
+        out = self._pairs.get((left, right))
+        if out is None:
+            out = 0
+            for _, category in self.rules.combine(self.ids[left], self.ids[right]):
+                out |= 1 << self.number(category)
+            out = self._pairs[left, right] = self.rewrite(out)
+        return out
+
+    def close(self, max_categories: int = 256, max_arity: Optional[int] = None) -> 'BitsetGrammar':
+        """
+        Derives every category the current ones can be combined into and fills in the rule table.
+        Raises a ValueError if the grammar derives more than max_categories categories, or a category
+        of more than max_arity arguments (twice the largest arity so far by default), as grammars that
+        compose categories of unbounded length (like benchmark.exponential_family) never close.
+        :return: the grammar itself
+        """
+        if max_arity is None:
+            max_arity = 2 * max((CATEGORIES[cat_id].arity for cat_id in self.ids), default=0)
+        checked = new = 0
+        while new < len(self.ids):
+            self.rewrite(1 << new)
+            # every pair with the new category on either side, including itself
+            for other in range(new + 1):
+                self._pair(new, other)
+                self._pair(other, new)
+            if len(self.ids) > max_categories:
+                raise ValueError(f"the grammar derives more than {max_categories} categories")
+            for cat_id in self.ids[checked:]:
+                if CATEGORIES[cat_id].arity > max_arity:
+                    raise ValueError(f"the grammar derives {CATEGORIES[cat_id].string}, "
+                                     f"of more than {max_arity} arguments")
+            checked = len(self.ids)
+            new += 1
+        self.closed = True
+        return self
+
+    def useful(self, goal: str = "S") -> int:
+        """
+        The categories that take part in some derivation of goal: goal itself, both sides of every pair
+        that combines into a useful category, and the categories a unary rule rewrites into a useful one.
+        Only complete once the grammar is closed.
+        :return: the bitset of the useful categories
+        """
+        useful = self.goals(CATEGORIES.intern(goal))
+        if not useful:
+            return 0
+        changed = True
+        while changed:
+            changed = False
+            for (left, right), out in self._pairs.items():
+                if out & useful and not (useful >> left & 1 and useful >> right & 1):
+                    useful |= 1 << left | 1 << right
+                    changed = True
+            for bit, rewrites in self._rewrites.items():
+                if rewrites & useful and not useful >> bit & 1:
+                    useful |= 1 << bit
+                    changed = True
+        return useful
+
+    def goals(self, goal: int) -> int:
+        """
+        :return: the bitset of the categories numbered so far that are the goal, up to features
+        """
+        return sum(1 << bit for bit, cat_id in enumerate(self.ids) if CATEGORIES.matches(cat_id, goal))
+
+    def bitset(self, categories: Iterable[str]) -> int:
+        """
+        :return: the bitset of the given categories
+        """
+        cell = 0
+        for category in categories:
+            cell |= 1 << self.number(CATEGORIES.intern(category))
+        return self.rewrite(cell)
+
+    def categories(self, cell: int) -> List[str]:
+        """
+        :return: the categories in a bitset
+        """
+        return [CATEGORIES[self.ids[bit]].string for bit in _bits(cell)]
+
+    def combine(self, left: int, right: int) -> int:
+        """
+        :return: the bitset of every category a category of left and one of right combine into
+
+        >>> grammar = BitsetGrammar(["NP/N", "N", "S\\\\NP"], max_combined=1)
+        >>> noun_phrase = grammar.combine(grammar.bitset(["NP/N"]), grammar.bitset(["N"]))
+        >>> sentence = grammar.combine(noun_phrase, grammar.bitset(["S\\\\NP"]))
+        >>> grammar.categories(noun_phrase), grammar.categories(sentence), len(grammar._combined)
+        (['NP'], ['S'], 1)
+        """
+        key = (left, right)
+        out = self._combined.get(key)
+        if out is not None:
+            self._combined.move_to_end(key)
+            return out
+        out = 0
+        right_bits = list(_bits(right))
+        for a in _bits(left):
+            for b in right_bits:
+                out |= self._pair(a, b)
+        self._combined[key] = out
+        # the cells of a corpus are any sets of categories, unlike the pairs of categories they are not bounded
+        if self.max_combined is not None and len(self._combined) > self.max_combined:
+            self._combined.popitem(last=False)
+        return out
+
+
+def bitset_parse(lexicon: Optional[Dict[str, str]], input_tokens: Optional[List[str]],
+                 grammar: Optional[BitsetGrammar] = None,
+                 lattice: Optional[List[List[Tuple[str, float]]]] = None) -> Tuple[bool, List[List[int]]]:
+    """
+    Recognises a sentence with the rules of cky_parse on a chart of bitsets (see BitsetGrammar).
+    Accepts exactly the sentences cky_parse finds a parse for, and chart[i][j] holds the same categories,
+    but derivations are neither built nor counted.
+    :param lexicon: a dictionary mapping tokens (str) to a category (str)
+    :param input_tokens: the input words (tokens) to be parsed
+    :param grammar: the rule table, a new one if not given. Pass one to reuse it across sentences,
+                    or one with unary rules (see BitsetGrammar) to recognise with them
+    :param lattice: the categories of every token (see lattice.py), used instead of lexicon and input_tokens,
+                    the probabilities are ignored
+    :return: whether there is an [S;0,n] item, and the chart with a bitset per cell
+    """
+    if lattice is None:
+        lattice = [[(lexicon[word], 1.0)] if word in lexicon else [] for word in input_tokens]
+    if grammar is None:
+        grammar = BitsetGrammar()
+    n = len(lattice)
+    chart = [[0] * n for _ in range(n)]
+    for j, tags in enumerate(lattice):
+        chart[j][j] = grammar.bitset(category for category, _ in tags)
+
+    combine = grammar.combine
+    for length in range(2, n + 1):
+        for i in range(n - length + 1):
+            j = i + length - 1
+            row = chart[i]
+            cell = 0
+            for k in range(i, j):
+                left, right = row[k], chart[k + 1][j]
+                if left and right:
+                    cell |= combine(left, right)
+            row[j] = cell
+
+    accepted = n > 0 and bool(chart[0][n - 1] & grammar.goals(CATEGORIES.intern("S")))
+    return accepted, chart
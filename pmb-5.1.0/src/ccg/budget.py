@@ -0,0 +1,135 @@
+import sys
+import tracemalloc
+from typing import Callable, Optional
+from ccg import Item
+from chart import EDGE_WIDTH, ArrayChart, NO_CONTEXT
+from fast_ccg import KuhlmannItem
+
+# the pointer to an item in the list of its cell
+_POINTER = 8
+# estimated bytes of the list of an empty cell, and of a cell of an ArrayChart
+_LIST_CELL = sys.getsizeof([])
+_ARRAY_CELL = _POINTER
+# estimated bytes of one stored item, by backend
+_ITEM = sys.getsizeof(Item(0, 0, 0)) + _POINTER
+_CONTEXT = sys.getsizeof(KuhlmannItem(0, 0, 0, 0, 0, 0, 0)) + _POINTER
+_ARRAY_EDGE = EDGE_WIDTH * 4
+# a ParseForest keeps a key tuple and a list of backpointers per item, and a tuple per backpointer
+_KEY = sys.getsizeof((0, NO_CONTEXT, 0, 0, 0, 0, NO_CONTEXT)) + sys.getsizeof([]) + 2 * _POINTER
+_BACKPOINTER = sys.getsizeof(('', None, None)) + _POINTER
+# how many items are added between two looks at tracemalloc, it is too slow to ask for every item
+_TRACE_EVERY = 256
+
+
+class BudgetExceeded(Exception):
+    """
+    Raised by the add function of a ParseBudget when a parse goes over its budget, the parser stops where it is.
+    """
+
+    def __init__(self, reason: str, limit: int, edges: int, nbytes: int, length: int):
+        super().__init__(f"{reason} budget of {limit} exceeded at span length {length}")
+        self.reason = reason
+        self.limit = limit
+        self.edges = edges
+        self.nbytes = nbytes
+        self.length = length
+
+    def __reduce__(self):
+        # a worker of a wavefront sends it back pickled, which calls __init__ with self.args otherwise
+        return type(self), (self.reason, self.limit, self.edges, self.nbytes, self.length)
+
+    def as_dict(self) -> dict:
+        return {'reason': self.reason, 'limit': self.limit, 'edges': self.edges, 'bytes': self.nbytes,
+                'length': self.length}
+
+
+class ParseBudget:
+    """
+    Bounds the edges and the memory of one parse, checked every time an item is stored in the chart,
+    so a sentence that would fill the memory of a worker is stopped early with a BudgetExceeded.
+    The memory is an estimate of the bytes the chart (and forest) holds, from the size of an item of
+    the chart backend, or with trace_memory what tracemalloc sees allocated since the parse began
+    (looked at every few hundred items), which counts everything but slows the parse down.
+    Items are never freed during a parse (beam pruning is not subtracted), so the estimate is also the peak.
+    Pass one as budget= to cky_parse or fast_ccg; after the parse, peak_bytes and edges tell what it took,
+    also when it was stopped. A budget can be passed to many parses, every parse starts from 0.
+    """
+
+    def __init__(self, max_edges: Optional[int] = None, max_bytes: Optional[int] = None,
+                 trace_memory: bool = False):
+        """
+        :param max_edges: the number of items a parse may store, None for no limit
+        :param max_bytes: the bytes a parse may take, None for no limit
+        :param trace_memory: measure the bytes with tracemalloc instead of estimating them
+        """
+        self.max_edges = max_edges
+        self.max_bytes = max_bytes
+        self.trace_memory = trace_memory
+        self.edges = 0
+        self.nbytes = 0
+        self.peak_bytes = 0
+        self._item_bytes = self._context_bytes = _ITEM
+        self._new_bytes = self._backpointer_bytes = 0
+        self._traced_from = None
+        self._started_tracing = False
+
+    def begin(self, chart, packed: bool = False):
+        """
+        Called by a parser before it fills the chart.
+        :param chart: the empty chart of the parse
+        :param packed: whether the items go into a ParseForest
+        """
+        n = len(chart)
+        compact = isinstance(chart, ArrayChart)
+        self.edges = 0
+        self.nbytes = self.peak_bytes = n * n * (_ARRAY_CELL if compact else _LIST_CELL)
+        self._item_bytes = _ARRAY_EDGE if compact else _ITEM
+        self._context_bytes = _ARRAY_EDGE if compact else _CONTEXT
+        self._new_bytes = _KEY if packed else 0
+        self._backpointer_bytes = _BACKPOINTER if packed else 0
+        if self.trace_memory:
+            self._started_tracing = not tracemalloc.is_tracing()
+            if self._started_tracing:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            self._traced_from = tracemalloc.get_traced_memory()[0]
+
+    def end(self):
+        """
+        Called by a parser when it is done or stopped, takes the peak measured by tracemalloc.
+        """
+        if self._traced_from is not None:
+            self.peak_bytes = max(self.peak_bytes, tracemalloc.get_traced_memory()[1] - self._traced_from)
+            self._traced_from = None
+            if self._started_tracing:
+                tracemalloc.stop()
+                self._started_tracing = False
+
+    def _check(self, item):
+        if self.max_edges is not None and self.edges > self.max_edges:
+            raise BudgetExceeded('edges', self.max_edges, self.edges, self.peak_bytes, item.j - item.i)
+        if self.max_bytes is not None and self.nbytes > self.max_bytes:
+            raise BudgetExceeded('memory', self.max_bytes, self.edges, self.peak_bytes, item.j - item.i)
+
+    def wrap_add(self, add: Callable) -> Callable:
+        """
+        Wraps the function a parser stores items with (chart.append_item or ParseForest.add)
+        to count what is stored and raise BudgetExceeded once it is over the budget.
+        """
+        def budgeted(cell, item, rule, left=None, right=None):
+            is_new = add(cell, item, rule, left, right)
+            if is_new:
+                self.edges += 1
+                self.nbytes += self._new_bytes + (self._context_bytes if hasattr(item, 'i_prime') else
+                                                  self._item_bytes)
+            self.nbytes += self._backpointer_bytes
+            if self._traced_from is not None and is_new and self.edges % _TRACE_EVERY == 0:
+                # measured now and then, estimated in between
+                self.nbytes = tracemalloc.get_traced_memory()[0] - self._traced_from
+            self.peak_bytes = max(self.peak_bytes, self.nbytes)
+            self._check(item)
+            return is_new
+        return budgeted
+
+    def as_dict(self) -> dict:
+        return {'edges': self.edges, 'peak_bytes': self.peak_bytes}
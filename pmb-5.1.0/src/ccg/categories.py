@@ -0,0 +1,277 @@
+import re
+from typing import Dict, List, Optional, Tuple
+
+SLASHES = ('/', '\\')
+
+# A category is split into atoms and slashes, e.g. S\NP/NP -> ['S', '\\', 'NP', '/', 'NP'].
+# Derivation contexts and their β strings start with a slash, e.g. /NP or \C/D.
+_CATEGORY_TOKEN = re.compile(r'[/\\]|[^/\\]+')
+# An atom may carry a feature, e.g. S:DCL, and a bracketed argument such as (S:DCL\NP) is a single token.
+_ATOM = re.compile(r'[^()/\\]+')
+_FEATURE = re.compile(r':[^()/\\]*')
+
+# Features are numbered as they are seen, an atom stores the bit of its feature. An atom without a feature
+# matches any feature, so it gets every bit: two atoms unify iff the AND of their masks is not 0.
+ANY_FEATURE = -1
+_FEATURE_BITS: Dict[str, int] = {}
+
+
+def feature_mask(atom: str) -> int:
+    """
+    :return: the bitmask of the feature of an atom, ANY_FEATURE if it has none
+    """
+    _, colon, feature = atom.partition(':')
+    if not colon:
+        return ANY_FEATURE
+    bit = _FEATURE_BITS.get(feature)
+    if bit is None:
+        bit = _FEATURE_BITS[feature] = 1 << len(_FEATURE_BITS)
+    return bit
+
+
+def head_atom(token: str) -> str:
+    """
+    :return: the leftmost atom of a token without its feature, e.g. S for S:DCL or (S:DCL\\NP)
+    """
+    match = _ATOM.search(token)
+    return match.group().partition(':')[0] if match else ''
+
+
+def _is_group(token: str) -> bool:
+    # whether the token is one bracketed group, e.g. (S\NP) but not (S)/(NP)
+    if len(token) < 2 or token[0] != '(' or token[-1] != ')':
+        return False
+    depth = 0
+    for p, character in enumerate(token):
+        if character == '(':
+            depth += 1
+        elif character == ')':
+            depth -= 1
+            if depth == 0:
+                return p == len(token) - 1
+    return False
+
+
+def split_category(category: str) -> Tuple[str, ...]:
+    """
+    Splits a category into atoms and slashes, keeping brackets. Slashes are left associative, so the brackets
+    around the functor on the left are dropped ((S\\NP)/NP is S\\NP/NP), while a bracketed argument stays a
+    single token ((S\\NP) in S/(S\\NP)) that can only be matched as a whole.
+    """
+    if '(' not in category:
+        return tuple(_CATEGORY_TOKEN.findall(category))
+    tokens = []
+    depth, start = 0, 0
+    for p, character in enumerate(category):
+        if character == '(':
+            depth += 1
+        elif character == ')':
+            depth -= 1
+        elif depth == 0 and character in SLASHES:
+            if p > start:
+                tokens.append(category[start:p])
+            tokens.append(character)
+            start = p + 1
+    if start < len(category):
+        tokens.append(category[start:])
+    for p, token in enumerate(tokens):
+        if _is_group(token):
+            inner = split_category(token[1:-1])
+            tokens[p] = inner[0] if len(inner) == 1 else '(' + ''.join(inner) + ')'
+    if tokens and _is_group(tokens[0]):
+        tokens[:1] = split_category(tokens[0][1:-1])
+    return tuple(tokens)
+
+# An argument of a category: (prefix id, suffix id, directed suffix id).
+# For A/B\C the forward argument is (A, B\C, /B\C): the prefix is the type returned
+# once the suffix has been consumed, and the directed suffix keeps the slash.
+Argument = Tuple[int, int, int]
+
+
+class Category:
+    """
+    A category string parsed once into its slash/argument structure.
+    Every distinct string is compiled exactly once by a CategoryTable, so the rules can
+    work on integer ids and dictionary lookups instead of re-running a regex per item pair.
+    """
+    __slots__ = ('id', 'string', 'tokens', 'result', 'head', 'arity', 'well_formed',
+                 'forward_args', 'backward_args', 'prefixes', 'plain', 'features', 'plain_prefixes')
+
+    def __init__(self, category_id: int, string: str, tokens: Tuple[str, ...]):
+        self.id = category_id
+        self.string = string
+        self.tokens = tokens
+        # the result atom, or '' for derivation contexts such as /Y
+        self.result = tokens[0] if tokens and tokens[0] not in SLASHES else ''
+        # the result atom without its feature
+        self.head = head_atom(self.result)
+        self.arity = sum(1 for token in tokens if token in SLASHES)
+        # categories that may be put in a chart cell: non-empty, no leading or trailing slash
+        self.well_formed = bool(tokens) and tokens[0] not in SLASHES and tokens[-1] not in SLASHES
+        self.forward_args: Tuple[Argument, ...] = ()
+        self.backward_args: Tuple[Argument, ...] = ()
+        # maps the id of every prefix ending at an atom boundary to the id of the remainder (β),
+        # so "does this category start with Y" is a single dict lookup
+        self.prefixes: Dict[int, int] = {}
+        # the id of the category without features, its own id if it has none
+        self.plain = category_id
+        # the feature mask of every atom, also the ones inside bracketed arguments, in order
+        self.features: Tuple[int, ...] = ()
+        # for categories with features: maps the plain id of every prefix to the (prefix id, β id) pairs,
+        # None if the category has no features (the prefixes are then their own plain ids)
+        self.plain_prefixes: Optional[Dict[int, List[Tuple[int, int]]]] = None
+
+    def __repr__(self):
+        return f"Category({self.id}, {self.string})"
+
+
+class CategoryTable:
+    """
+    Interns category strings into Category objects with integer ids.
+
+    >>> table = CategoryTable()
+    >>> left, right = table.intern("S/NP/VP"), table.intern("VP")
+    >>> table.string(table.apply(table[left].forward_args, right)[0])
+    'S/NP'
+    """
+
+    def __init__(self):
+        self.categories: List[Category] = []
+        self._ids: Dict[str, int] = {}
+        self._concat: Dict[Tuple[int, int], int] = {}
+        # whether any category has a feature, matching then also looks at the plain categories
+        self.featured = False
+        self.empty = self.intern('')
+
+    def __getitem__(self, category_id: int) -> Category:
+        return self.categories[category_id]
+
+    def __len__(self) -> int:
+        return len(self.categories)
+
+    def string(self, category_id: int) -> str:
+        return self.categories[category_id].string
+
+    def intern(self, category: str) -> int:
+        """
+        Returns the id of a category string, compiling it on first sight.
+        :param category: a category such as S\\NP/NP, or a context such as /NP
+        :return: the interned id
+        """
+        category_id = self._ids.get(category)
+        if category_id is None:
+            tokens = split_category(category)
+            category_id = self._ids.get(''.join(tokens))
+            if category_id is None:
+                category_id = self._compile(tokens)
+            # (S\NP)/NP is the same category as S\NP/NP
+            self._ids[category] = category_id
+        return category_id
+
+    def intern_tokens(self, tokens: Tuple[str, ...]) -> int:
+        return self.intern(''.join(tokens))
+
+    def concat(self, prefix_id: int, suffix_id: int) -> int:
+        """
+        Returns the id of the category obtained by appending one category string to another,
+        e.g. X and β giving Xβ.
+        """
+        key = (prefix_id, suffix_id)
+        category_id = self._concat.get(key)
+        if category_id is None:
+            if suffix_id == self.empty:
+                category_id = prefix_id
+            elif prefix_id == self.empty:
+                category_id = suffix_id
+            else:
+                category_id = self.intern_tokens(self.categories[prefix_id].tokens + self.categories[suffix_id].tokens)
+            self._concat[key] = category_id
+        return category_id
+
+    def apply(self, args: Tuple[Argument, ...], right_id: int, directed: bool = False) -> Optional[Tuple[int, int, int, int]]:
+        """
+        Finds the first argument in args that the category right_id starts with.
+        :param args: forward_args and/or backward_args of a functor category
+        :param right_id: the category that has to start with the argument
+        :param directed: match the argument including its slash (e.g. /Y instead of Y)
+        :return: (prefix id, suffix id, directed suffix id, β id) or None if nothing matches
+        """
+        right = self.categories[right_id]
+        prefixes = right.prefixes
+        for prefix_id, suffix_id, directed_id in args:
+            argument = directed_id if directed else suffix_id
+            β = prefixes.get(argument)
+            if β is not None:
+                return prefix_id, suffix_id, directed_id, β
+            if self.featured:
+                # the same category up to features, e.g. S:DCL for an argument S
+                plain = self.categories[argument].plain
+                if right.plain_prefixes is None:
+                    β = prefixes.get(plain)
+                    if β is not None and self.unifies(argument, plain):
+                        return prefix_id, suffix_id, directed_id, β
+                else:
+                    for candidate, β in right.plain_prefixes.get(plain, ()):
+                        if self.unifies(argument, candidate):
+                            return prefix_id, suffix_id, directed_id, β
+        return None
+
+    def unifies(self, left_id: int, right_id: int) -> bool:
+        """
+        Whether two categories with the same plain category have compatible features,
+        i.e. for every atom the AND of the feature masks is not 0.
+        """
+        return all(left & right for left, right in zip(self.categories[left_id].features,
+                                                       self.categories[right_id].features))
+
+    def matches(self, category_id: int, goal_id: int) -> bool:
+        """
+        :return: whether a category is the goal category, up to features if the goal has none (S:DCL is an S)
+        """
+        return category_id == goal_id or self.categories[category_id].plain == goal_id
+
+    def _compile(self, tokens: Tuple[str, ...]) -> int:
+        string = ''.join(tokens)
+        category = Category(len(self.categories), string, tokens)
+        # register before compiling the parts, a category is always a prefix of itself
+        self.categories.append(category)
+        self._ids[string] = category.id
+
+        forward_args, backward_args = [], []
+        for p, token in enumerate(tokens):
+            if token in SLASHES and p + 1 < len(tokens) and tokens[p + 1] not in SLASHES:
+                arg = (self.intern_tokens(tokens[:p]), self.intern_tokens(tokens[p + 1:]),
+                       self.intern_tokens(tokens[p:]))
+                (forward_args if token == '/' else backward_args).append(arg)
+        category.forward_args = tuple(forward_args)
+        category.backward_args = tuple(backward_args)
+
+        prefixes = {}
+        for p in range(1, len(tokens) + 1):
+            if tokens[p - 1] not in SLASHES and (p == len(tokens) or tokens[p] in SLASHES):
+                prefixes[self.intern_tokens(tokens[:p])] = self.intern_tokens(tokens[p:])
+        category.prefixes = prefixes
+
+        if ':' in string:
+            self.featured = True
+            category.features = tuple(feature_mask(atom) for atom in _ATOM.findall(string))
+            category.plain = self.intern(_FEATURE.sub('', string))
+            plain_prefixes = {}
+            for prefix_id, β in prefixes.items():
+                plain_prefixes.setdefault(self.categories[prefix_id].plain, []).append((prefix_id, β))
+            category.plain_prefixes = plain_prefixes
+        else:
+            category.features = (ANY_FEATURE,) * len(_ATOM.findall(string))
+        return category.id
+
+
+# The table shared by the parsers, ids are only meaningful within a single process.
+CATEGORIES = CategoryTable()
+
+
+def intern_category(category: str) -> int:
+    return CATEGORIES.intern(category)
+
+
+def category_string(category_id: int) -> str:
+    return CATEGORIES.categories[category_id].string
@@ -1,5 +1,8 @@
-import re
-from typing import Self, Optional, Union, List, Dict
+from functools import partial
+from typing import Self, Optional, Union, List, Dict, Tuple
+from categories import CATEGORIES
+from rule_cache import RuleCache, apply_rule
+from rule_table import RuleTable, CKY_RULES
 
 
 class Item:
@@ -8,13 +11,19 @@ class Item:
     and i,j are fencepost positions in w.  The goal of the algorithm is the construction
     of the item [S;0,n], which asserts the existence of a derivation tree for the entire input string.
     """
+    __slots__ = ('cat_id', 'i', 'j')
 
-    def __init__(self, category: str, i: int, j: int):
+    def __init__(self, category: Union[str, int], i: int, j: int):
         # TODO: Some way to check the arity of the category is bounded by some arity constraint
-        self.category = category
+        # the category is stored as its interned id, see categories.py
+        self.cat_id = category if isinstance(category, int) else CATEGORIES.intern(category)
         self.i = i
         self.j = j
 
+    @property
+    def category(self) -> str:
+        return CATEGORIES.categories[self.cat_id].string
+
     def __repr__(self):
         return f"Item({self.category}, {self.i}, {self.j})"
 
@@ -23,11 +32,54 @@ def is_axiom(item: Item) -> bool:
     return item.i == item.j + 1
 
 
-def cky_forward(left: Item, right: Item) -> Union[None, Item]:
+def forward_categories(left: int, right: int) -> Optional[int]:
+    """
+    The category part of the forward rule: X/Y and Yβ give Xβ.
+    :param left: category id of X/Y
+    :param right: category id of Yβ
+    :return: category id of Xβ or None if not applicable.
+    """
+    # We need to get all possible parts, for example: A/B\C/D\F/G then
+    # B\C/D\F/G, D\F/G, G are all possible arguments we can expect with different return types.
+    # These are precomputed once per category in forward_args.
+    match = CATEGORIES.apply(CATEGORIES[left].forward_args, right)
+    if match is None:
+        return None
+    func_type, _, _, β = match
+    return CATEGORIES.concat(func_type, β)
+
+
+def backward_categories(left: int, right: int) -> Optional[int]:
+    """
+    The category part of the backward rule: X\\Y and Yβ give Xβ.
+    """
+    # We need to get all possible parts, for example: A\B/C\D\F then
+    # B/C\\D\\F, C\D\\F, F are all possible arguments we can expect with different return types.
+    match = CATEGORIES.apply(CATEGORIES[left].backward_args, right)
+    if match is None:
+        return None
+    func_type, _, _, β = match
+    return CATEGORIES.concat(func_type, β)
+
+
+def backward_crossing_categories(left: int, right: int) -> Optional[int]:
+    """
+    The category part of the backward crossing rule: Yβ and X\\Y give Xβ.
+    """
+    # Check if the left category matches one of the backward-slash arguments of the right category
+    match = CATEGORIES.apply(CATEGORIES[right].backward_args, left)
+    if match is None:
+        return None
+    func_type, _, _, β = match
+    return CATEGORIES.concat(func_type, β)
+
+
+def cky_forward(left: Item, right: Item, rule_cache: Optional[RuleCache] = None) -> Union[None, Item]:
     """
     Applies the CKY style forward rule if possible
     :param left: left item in the form [X/Y, i, j]
     :param right: right item in the form [Yβ, j, k]
+    :param rule_cache: optional memo for the category part of the rule, see rule_cache.py
     :return: new item in the form [Xβ, i, j]
 
     >>> left_item = Item("S/NP/VP", 0, 1)
@@ -35,115 +87,169 @@ def cky_forward(left: Item, right: Item) -> Union[None, Item]:
     >>> cky_forward(left_item, right_item)
     Item(S/NP, 0, 2)
     """
-    category = left.category
-    # We need to get all possible parts, for example: A/B\C/D\F/G then
-    # B\C/D\F/G, D\F/G, G are all possible arguments we can expect with different return types.
-    # TODO: no brackets assumed! Loop over cat using a stack, whatever inside a bracket replace with a special char
-    parts = {category[:x.span()[0]]: category[x.span()[0] + 1:] for x in re.finditer(r'/([^/\\]+)', category)}
-    for func_type, expected_arg in parts.items():
-        right_category = right.category
-        if right_category.startswith(expected_arg):
-            β = right_category[len(expected_arg):]
-            new_category = f"{func_type}{β}" if β else func_type
-            new_item = Item(new_category, left.i, right.j)
-            return new_item
-
-    return None
+    category = apply_rule(rule_cache, forward_categories, left.cat_id, right.cat_id)
+    return None if category is None else Item(category, left.i, right.j)
 
 
-def cky_backward(left: Item, right: Item) -> Union[None, Item]:
+def cky_backward(left: Item, right: Item, rule_cache: Optional[RuleCache] = None) -> Union[None, Item]:
     """
     Applies the CKY style backward rule if possible.
     :param left: left item in the form [X\\Y, i, j]
     :param right: right item in the form [Yβ, j, k]
+    :param rule_cache: optional memo for the category part of the rule, see rule_cache.py
     :return: new item in the form [Xβ, i, j] or None if not applicable.
     >>> left_item = Item("A\\B/C\\D", 0, 1)
     >>> right_item = Item("B/C\\D", 1, 2)
     >>> cky_backward(left_item, right_item)
     Item(A, 0, 2)
     """
-    category = left.category
-    # We need to get all possible parts, for example: A\B/C\D\F then
-    # B/C\\D\\F, C\D\\F, F are all possible arguments we can expect with different return types.
-
-    parts = {category[:x.span()[0]]: category[x.span()[0] + 1:] for x in re.finditer(r'\\([^/\\]+)', category)}
-    for func_type, expected_arg in parts.items():
-        right_category = right.category
-        # Check if the right category matches the expected argument
-        if right_category.startswith(expected_arg):
-            β = right_category[len(expected_arg):]
-            new_category = f"{func_type}{β}" if β else func_type
-            new_item = Item(new_category, left.i, right.j)
-            return new_item
+    category = apply_rule(rule_cache, backward_categories, left.cat_id, right.cat_id)
+    return None if category is None else Item(category, left.i, right.j)
 
-    return None
 
-
-def cky_backward_crossing(left: Item, right: Item) -> Union[None, Item]:
+def cky_backward_crossing(left: Item, right: Item, rule_cache: Optional[RuleCache] = None) -> Union[None, Item]:
     """
     Applies the CKY style backward crossing rule if possible.
     :param left: left item in the form [Yβ, i, j]
     :param right: right item in the form [X/Y, j, k]
+    :param rule_cache: optional memo for the category part of the rule, see rule_cache.py
     :return: new item in the form [Xβ, i, k] or None if not applicable.
     """
-    category = right.category
-    # Extract backward-slash components
-    parts = {category[:x.span()[0]]: category[x.span()[0] + 1:] for x in re.finditer(r'\\([^/\\]+)', category)}
-    for func_type, expected_arg in parts.items():
-        right_category = left.category
-        # Check if the left category matches the expected argument
-        if right_category.startswith(expected_arg):
-            β = right_category[len(expected_arg):]
-            new_category = f"{func_type}" if β == "" else f"{func_type}{β}"
-            new_item = Item(new_category, left.i, right.j)
-            return new_item
-    return None
+    category = apply_rule(rule_cache, backward_crossing_categories, left.cat_id, right.cat_id)
+    return None if category is None else Item(category, left.i, right.j)
 
 
-def cky_parse(lexicon: Dict[str, str], input_tokens: List[str]) -> Optional[Item]:
+def cky_parse(lexicon: Dict[str, str], input_tokens: List[str], chart_backend: str = 'list',
+              rule_cache: Optional[RuleCache] = None,
+              indexed: bool = True,
+              forest: Optional['ParseForest'] = None,
+              stats: Optional['ParseStats'] = None,
+              trace: Optional['ChartTrace'] = None,
+              lattice: Optional['Lattice'] = None,
+              beam: Optional['SupertagBeam'] = None,
+              goal_filter: Optional['GoalFilter'] = None,
+              recognize: bool = False,
+              rules: RuleTable = CKY_RULES,
+              unary: Optional['UnaryRules'] = None,
+              budget: Optional['ParseBudget'] = None) -> Tuple[int, List[List[List[Item]]]]:
     """
     Parses a sentence from the given lexicon.
     This algorithm runs exponential in the input length! See section 3.2 of Kuhlmann, Satta 2014
     :param lexicon: a dictionary mapping tokens (str) to a category (str)
     :param input_tokens: the input words (tokens) to be parsed
-    :return: An Item representing the parse of the entire input, or None if no parse is possible.
-    """
-    n = len(input_tokens)
-    chart = [[[] for _ in range(n)] for _ in range(n)]
-
-    for j in range(n):
-        word = input_tokens[j]
-        if word in lexicon:
-            category = lexicon[word]
-            chart[j][j].append(Item(category, j, j + 1))
-
-    for length in range(2, n + 1):
-        for i in range(n - length + 1):
-            j = i + length - 1
-            for k in range(i, j):
-                for left_item in chart[i][k]:
-                    for right_item in chart[k + 1][j]:
-                        new_item = cky_forward(left_item, right_item)
-                        if (new_item and new_item.category[0] not in {'\\', '/'}
-                                and new_item.category[-1] not in {'\\', '/'}):
-                            chart[i][j].append(new_item)
-
-                        new_item = cky_backward(left_item, right_item)
-                        if (new_item and new_item.category[0] not in {'\\', '/'}
-                                and new_item.category[-1] not in {'\\', '/'}):
-                            chart[i][j].append(new_item)
-
-                        new_item = cky_backward_crossing(left_item, right_item)
-                        if (new_item and new_item.category[0] not in {'\\', '/'}
-                                and new_item.category[-1] not in {'\\', '/'}):
-                            chart[i][j].append(new_item)
+    :param chart_backend: how the chart is stored, see chart.make_chart
+    :param rule_cache: optional memo for rule applications, can be shared across sentences
+    :param indexed: only try pairs of items that share an argument (see chart.CellIndex)
+                    instead of every pair of the two cells
+    :param forest: if given, identical items are merged into this packed forest (see forest.ParseForest)
+                   and the number of parses is the number of derivations counted over the forest
+    :param stats: if given, the rules are counted and timed into it (see parse_stats.ParseStats)
+    :param trace: if given, the growth of the chart is recorded into it (see chart_trace.ChartTrace)
+    :param lattice: the categories of every token with their probability (see lattice.py),
+                    used instead of lexicon and input_tokens if given
+    :param beam: if given, the categories of the lattice and the items of every cell are pruned by it
+    :param goal_filter: if given, items that can not take part in a parse are discarded (see goal_filter.GoalFilter).
+                        It has to be built over rules, a ValueError is raised otherwise
+    :param recognize: only find out whether there is a parse: stop as soon as an [S;0,n] item is added,
+                      or if a word has no categories. The number of parses is then 1 or 0 and the chart is partial.
+                      Identical items are merged as with a forest, see bitset_ccg.bitset_parse for a faster recogniser
+    :param rules: the combinators to use (see rule_table.RuleTable), every pair of items is looked up once in it
+    :param unary: if given, every new item is rewritten by these unary rules (see unary_rules.UnaryRules)
+    :param budget: if given, the parse stops with a budget.BudgetExceeded once it stores more edges or bytes
+                   than the budget allows, its peak_bytes and edges tell what the parse took
+    :return: the number of [S;0,n] items (parses) and the chart, like fast_ccg
+    """
+    # imported here since chart.py imports Item from this module
+    from chart import make_chart, cell_pairs, append_item
+    from forest import ParseForest
+    from lattice import make_lattice
+    from goal_filter import GoalFilter, Recognised
+
+    if lattice is None:
+        lattice = make_lattice(lexicon, input_tokens)
+    n = len(lattice)
+    chart = make_chart(n, chart_backend)
+    goal = CATEGORIES.intern("S")
+    indexes = {} if indexed and not rules.all_pairs else None
+    if recognize and forest is None:
+        # derivations are not counted, identical items are merged so that they are not combined again
+        forest = ParseForest()
+    add = append_item if forest is None else forest.add
+    if budget is not None:
+        budget.begin(chart, forest is not None)
+        add = budget.wrap_add(add)
+    if goal_filter is not None:
+        goal_filter.check_rules(rules)
+        add = goal_filter.wrap_add(add, n)
+    if stats is not None:
+        stats.sentences += 1
+        add = stats.wrap_add(add)
+        combine = rules.counted(stats, rule_cache)
+    elif rule_cache is not None:
+        combine = partial(apply_rule, rule_cache, rules.results)
+    else:
+        combine = rules.combine
+    if beam is not None:
+        beam.begin()
+        add = beam.wrap_add(add)
+    if recognize:
+        add = GoalFilter.stop_at_goal(add, goal, n)
+    if unary:
+        add = unary.wrap_add(add)
+
+    if trace is not None:
+        trace.begin('cky_parse', n)
+        trace.begin_span(1)
+    recognised = False
+    try:
+        for j, tags in enumerate(lattice):
+            if beam is not None:
+                tags = beam.prune_tags(tags)
+            for category, probability in tags:
+                item = Item(category, j, j + 1)
+                if beam is not None:
+                    beam.axiom(item, probability)
+                add(chart[j][j], item, 'lexicon')
+        if trace is not None:
+            for j in range(n):
+                trace.cell(j, j, chart[j][j])
+            trace.end_span(1)
+
+        # a word without categories can not be covered, so there is nothing left to recognise
+        last = n if not recognize or all(len(chart[j][j]) for j in range(n)) else 1
+        for length in range(2, last + 1):
+            if trace is not None:
+                trace.begin_span(length)
+            for i in range(n - length + 1):
+                j = i + length - 1
+                cell = chart[i][j]
+                for k in range(i, j):
+                    for left_item, right_item in cell_pairs(chart, i, k, j, indexes):
+                        # the results are well formed categories already
+                        for rule, category in combine(left_item.cat_id, right_item.cat_id):
+                            add(cell, Item(category, i, right_item.j), rule, left_item, right_item)
+                if beam is not None:
+                    beam.prune_cell(cell)
+                if trace is not None:
+                    trace.cell(i, j, cell)
+            if trace is not None:
+                trace.end_span(length)
+    except Recognised:
+        recognised = True
+    finally:
+        if budget is not None:
+            budget.end()
 
     # Look for a complete parse item [S;0,n]
-    print(chart)
-    for item in chart[0][n - 1]:
-        if item.category == "S":
-            return item
-    return None
+    if recognize:
+        num_parses = int(recognised)
+    elif forest is not None:
+        num_parses = forest.count_items(item for item in chart[0][n - 1] if CATEGORIES.matches(item.cat_id, goal))
+    else:
+        num_parses = sum(1 for item in chart[0][n - 1] if CATEGORIES.matches(item.cat_id, goal))
+    if trace is not None:
+        trace.end(num_parses)
+    return num_parses, chart
 
 # lexicon = {
 #     "the": "NP/N",
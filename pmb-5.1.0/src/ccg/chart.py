@@ -0,0 +1,310 @@
+from array import array
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
+from categories import CATEGORIES
+from ccg import Item
+
+# Number of int columns stored per edge in an ArrayChart cell:
+# category id, β id (-1 for plain items), i, i', j', j, condition id (-1 for plain items)
+EDGE_WIDTH = 7
+NO_CONTEXT = -1
+
+
+# (category id, β id, i, i', j', j, condition id), the same columns an ArrayChart stores per edge.
+# i', j' is the hole of a derivation context, or of the context a recombined item is built from,
+# and i, j for any other item. The condition is the one of a derivation context, see fast_ccg.intern_condition.
+ItemKey = Tuple[int, int, int, int, int, int, int]
+
+
+def item_key(item: Item) -> ItemKey:
+    """
+    :return: a tuple identifying the item, two items with the same key are identical
+    """
+    if hasattr(item, 'beta_id'):
+        return item.cat_id, item.beta_id, item.i, item.i_prime, item.j_prime, item.j, item.condition
+    if hasattr(item, 'i_prime'):
+        return item.cat_id, NO_CONTEXT, item.i, item.i_prime, item.j_prime, item.j, NO_CONTEXT
+    return item.cat_id, NO_CONTEXT, item.i, item.i, item.j, item.j, NO_CONTEXT
+
+
+def append_item(cell, item: Item, rule: str, left: Optional[Item] = None, right: Optional[Item] = None) -> bool:
+    """
+    Adds an item to a cell without packing, has the same signature as ParseForest.add.
+    :return: always True, every item is kept
+    """
+    cell.append(item)
+    return True
+
+
+def replace_items(cell, items: List[Item]):
+    """
+    Replaces the items of a cell of any chart backend.
+    """
+    if isinstance(cell, list):
+        cell[:] = items
+    else:
+        cell.replace(items)
+
+
+def list_chart(n: int) -> List[List[List[Item]]]:
+    """
+    The default chart: an n x n table of python lists, chart[i][j] holds the items spanning w[i..j].
+    """
+    return [[[] for _ in range(n)] for _ in range(n)]
+
+
+class ArrayCell:
+    """
+    A view on a single cell of an ArrayChart. It behaves like the list used by list_chart:
+    items can be appended, iterated over and indexed. Items are stored as ints in one array
+    and only turned back into Item / KuhlmannItem / RecombinedItem objects while they are being read.
+    """
+    __slots__ = ('_chart', '_i', '_j')
+
+    def __init__(self, chart: 'ArrayChart', i: int, j: int):
+        self._chart = chart
+        self._i = i
+        self._j = j
+
+    def _edges(self) -> array:
+        return self._chart._cells[self._i][self._j]
+
+    def append(self, item: Item):
+        edges = self._edges()
+        if edges is None:
+            edges = self._chart._cells[self._i][self._j] = array('i')
+        edges.extend(item_key(item))
+
+    def __len__(self) -> int:
+        edges = self._edges()
+        return 0 if edges is None else len(edges) // EDGE_WIDTH
+
+    def __iter__(self) -> Iterator[Item]:
+        edges = self._edges()
+        if edges is None:
+            return
+        make = self._chart.make_item
+        columns = iter(edges)
+        for category, β, i, i_prime, j_prime, j, condition in zip(*[columns] * EDGE_WIDTH):
+            yield make(category, β, i, i_prime, j_prime, j, condition)
+
+    def __getitem__(self, index: int) -> Item:
+        length = len(self)
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError('cell index out of range')
+        return self._chart.make_item(*self._edges()[index * EDGE_WIDTH:(index + 1) * EDGE_WIDTH])
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def replace(self, items: List[Item]):
+        """
+        Replaces the items of the cell, e.g. by the ones left after pruning.
+        """
+        edges = array('i')
+        for item in items:
+            edges.extend(item_key(item))
+        self._chart._cells[self._i][self._j] = edges if items else None
+
+
+class _ArrayRow:
+    __slots__ = ('_chart', '_i')
+
+    def __init__(self, chart: 'ArrayChart', i: int):
+        self._chart = chart
+        self._i = i
+
+    def __getitem__(self, j: int) -> ArrayCell:
+        if j < 0:
+            j += self._chart.n
+        return ArrayCell(self._chart, self._i, j)
+
+    def __len__(self) -> int:
+        return self._chart.n
+
+    def __iter__(self) -> Iterator[ArrayCell]:
+        return (ArrayCell(self._chart, self._i, j) for j in range(self._chart.n))
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+class ArrayChart:
+    """
+    A struct-of-arrays chart. Every edge takes EDGE_WIDTH 32-bit ints (see ItemKey)
+    in the array of its cell instead of a python object, and empty cells take no array at all.
+    It is indexed like list_chart (chart[i][j]), so it can be passed to both parsers,
+    trading some time spent re-creating items on iteration for a much smaller peak memory.
+    """
+
+    def __init__(self, n: int):
+        # imported here since fast_ccg imports this module
+        from fast_ccg import KuhlmannItem, RecombinedItem
+        self.context_type = KuhlmannItem
+        self.recombined_type = RecombinedItem
+        self.n = n
+        self._cells: List[List[Union[None, array]]] = [[None] * n for _ in range(n)]
+
+    def make_item(self, category: int, β: int, i: int, i_prime: int, j_prime: int, j: int, condition: int) -> Item:
+        """
+        :return: the item of the stored columns of an edge, see item_key
+        """
+        if β != NO_CONTEXT:
+            return self.context_type(category, β, i, i_prime, j_prime, j, condition)
+        if i_prime != i or j_prime != j:
+            return self.recombined_type(category, i, i_prime, j_prime, j)
+        return Item(category, i, j)
+
+    def __getitem__(self, i: int) -> _ArrayRow:
+        if i < 0:
+            i += self.n
+        return _ArrayRow(self, i)
+
+    def __len__(self) -> int:
+        return self.n
+
+    def __iter__(self) -> Iterator[_ArrayRow]:
+        return (_ArrayRow(self, i) for i in range(self.n))
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def grow(self):
+        """
+        Adds an empty last column and row, for the next word of an incremental parse.
+        """
+        for row in self._cells:
+            row.append(None)
+        self.n += 1
+        self._cells.append([None] * self.n)
+
+    def num_edges(self) -> int:
+        return sum(len(edges) for row in self._cells for edges in row if edges is not None) // EDGE_WIDTH
+
+    def nbytes(self) -> int:
+        """
+        :return: the number of bytes taken by the stored edges
+        """
+        return sum(edges.buffer_info()[1] * edges.itemsize for row in self._cells for edges in row if edges is not None)
+
+
+# category id -> (arguments the item can consume, categories it starts with)
+_JOIN_KEYS: Dict[int, Tuple[Tuple[int, ...], Tuple[int, ...]]] = {}
+
+
+def _join_keys(category_id: int) -> Tuple[Tuple[int, ...], Tuple[int, ...]]:
+    keys = _JOIN_KEYS.get(category_id)
+    if keys is None:
+        categories = CATEGORIES.categories
+        category = categories[category_id]
+        arguments = [suffix for _, suffix, _ in category.forward_args + category.backward_args]
+        # cells are indexed by plain categories, the features are unified by the rules
+        keys = _JOIN_KEYS[category_id] = (tuple({categories[arg].plain for arg in arguments}),
+                                          tuple({categories[prefix].plain for prefix in category.prefixes}))
+    return keys
+
+
+class CellIndex:
+    """
+    Indexes the items of a filled chart cell for use as the right hand side of a combination:
+    by_prefix maps every category Y to the items of the form [Yβ], i.e. what a functor X|Y on the left can consume,
+    by_argument maps Y to the functors X\\Y that can consume a left item [Yβ].
+    Y is taken without features (see categories.Category.plain), so S:DCL items are found for an argument S.
+    Looking up the arguments and prefixes of a left item then gives exactly the items it may combine with,
+    instead of trying it against the whole cell.
+    Only plain items are indexed, fast_ccg combines its derivation contexts and recombined items by itself.
+    """
+    __slots__ = ('cell', 'by_prefix', 'by_argument', '_candidates')
+
+    def __init__(self, cell):
+        self.cell = cell
+        self.by_prefix: Dict[int, List[int]] = {}
+        self.by_argument: Dict[int, List[int]] = {}
+        # left items with the same category have the same candidates
+        self._candidates: Dict[int, List[int]] = {}
+        categories = CATEGORIES.categories
+        for index, item in enumerate(cell):
+            if type(item) is not Item:
+                continue
+            for prefix in {categories[prefix].plain for prefix in categories[item.cat_id].prefixes}:
+                self.by_prefix.setdefault(prefix, []).append(index)
+            for suffix in {categories[suffix].plain for _, suffix, _ in categories[item.cat_id].backward_args}:
+                self.by_argument.setdefault(suffix, []).append(index)
+
+    def candidates(self, item: Item) -> List[int]:
+        """
+        :param item: an item of the cell directly to the left of this one
+        :return: the indices of the items it may combine with, in cell order
+        """
+        key = item.cat_id
+        found = self._candidates.get(key)
+        if found is None:
+            arguments, prefixes = _join_keys(key)
+            matches = [self.by_prefix[arg] for arg in arguments if arg in self.by_prefix]
+            matches.extend(self.by_argument[prefix] for prefix in prefixes if prefix in self.by_argument)
+            if len(matches) <= 1:
+                found = matches[0] if matches else matches
+            else:
+                found = sorted(set().union(*matches))
+            self._candidates[key] = found
+        return found
+
+
+def combinable_pairs(left_cell, right_index: CellIndex) -> Iterator[Tuple[Item, Item]]:
+    """
+    Yields the (left item, right item) pairs of two adjacent cells that share an argument,
+    in the same order as the nested loop over both cells would.
+    Pairs that are skipped cannot be combined by any of the rules.
+    """
+    right_cell = right_index.cell
+    candidates = right_index.candidates
+    for left_item in left_cell:
+        for index in candidates(left_item):
+            yield left_item, right_cell[index]
+
+
+def cell_pairs(chart, i: int, k: int, j: int, indexes: Optional[Dict[Tuple[int, int], CellIndex]]) -> Iterator[Tuple[Item, Item]]:
+    """
+    The pairs of items of chart[i][k] and chart[k + 1][j] that a parser has to try.
+    :param indexes: a dict caching the CellIndex of each right hand side cell, built when first needed.
+                    If None every pair of the cross product is returned.
+    """
+    if indexes is None:
+        right_cell = chart[k + 1][j]
+        return ((left_item, right_item) for left_item in chart[i][k] for right_item in right_cell)
+    right_index = indexes.get((k + 1, j))
+    if right_index is None:
+        right_index = indexes[(k + 1, j)] = CellIndex(chart[k + 1][j])
+    return combinable_pairs(chart[i][k], right_index)
+
+
+CHART_BACKENDS: Dict[str, Callable[[int], object]] = {
+    'list': list_chart,
+    'array': ArrayChart,
+}
+
+
+def grow_chart(chart):
+    """
+    Makes a chart one word longer: the cells chart[i][n] of the new word are added, all empty,
+    and the cells that are already there are kept as they are.
+    """
+    if isinstance(chart, list):
+        for row in chart:
+            row.append([])
+        chart.append([[] for _ in range(len(chart) + 1)])
+    else:
+        chart.grow()
+
+
+def make_chart(n: int, backend: str = 'list'):
+    """
+    Creates an empty chart for an input of length n.
+    :param n: the input length
+    :param backend: one of CHART_BACKENDS, 'list' for python lists of items, 'array' for an ArrayChart
+    :return: the chart, indexed as chart[i][j]
+    """
+    if backend not in CHART_BACKENDS:
+        raise ValueError(f"Unknown chart backend {backend}, expected one of {list(CHART_BACKENDS)}")
+    return CHART_BACKENDS[backend](n)
@@ -0,0 +1,119 @@
+import json
+import time
+from typing import IO, List, Optional
+
+
+class ChartTrace:
+    """
+    Records how a chart grows while a sentence is parsed. Pass one as trace= to cky_parse or fast_ccg:
+    every finished cell is recorded with its number of items and derivation contexts (KuhlmannItems),
+    and every span length with the time it took. The trace can be written as json lines, or in the
+    Chrome trace event format to look at it in chrome://tracing or Perfetto.
+    Summary flags such as used_kuhlmann are kept while parsing, so nothing has to look at the chart afterwards.
+    A trace can record several parses, each one is numbered.
+    """
+
+    def __init__(self):
+        self.events: List[dict] = []
+        self.parses = 0
+        self._start_ns = time.perf_counter_ns()
+        self._span_start_ns = 0
+        self._parse = None
+        self.used_kuhlmann = False
+        self.max_cell = 0
+        self.num_items = 0
+        self.num_contexts = 0
+
+    def _now(self) -> int:
+        return time.perf_counter_ns() - self._start_ns
+
+    def begin(self, parser: str, n: int, name: Optional[str] = None):
+        """
+        Called by a parser before it fills the chart of a sentence of length n.
+        """
+        self._parse = self.parses
+        self.parses += 1
+        self.events.append({'event': 'begin', 'parse': self._parse, 'parser': parser, 'n': n,
+                            'name': name, 't_ns': self._now()})
+
+    def begin_span(self, length: int):
+        self._span_start_ns = self._now()
+
+    def cell(self, i: int, j: int, cell):
+        """
+        Called by a parser once chart[i][j] is complete.
+        """
+        items = len(cell)
+        contexts = sum(1 for item in cell if hasattr(item, 'beta_id')) if items else 0
+        self.num_items += items
+        self.num_contexts += contexts
+        self.max_cell = max(self.max_cell, items)
+        self.used_kuhlmann = self.used_kuhlmann or contexts > 0
+        self.events.append({'event': 'cell', 'parse': self._parse, 'i': i, 'j': j, 'length': j - i + 1,
+                            'items': items, 'contexts': contexts, 't_ns': self._now()})
+
+    def end_span(self, length: int):
+        end = self._now()
+        self.events.append({'event': 'span', 'parse': self._parse, 'length': length,
+                            't_ns': self._span_start_ns, 'duration_ns': end - self._span_start_ns})
+
+    def end(self, num_parses: int):
+        self.events.append({'event': 'end', 'parse': self._parse, 'parses': num_parses, 't_ns': self._now()})
+
+    def summary(self) -> dict:
+        return {'parses': self.parses, 'used_kuhlmann': self.used_kuhlmann, 'items': self.num_items,
+                'contexts': self.num_contexts, 'max_cell': self.max_cell}
+
+    def write_jsonl(self, f: IO[str]):
+        """
+        Writes one json object per event, followed by the summary.
+        """
+        for event in self.events:
+            f.write(json.dumps(event) + '\n')
+        f.write(json.dumps({'event': 'summary', **self.summary()}) + '\n')
+
+    def chrome_events(self) -> List[dict]:
+        """
+        :return: the trace in the Chrome trace event format: one thread per parse, a complete event ('X') per span
+                 length and counters ('C') for the size of the chart
+        """
+        events, names = [], {}
+        chart_size = {}
+        for event in self.events:
+            parse = event['parse']
+            ts = event['t_ns'] / 1000
+            if event['event'] == 'begin':
+                names[parse] = event['name'] or f"{event['parser']} n={event['n']}"
+                events.append({'name': 'thread_name', 'ph': 'M', 'pid': 0, 'tid': parse,
+                               'args': {'name': names[parse]}})
+                chart_size[parse] = [0, 0]
+            elif event['event'] == 'span':
+                events.append({'name': f"span {event['length']}", 'cat': 'span', 'ph': 'X', 'pid': 0, 'tid': parse,
+                               'ts': ts, 'dur': event['duration_ns'] / 1000, 'args': {'length': event['length']}})
+            elif event['event'] == 'cell':
+                size = chart_size[parse]
+                size[0] += event['items'] - event['contexts']
+                size[1] += event['contexts']
+                events.append({'name': f"chart {names[parse]}", 'ph': 'C', 'pid': 0, 'tid': parse, 'ts': ts,
+                               'args': {'items': size[0], 'contexts': size[1]}})
+                if event['items']:
+                    events.append({'name': f"cell {event['i']},{event['j']}", 'cat': 'cell', 'ph': 'i', 's': 't',
+                                   'pid': 0, 'tid': parse, 'ts': ts,
+                                   'args': {'items': event['items'], 'contexts': event['contexts']}})
+            elif event['event'] == 'end':
+                events.append({'name': 'parsed', 'cat': 'parse', 'ph': 'i', 's': 't', 'pid': 0, 'tid': parse,
+                               'ts': ts, 'args': {'parses': event['parses']}})
+        return events
+
+    def write_chrome_trace(self, f: IO[str]):
+        json.dump({'traceEvents': self.chrome_events(), 'otherData': self.summary()}, f)
+
+    def save(self, path: str):
+        """
+        Writes the trace to a file, as json lines if the path ends with .jsonl, otherwise as a Chrome trace.
+        """
+        with open(path, 'w') as f:
+            if path.endswith('.jsonl'):
+                self.write_jsonl(f)
+            else:
+                self.write_chrome_trace(f)
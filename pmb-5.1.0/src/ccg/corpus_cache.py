@@ -0,0 +1,290 @@
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
+from categories import intern_category
+from pmb_reader import Filter, SentenceRecord, iter_ccg_files, read_corpus
+from read_ccg import flatten_category, structured_category
+
+# File layout: MAGIC, a header (version, metadata size, sentence count, token count, rule count, lx count),
+# the metadata as json (string tables and the stat of every source file), then four int32 arrays:
+# the sentence table, the (word id, category id) pairs of all tokens, the rule ids used by every sentence
+# and the (argument id, result id) categories of the lx nodes of every sentence.
+# The categories are kept as written in the files, flattened or not when they are read.
+MAGIC = b'PMBC'
+CACHE_VERSION = 3
+_HEADER = struct.Struct('<6Q')
+# token start, token end, rule start, rule end, language id, file id, lx start, lx end
+SENTENCE_WIDTH = 8
+_ALIGN = 8
+
+
+def _source_stats(paths: Dict[Optional[str], str]) -> List[Tuple[str, int, int]]:
+    """
+    :return: (path, mtime in ns, size) of every `.ccg` file, in the order read_corpus yields them
+    """
+    stats = []
+    for directory_path in paths.values():
+        for path in iter_ccg_files(directory_path):
+            stat = os.stat(path)
+            stats.append((path, stat.st_mtime_ns, stat.st_size))
+    return stats
+
+
+def _as_dict(paths: Union[str, Dict[str, str]]) -> Dict[Optional[str], str]:
+    return {None: paths} if isinstance(paths, str) else dict(paths)
+
+
+class _Table:
+    """ Assigns consecutive ids to strings (and None, for a corpus without a language). """
+
+    def __init__(self):
+        self.ids: Dict[Optional[str], int] = {}
+        self.strings: List[Optional[str]] = []
+
+    def __call__(self, string: Optional[str]) -> int:
+        index = self.ids.get(string)
+        if index is None:
+            index = self.ids[string] = len(self.strings)
+            self.strings.append(string)
+        return index
+
+
+def compile_corpus(paths: Union[str, Dict[str, str]], cache_path: str) -> str:
+    """
+    Reads every sentence of a corpus once and writes its lexical entries and rules to a binary cache file.
+    :param paths: a directory, or a dict mapping a language code to its directory, as for read_corpus
+    :param cache_path: the file to write, it is replaced atomically
+    :return: cache_path
+    """
+    paths = _as_dict(paths)
+    words, categories, rules, languages, files = _Table(), _Table(), _Table(), _Table(), _Table()
+    sentences, tokens, used_rules, unary_rules = array('i'), array('i'), array('i'), array('i')
+    stats = []
+    for record in read_corpus(paths):
+        stat = os.stat(record.path)
+        stats.append((record.path, stat.st_mtime_ns, stat.st_size))
+        token_start, rule_start = len(tokens) // 2, len(used_rules)
+        for word, category in record.raw_entries:
+            tokens.append(words(word))
+            tokens.append(categories(category))
+        used_rules.extend(rules(rule) for rule in sorted(record.rules))
+        unary_start = len(unary_rules) // 2
+        for argument, result in record.raw_unary_rules:
+            unary_rules.append(categories(argument))
+            unary_rules.append(categories(result))
+        sentences.extend((token_start, len(tokens) // 2, rule_start, len(used_rules),
+                          languages(record.language), files(record.path), unary_start, len(unary_rules) // 2))
+
+    metadata = json.dumps({'sources': [[language, directory_path] for language, directory_path in paths.items()],
+                           'stats': stats, 'byteorder': sys.byteorder,
+                           'words': words.strings, 'categories': categories.strings, 'rules': rules.strings,
+                           'languages': languages.strings,
+                           'files': files.strings}).encode('utf-8')
+    tmp_path = cache_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(_HEADER.pack(CACHE_VERSION, len(metadata), len(sentences) // SENTENCE_WIDTH,
+                             len(tokens) // 2, len(used_rules), len(unary_rules) // 2))
+        f.write(metadata)
+        for section in (sentences, tokens, used_rules, unary_rules):
+            f.write(b'\0' * (-f.tell() % _ALIGN))
+            section.tofile(f)
+    os.replace(tmp_path, cache_path)
+    return cache_path
+
+
+class CachedSentence(SentenceRecord):
+    """
+    A sentence of a CorpusCache. It has the same properties as a SentenceRecord, so the filters of pmb_reader
+    and corpus_runner.make_job work on it, but the entries and rules come from the cache instead of the file.
+    """
+    __slots__ = ('cache', 'index')
+
+    def __init__(self, cache: 'CorpusCache', index: int, path: str, language: Optional[str],
+                 structured: bool = False):
+        super().__init__(path, language, structured)
+        self.cache = cache
+        self.index = index
+
+    @property
+    def rules(self) -> Set[str]:
+        if self._rules is None:
+            self._rules = self.cache.rules(self.index)
+        return self._rules
+
+    @property
+    def entries(self) -> List[Tuple[str, str]]:
+        if self._entries is None:
+            self._entries = self.cache.entries(self.index, self.structured)
+        return self._entries
+
+    @property
+    def raw_unary_rules(self) -> List[Tuple[str, str]]:
+        return self.cache.raw_unary_rules(self.index)
+
+
+class CorpusCache:
+    """
+    A corpus cache file written by compile_corpus, opened with mmap. Nothing is parsed when it is opened
+    apart from the string tables: word_ids and category_ids return memoryviews straight into the mapped file.
+    """
+
+    def __init__(self, cache_path: str):
+        self.path = cache_path
+        with open(cache_path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if self._mmap[:len(MAGIC)] != MAGIC:
+                raise ValueError(f"{cache_path} is not a corpus cache")
+            offset = len(MAGIC)
+            version, metadata_size, num_sentences, num_tokens, num_rules, num_unary = \
+                _HEADER.unpack_from(self._mmap, offset)
+            if version != CACHE_VERSION:
+                raise ValueError(f"{cache_path} has version {version}, expected {CACHE_VERSION}")
+            offset += _HEADER.size
+            metadata = json.loads(self._mmap[offset:offset + metadata_size].decode('utf-8'))
+            if metadata['byteorder'] != sys.byteorder:
+                raise ValueError(f"{cache_path} was written on a {metadata['byteorder']} endian machine")
+            offset += metadata_size
+        except Exception:
+            self._mmap.close()
+            raise
+        self.sources = {language: directory_path for language, directory_path in metadata['sources']}
+        self.stats = [tuple(stat) for stat in metadata['stats']]
+        self.words: List[str] = metadata['words']
+        # as written in the files, see category_strings
+        self.categories: List[str] = metadata['categories']
+        self.rule_names: List[str] = metadata['rules']
+        self.languages: List[Optional[str]] = metadata['languages']
+        self.files: List[str] = metadata['files']
+        self._converted: Dict[bool, List[str]] = {}
+        self._interned: Dict[bool, List[int]] = {}
+        self.structured = False
+
+        view = self._view = memoryview(self._mmap)
+        sections = []
+        for size in (num_sentences * SENTENCE_WIDTH, num_tokens * 2, num_rules, num_unary * 2):
+            offset += -offset % _ALIGN
+            sections.append(view[offset:offset + 4 * size].cast('i'))
+            offset += 4 * size
+        self._sentences, self._tokens, self._rules, self._unary = sections
+
+    def __len__(self) -> int:
+        return len(self._sentences) // SENTENCE_WIDTH
+
+    def __getitem__(self, index: int) -> CachedSentence:
+        if not 0 <= index < len(self):
+            raise IndexError('sentence index out of range')
+        row = index * SENTENCE_WIDTH
+        return CachedSentence(self, index, self.files[self._sentences[row + 5]],
+                              self.languages[self._sentences[row + 4]], self.structured)
+
+    def __iter__(self) -> Iterator[CachedSentence]:
+        return (self[index] for index in range(len(self)))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        for section in (self._sentences, self._tokens, self._rules, self._unary, self._view):
+            section.release()
+        self._mmap.close()
+
+    def _token_slice(self, index: int) -> slice:
+        row = index * SENTENCE_WIDTH
+        return slice(2 * self._sentences[row], 2 * self._sentences[row + 1])
+
+    def word_ids(self, index: int) -> memoryview:
+        """
+        :return: the word ids of a sentence (punctuation included), a view into the file
+        """
+        return self._tokens[self._token_slice(index)][::2]
+
+    def category_ids(self, index: int) -> memoryview:
+        """
+        :return: the ids of the categories of a sentence in self.categories, a view into the file
+        """
+        return self._tokens[self._token_slice(index)][1::2]
+
+    def category_strings(self, structured: bool = False) -> List[str]:
+        """
+        :return: self.categories as the parsers see them, flattened unless structured (see pmb_reader.SentenceRecord)
+        """
+        converted = self._converted.get(structured)
+        if converted is None:
+            convert = structured_category if structured else flatten_category
+            converted = self._converted[structured] = [convert(category) for category in self.categories]
+        return converted
+
+    def interned_category_ids(self, index: int, structured: bool = False) -> List[int]:
+        """
+        :return: the categories of a sentence as ids of the global CategoryTable
+        """
+        interned = self._interned.get(structured)
+        if interned is None:
+            interned = self._interned[structured] = [intern_category(category)
+                                                     for category in self.category_strings(structured)]
+        return [interned[category] for category in self.category_ids(index)]
+
+    def entries(self, index: int, structured: bool = False) -> List[Tuple[str, str]]:
+        words, categories = self.words, self.category_strings(structured)
+        return [(words[word], categories[category])
+                for word, category in zip(self.word_ids(index), self.category_ids(index))]
+
+    def rules(self, index: int) -> Set[str]:
+        row = index * SENTENCE_WIDTH
+        return {self.rule_names[rule] for rule in self._rules[self._sentences[row + 2]:self._sentences[row + 3]]}
+
+    def raw_unary_rules(self, index: int) -> List[Tuple[str, str]]:
+        """
+        :return: the (argument, result) categories of the lx nodes of a sentence, as written in the files
+        """
+        row = index * SENTENCE_WIDTH
+        pairs = self._unary[2 * self._sentences[row + 6]:2 * self._sentences[row + 7]]
+        categories = self.categories
+        return [(categories[argument], categories[result]) for argument, result in zip(pairs[::2], pairs[1::2])]
+
+    def is_fresh(self, paths: Union[str, Dict[str, str]]) -> bool:
+        """
+        :return: whether the cache was compiled from these directories and no `.ccg` file below them
+                 was added, removed or changed (by mtime or size) since
+        """
+        paths = _as_dict(paths)
+        return self.sources == paths and self.stats == _source_stats(paths)
+
+
+def open_corpus(paths: Union[str, Dict[str, str]], cache_path: str) -> CorpusCache:
+    """
+    Opens the cache of a corpus, compiling it first if it is missing, unreadable or out of date.
+    """
+    if os.path.exists(cache_path):
+        try:
+            cache = CorpusCache(cache_path)
+        except (ValueError, KeyError, struct.error):
+            cache = None
+        if cache is not None:
+            if cache.is_fresh(paths):
+                return cache
+            cache.close()
+    return CorpusCache(compile_corpus(paths, cache_path))
+
+
+def read_cached_corpus(paths: Union[str, Dict[str, str]], cache_path: str,
+                       filters: Iterable[Filter] = (), structured: bool = False) -> Iterator[CachedSentence]:
+    """
+    Same as pmb_reader.read_corpus, but reads the sentences from a cache file that is kept up to date.
+    """
+    filters = list(filters)
+    # not closed here, the sentences read their entries from the cache when they are first used
+    cache = open_corpus(paths, cache_path)
+    cache.structured = structured
+    for sentence in cache:
+        if all(keep(sentence) for keep in filters):
+            yield sentence
@@ -0,0 +1,411 @@
+import os
+import signal
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from bitset_ccg import BitsetGrammar, bitset_parse
+from budget import BudgetExceeded, ParseBudget
+from ccg import cky_parse
+from chart_trace import ChartTrace
+from corpus_cache import read_cached_corpus
+from fast_ccg import fast_ccg, compute_artiy_bound
+from forest import ParseForest
+from lattice import lattice_categories
+from pmb_reader import Filter, SentenceRecord, has_derivation, read_corpus
+from parse_stats import ParseStats
+from result_cache import ResultCache, encode_forest, sentence_categories, sentence_key
+from rule_cache import RuleCache
+from unary_rules import UnaryRules
+
+PARSERS = ('fast', 'naive')
+
+# one rule cache per language in every worker process, kept across the sentences it parses
+_RULE_CACHES: Dict[str, RuleCache] = {}
+# one compiled closure per set of unary rules
+_UNARY_RULES: OrderedDict[Tuple[Tuple[str, str], ...], UnaryRules] = OrderedDict()
+# and one bitset rule table per language and unary rules
+_BITSET_GRAMMARS: OrderedDict[Tuple[str, Tuple[Tuple[str, str], ...]], BitsetGrammar] = OrderedDict()
+# the unary rules are those of a sentence, so only the most recently used closures and tables are kept
+MAX_GRAMMARS = 64
+# the parse result caches of the worker process, by the path of their sqlite file and whether they keep forests
+_RESULT_CACHES: Dict[Tuple[str, bool], ResultCache] = {}
+
+
+class ParseTimeout(Exception):
+    pass
+
+
+@contextmanager
+def time_limit(seconds: Optional[float]):
+    """
+    Raises ParseTimeout in the block after the given number of seconds.
+    Uses SIGALRM, so it only has an effect in the main thread of a process (as in a pool worker).
+    """
+    if not seconds or not hasattr(signal, 'setitimer') or threading.current_thread() is not threading.main_thread():
+        yield
+        return
+
+    def _raise(signum, frame):
+        raise ParseTimeout()
+
+    previous = signal.signal(signal.SIGALRM, _raise)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def make_job(record: SentenceRecord, parse_lx: bool = True) -> dict:
+    """
+    Turns a sentence record into a job for parse_sentence.
+    :param record: a sentence of the corpus, see pmb_reader
+    :param parse_lx: also parse the sentences with lx nodes, with their unary rules (see unary_rules.UnaryRules)
+    :return: a dict with the file name, language, the lattice of the gold category of every token (see lattice.py),
+             input tokens, whether it uses lx and its unary rules. The lattice is None if the sentence is not parsed
+
+    >>> job = make_job(SentenceRecord.from_text("ccg(1, ba(s:dcl, fa(np,\\n t(np/n, 'that', [from:0]),\\n"
+    ...                                         " t(n, 'that', [from:5])),\\n t(s:dcl\\\\np, 'sleeps', [from:10]))).\\n"))
+    >>> job['lattice'], parse_sentence(job)['fast_parses']
+    ([[('NP/N', 1.0)], [('N', 1.0)], [('S\\\\NP', 1.0)]], 1)
+    """
+    job = {'file': record.file, 'language': record.language, 'lattice': None, 'tokens': None, 'lx': False,
+           'unary': ()}
+    if has_derivation(record):
+        job['lx'] = record.uses_lx
+        if parse_lx or not job['lx']:
+            job['lattice'] = record.lattice
+            job['tokens'] = record.tokens
+            job['unary'] = tuple(record.unary_rules)
+    return job
+
+
+def read_sentence(file_path: str, language: str, parse_lx: bool = True) -> dict:
+    """
+    Reads a `.ccg` file into a job for parse_sentence.
+    :param file_path: path to the `.ccg` file
+    :param language: language code of the file, e.g. 'en'
+    :param parse_lx: see make_job
+    """
+    return make_job(SentenceRecord(file_path, language), parse_lx)
+
+
+def load_sentences(paths: Dict[str, str], filters: Iterable[Filter] = (),
+                   cache_path: Optional[str] = None, structured: bool = False,
+                   parse_lx: bool = True) -> Iterator[dict]:
+    """
+    Yields a job for every `.ccg` file below the given directories, in a fixed (sorted) order.
+    :param paths: maps a language code to the directory holding its `.ccg` files
+    :param filters: only sentences passing these are parsed (or counted), see pmb_reader.read_corpus
+    :param cache_path: if given, the sentences are read from this corpus cache, which is (re)compiled when needed
+    :param structured: keep the brackets and features of the categories, see pmb_reader.SentenceRecord
+    :param parse_lx: also parse the sentences with lx nodes, see make_job
+    """
+    if cache_path is None:
+        records = read_corpus(paths, filters, structured)
+    else:
+        records = read_cached_corpus(paths, cache_path, filters, structured)
+    for record in records:
+        yield make_job(record, parse_lx)
+
+
+def _result_cache(path: str, forests: bool) -> ResultCache:
+    cache = _RESULT_CACHES.get((path, forests))
+    if cache is None:
+        cache = _RESULT_CACHES[path, forests] = ResultCache(path=path, forests=forests)
+    return cache
+
+
+def _unary_rules(rules: Tuple[Tuple[str, str], ...]) -> Optional[UnaryRules]:
+    if not rules:
+        return None
+    unary = _UNARY_RULES.get(rules)
+    if unary is None:
+        unary = _UNARY_RULES[rules] = UnaryRules(rules)
+        if len(_UNARY_RULES) > MAX_GRAMMARS:
+            _UNARY_RULES.popitem(last=False)
+    else:
+        _UNARY_RULES.move_to_end(rules)
+    return unary
+
+
+def _bitset_grammar(job: dict) -> BitsetGrammar:
+    key = (job['language'], job['unary'])
+    grammar = _BITSET_GRAMMARS.get(key)
+    if grammar is None:
+        grammar = _BITSET_GRAMMARS[key] = BitsetGrammar(unary=_unary_rules(job['unary']))
+        if len(_BITSET_GRAMMARS) > MAX_GRAMMARS:
+            _BITSET_GRAMMARS.popitem(last=False)
+    else:
+        _BITSET_GRAMMARS.move_to_end(key)
+    return grammar
+
+
+def _run_parser(parser: str, job: dict, rule_cache: RuleCache, stats: Optional[ParseStats],
+                trace: Optional[ChartTrace], budget: ParseBudget, forest: Optional[ParseForest] = None) -> dict:
+    """
+    Runs one parser on a sentence.
+    :param forest: if given, the parse is packed into it and the entry keeps it as 'forest' (see encode_forest)
+    :return: what the sentence result gets from this parser, as it is kept in a ResultCache
+    """
+    # the categories of every position, a word that occurs twice keeps both of its categories
+    lattice = job['lattice']
+    unary = _unary_rules(job['unary'])
+    start_time = time.perf_counter()
+    if parser == 'fast':
+        num_parses, chart, num_edges, num_km_edges = fast_ccg(None, None, rule_cache=rule_cache, forest=forest,
+                                                              stats=stats, trace=trace, lattice=lattice, unary=unary,
+                                                              budget=budget)
+        entry = {'parses': num_parses, 'edges': num_edges, 'km_edges': num_km_edges,
+                 'peak_bytes': budget.peak_bytes}
+    elif parser == 'naive':
+        naive_parses, chart_naive = cky_parse(None, None, rule_cache=rule_cache, forest=forest, stats=stats,
+                                              trace=trace, lattice=lattice, unary=unary, budget=budget)
+        entry = {'parses': naive_parses, 'peak_bytes': budget.peak_bytes}
+    else:
+        accepts, _ = bitset_parse(None, None, _bitset_grammar(job), lattice=lattice)
+        entry = {'accepts': accepts}
+    entry['time'] = time.perf_counter() - start_time
+    if stats is not None:
+        entry['stats'] = stats.as_dict()
+    if forest is not None:
+        entry['forest'] = encode_forest(forest)
+    return entry
+
+
+def parse_sentence(job: dict, parsers: Tuple[str, ...] = PARSERS, timeout: Optional[float] = None,
+                   rule_stats: bool = False, trace_dir: Optional[str] = None,
+                   result_cache: Optional[str] = None, max_edges: Optional[int] = None,
+                   max_bytes: Optional[int] = None, forests: bool = False) -> dict:
+    """
+    Parses one sentence with the requested parsers.
+    :param job: a dict as returned by read_sentence
+    :param parsers: which parsers to run, 'fast' for fast_ccg and 'naive' for cky_parse,
+                    'bitset' for bitset_parse (recognition only)
+    :param timeout: seconds allowed for the whole sentence, None for no limit
+    :param rule_stats: also return the per rule counters of every parser (see parse_stats.ParseStats)
+    :param trace_dir: if given, the chart growth of the parsers is written to a Chrome trace in this directory
+                      (see chart_trace.ChartTrace), its path is returned as 'trace'
+    :param result_cache: a sqlite file of parse results (see result_cache.ResultCache). A parser is not run
+                         on a sentence whose categories it has parsed before, and the times are the ones of
+                         that parse. The parsers that were skipped are returned as 'cached'.
+                         Not used when tracing, as a trace needs the chart to be filled
+    :param max_edges: the number of items a parser may store for the sentence, see budget.ParseBudget
+    :param max_bytes: the estimated chart memory a parser may take for the sentence
+    :param forests: pack the parses of fast_ccg and cky_parse into a forest (see forest.ParseForest) and return
+                    them as 'forests', {parser: encode_forest data} to be read back with result_cache.decode_forest.
+                    The edges are then those of a packed parse, these results are cached apart and with their forest
+    :return: a dict with the parse counts, edges, timings and peak chart memory of the sentence and its status,
+             one of 'ok', 'skipped' (not parsed, see make_job), 'timeout', 'budget' (see max_edges and max_bytes,
+             what was exceeded is returned as 'budget') or 'error', and whether it uses lx
+
+    >>> from result_cache import decode_forest
+    >>> job = make_job(SentenceRecord.from_text("ccg(1, fa(np,\\n t(np/n, 'the', [from:0]),\\n t(n, 'dog', [from:4]))).\\n"))
+    >>> forest = decode_forest(parse_sentence(job, ('fast',), forests=True)['forests']['fast'])
+    >>> len(forest), forest.num_backpointers()
+    (3, 3)
+    """
+    result = {'file': job['file'], 'language': job['language'], 'status': 'skipped', 'lx': job['lx'], 'length': 0,
+              'fast_parses': None, 'naive_parses': None, 'edges': 0, 'km_edges': 0,
+              'fast_time': 0.0, 'naive_time': 0.0, 'bitset_accepts': None, 'bitset_time': 0.0,
+              'fast_peak_bytes': 0, 'naive_peak_bytes': 0,
+              'cache_hits': 0, 'cache_misses': 0, 'cached': []}
+    if job['lattice'] is None:
+        return result
+
+    lattice = job['lattice']
+    result['length'] = len(lattice)
+    rule_cache = _RULE_CACHES.setdefault(job['language'], RuleCache())
+    hits, misses = rule_cache.hits, rule_cache.misses
+    stats = {parser: ParseStats() for parser in parsers} if rule_stats else {}
+    trace = ChartTrace() if trace_dir is not None else None
+    budget = ParseBudget(max_edges, max_bytes)
+    results = _result_cache(result_cache, forests) if result_cache is not None and trace is None else None
+    if forests:
+        result['forests'] = {}
+    if results is not None:
+        categories = sentence_categories(lattice)
+        # as fast_ccg computes it, from the categories of the sentence
+        c_G = compute_artiy_bound(lattice_categories(lattice), unary=_unary_rules(job['unary']))
+    try:
+        with time_limit(timeout):
+            for parser in parsers:
+                entry = key = None
+                packed = forests and parser != 'bitset'
+                if results is not None:
+                    key = sentence_key(categories, f'{parser}_forest' if packed else parser, c_G, job['unary'])
+                    entry = results.get(key)
+                    if entry is not None and rule_stats and 'stats' not in entry:
+                        entry = None
+                if entry is None:
+                    entry = _run_parser(parser, job, rule_cache, stats.get(parser), trace, budget,
+                                        ParseForest() if packed else None)
+                    if key is not None:
+                        results.put(key, entry)
+                else:
+                    result['cached'].append(parser)
+                    if rule_stats:
+                        stats[parser] = ParseStats.from_dict(entry['stats'])
+                result[f'{parser}_time'] = entry['time']
+                if parser == 'bitset':
+                    result['bitset_accepts'] = entry['accepts']
+                else:
+                    result[f'{parser}_parses'] = entry['parses']
+                    result[f'{parser}_peak_bytes'] = entry.get('peak_bytes', 0)
+                if parser == 'fast':
+                    result['edges'] = entry['edges']
+                    result['km_edges'] = entry['km_edges']
+                if packed:
+                    result['forests'][parser] = entry['forest']
+        result['status'] = 'ok'
+    except ParseTimeout:
+        result['status'] = 'timeout'
+    except BudgetExceeded as e:
+        result['status'] = 'budget'
+        result['budget'] = {'parser': parser, **e.as_dict()}
+        result[f'{parser}_peak_bytes'] = budget.peak_bytes
+    except Exception as e:
+        result['status'] = 'error'
+        result['error'] = repr(e)
+    result['cache_hits'] = rule_cache.hits - hits
+    result['cache_misses'] = rule_cache.misses - misses
+    if trace is not None:
+        result['trace'] = os.path.join(trace_dir, f"{job['language']}_{job['file']}.json")
+        trace.save(result['trace'])
+    if rule_stats:
+        result['rule_stats'] = {parser: parser_stats.as_dict() for parser, parser_stats in stats.items()}
+    return result
+
+
+def _parse_chunk(jobs: List[dict], parsers: Tuple[str, ...], timeout: Optional[float], rule_stats: bool,
+                 trace_dir: Optional[str], result_cache: Optional[str], max_edges: Optional[int],
+                 max_bytes: Optional[int], forests: bool) -> List[dict]:
+    return [parse_sentence(job, parsers, timeout, rule_stats, trace_dir, result_cache, max_edges, max_bytes, forests)
+            for job in jobs]
+
+
+def _chunks(jobs: Iterable[dict], chunksize: int) -> Iterator[List[dict]]:
+    chunk = []
+    for job in jobs:
+        chunk.append(job)
+        if len(chunk) == chunksize:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def iter_corpus(jobs: Iterable[dict], workers: Optional[int] = None, chunksize: int = 16,
+                timeout: Optional[float] = None, parsers: Tuple[str, ...] = PARSERS,
+                rule_stats: bool = False, trace_dir: Optional[str] = None,
+                result_cache: Optional[str] = None, max_edges: Optional[int] = None,
+                max_bytes: Optional[int] = None, forests: bool = False) -> Iterator[dict]:
+    """
+    Parses sentences on a process pool and yields their results in input order.
+    Jobs are sent to the workers in chunks, and only a bounded number of chunks is in flight,
+    so the jobs can be a lazy iterator over a corpus of any size.
+    :param jobs: dicts as returned by read_sentence
+    :param workers: number of worker processes, None for one per CPU, 0 to parse in this process
+    :param chunksize: number of sentences sent to a worker at once
+    :param timeout: seconds allowed per sentence, None for no limit
+    :param parsers: which parsers to run, see parse_sentence
+    :param rule_stats: collect the per rule counters, see parse_sentence
+    :param trace_dir: write a chart trace per sentence to this directory, see parse_sentence
+    :param result_cache: a sqlite file of parse results shared by the workers, see parse_sentence
+    :param max_edges: the edge budget of a parse, see parse_sentence
+    :param max_bytes: the memory budget of a parse, see parse_sentence
+    :param forests: also return the packed forests of the parses, see parse_sentence
+    """
+    if workers == 0:
+        for job in jobs:
+            yield parse_sentence(job, parsers, timeout, rule_stats, trace_dir, result_cache, max_edges, max_bytes,
+                                 forests)
+        return
+
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for chunk in _chunks(jobs, chunksize):
+            pending.append(executor.submit(_parse_chunk, chunk, parsers, timeout, rule_stats, trace_dir,
+                                           result_cache, max_edges, max_bytes, forests))
+            # keep every worker busy, but do not read the whole corpus ahead
+            if len(pending) >= 2 * workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def new_language_stats() -> dict:
+    return {'sentences': 0, 'lx': 0, 'skipped': 0, 'parsed': 0, 'timeouts': 0, 'errors': 0, 'over_budget': 0,
+            'peak_bytes': 0,
+            'edges': 0, 'km_edges': 0, 'kuhlmann_sentences': 0,
+            'mismatched_parses': 0, 'mismatched_km': 0,
+            'fast_time': 0.0, 'naive_time': 0.0,
+            'cache_hits': 0, 'cache_misses': 0, 'cached': 0,
+            'parse_counts': Counter(),
+            'rule_stats': {}}
+
+
+def merge_result(stats: Dict[str, dict], result: dict):
+    """
+    Adds the counters of one sentence result to the per-language statistics.
+    """
+    lan = stats.setdefault(result['language'], new_language_stats())
+    lan['sentences'] += 1
+    lan['lx'] += int(result['lx'])
+    status = result['status']
+    if status == 'skipped':
+        lan['skipped'] += 1
+        return
+    for parser, parser_stats in result.get('rule_stats', {}).items():
+        lan['rule_stats'].setdefault(parser, ParseStats()).merge(ParseStats.from_dict(parser_stats))
+    lan['cache_hits'] += result['cache_hits']
+    lan['cache_misses'] += result['cache_misses']
+    lan['cached'] += len(result.get('cached', ()))
+    lan['peak_bytes'] = max(lan['peak_bytes'], result['fast_peak_bytes'], result['naive_peak_bytes'])
+    if status == 'timeout':
+        lan['timeouts'] += 1
+        return
+    if status == 'budget':
+        lan['over_budget'] += 1
+        return
+    if status == 'error':
+        lan['errors'] += 1
+        return
+    lan['parsed'] += 1
+    lan['edges'] += result['edges']
+    lan['km_edges'] += result['km_edges']
+    lan['kuhlmann_sentences'] += int(result['km_edges'] > 0)
+    lan['fast_time'] += result['fast_time']
+    lan['naive_time'] += result['naive_time']
+    if result['fast_parses'] is not None:
+        lan['parse_counts'][result['fast_parses']] += 1
+    if result['fast_parses'] is not None and result['naive_parses'] is not None \
+            and result['fast_parses'] != result['naive_parses']:
+        lan['mismatched_parses'] += 1
+        lan['mismatched_km'] += int(result['km_edges'] > 0)
+
+
+def run_corpus(jobs: Iterable[dict], workers: Optional[int] = None, chunksize: int = 16,
+               timeout: Optional[float] = None,
+               parsers: Tuple[str, ...] = PARSERS,
+               rule_stats: bool = False,
+               trace_dir: Optional[str] = None,
+               result_cache: Optional[str] = None,
+               max_edges: Optional[int] = None,
+               max_bytes: Optional[int] = None,
+               forests: bool = False) -> Tuple[List[dict], Dict[str, dict]]:
+    """
+    Parses a corpus on a process pool, see iter_corpus for the arguments.
+    :return: the result of every sentence in input order, and the merged statistics per language
+    """
+    results, stats = [], {}
+    for result in iter_corpus(jobs, workers, chunksize, timeout, parsers, rule_stats, trace_dir,
+                              result_cache, max_edges, max_bytes, forests):
+        results.append(result)
+        merge_result(stats, result)
+    return results, stats
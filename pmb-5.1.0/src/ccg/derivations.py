@@ -0,0 +1,252 @@
+import heapq
+from itertools import count, islice
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+from categories import CATEGORIES
+from ccg import Item
+from chart import NO_CONTEXT, ItemKey, item_key
+from forest import CONTEXT_RULES, ParseForest
+from rule_table import COMBINATORS
+
+# the rules that put the derivation of their left premise into the hole of their right premise
+PLUG_RULES = {'recombine', 'ctxt_recombine'}
+
+
+class Derivation:
+    """
+    A derivation tree. Leaves are the lexical items (rule 'lexicon'), inner nodes have the rule that built them
+    and one (lx) or two children. Inside a derivation context of fast_ccg one leaf is a hole (rule None)
+    and the categories above it are None until a derivation is put into the hole.
+    score is the sum of the scores of the leaves, see iter_derivations.
+    """
+    __slots__ = ('cat_id', 'rule', 'children', 'i', 'j', 'word', 'score')
+
+    def __init__(self, cat_id: Optional[int], rule: Optional[str], children: Tuple['Derivation', ...],
+                 i: int, j: int, word: Optional[str] = None, score: float = 0.0):
+        self.cat_id = cat_id
+        self.rule = rule
+        self.children = children
+        self.i = i
+        self.j = j
+        self.word = word
+        self.score = score
+
+    @property
+    def category(self) -> Optional[str]:
+        return None if self.cat_id is None else CATEGORIES.string(self.cat_id)
+
+    def leaves(self) -> List['Derivation']:
+        if not self.children:
+            return [self]
+        return [leaf for child in self.children for leaf in child.leaves()]
+
+    def as_dict(self) -> dict:
+        """
+        :return: the tree in the format of read_ccg.extract_inference_tree: {category: [children]} for inner nodes
+                 and {category: word} for the leaves (the category if the word is not known)
+        """
+        if not self.children:
+            return {self.category: self.word if self.word is not None else self.category}
+        return {self.category: [child.as_dict() for child in self.children]}
+
+    def __repr__(self):
+        if not self.children:
+            return f"({self.category} {self.word})" if self.word is not None else f"({self.category})"
+        return f"({self.category} {' '.join(map(repr, self.children))})"
+
+
+def _combine(rule: str, left: int, right: int) -> Optional[int]:
+    # the category of a node of a derivation context, once the categories of its children are known:
+    # contexts are started (forward_context) and extended (ctxt_forward) by the rules of cky_parse
+    result = COMBINATORS[rule.removeprefix('ctxt_').removesuffix('_context')].rule(left, right)
+    return None if result is None else result[0]
+
+
+def _has_hole(node: Derivation) -> bool:
+    return node.cat_id is None
+
+
+def _plug(context: Derivation, filler: Derivation) -> Derivation:
+    """
+    :return: the context with the filler in its hole, the nodes on the path to the hole are copied
+             and their categories computed as far as the filler allows
+    """
+    if context.rule is None:
+        return filler
+    children = tuple(_plug(child, filler) if _has_hole(child) else child for child in context.children)
+    cat_id = None
+    if all(child.cat_id is not None for child in children):
+        cat_id = _combine(context.rule, children[0].cat_id, children[1].cat_id)
+    return Derivation(cat_id, context.rule, children, context.i, context.j, score=context.score + filler.score)
+
+
+# a hyperedge of the forest: (rule, the premises the derivation is built from, the key it derives)
+_Edge = Tuple[str, Tuple[ItemKey, ...], Optional[ItemKey]]
+
+
+class _Node:
+    __slots__ = ('edges', 'derivations', 'heap', 'seen', 'last')
+
+    def __init__(self, edges: List[_Edge]):
+        self.edges = edges
+        # (score, edge index, ranks) of the derivations found so far, best first
+        self.derivations: List[Tuple[float, int, Tuple[int, ...]]] = []
+        self.heap = None
+        self.seen = set()
+        # the derivation whose successors are not in the heap yet
+        self.last = None
+
+
+class KBest:
+    """
+    Enumerates the derivations of items of a ParseForest lazily, best first, with algorithm 3 of
+    Huang and Chiang 2005 (Better k-best parsing): every node of the forest keeps the derivations that were
+    asked for so far and a heap of candidates for the next one, so the memory grows with the number of
+    derivations taken and not with the number of derivations of the sentence.
+    A derivation scores the sum of the scores of its leaves, e.g. the log probabilities of a
+    lattice.SupertagBeam; without scores all derivations score 0 and come in forest order.
+    Derivation contexts of fast_ccg are counted as ParseForest.count does (the premise they abstract
+    away is not part of the derivation) and are put back into full trees when they are recombined,
+    so a fast_ccg forest gives as many derivations as it counts.
+    """
+
+    def __init__(self, forest: ParseForest, scores: Optional[Dict[ItemKey, float]] = None,
+                 words: Optional[Sequence[str]] = None):
+        """
+        :param forest: a forest filled by cky_parse or fast_ccg (forest=)
+        :param scores: scores of the lexical items by item key, missing ones score 0
+        :param words: the input tokens, put into the leaves
+        """
+        self.forest = forest
+        self.scores = scores or {}
+        self.words = words
+        self._nodes: Dict[Optional[ItemKey], _Node] = {}
+        self._order = count()
+
+    def _node(self, key: Optional[ItemKey]) -> _Node:
+        node = self._nodes.get(key)
+        if node is None:
+            edges = []
+            for rule, left, right in self.forest.backpointers[key]:
+                if left is None and right is None:
+                    edges.append((rule, (), key))
+                elif right is None:
+                    edges.append((rule, (left,), key))
+                elif rule in CONTEXT_RULES:
+                    edges.append((rule, (right,) if CONTEXT_RULES[rule] == 0 else (left,), key))
+                else:
+                    edges.append((rule, (left, right), key))
+            node = self._nodes[key] = _Node(edges)
+        return node
+
+    def _score(self, edge: _Edge, ranks: Tuple[int, ...]) -> Optional[float]:
+        rule, tails, key = edge
+        if not tails:
+            return self.scores.get(key, 0.0)
+        score = 0.0
+        for tail, rank in zip(tails, ranks):
+            derivation = self._get(tail, rank)
+            if derivation is None:
+                return None
+            score += derivation[0]
+        return score
+
+    def _push(self, node: _Node, index: int, ranks: Tuple[int, ...]):
+        if (index, ranks) in node.seen:
+            return
+        score = self._score(node.edges[index], ranks)
+        if score is not None:
+            node.seen.add((index, ranks))
+            heapq.heappush(node.heap, (-score, next(self._order), index, ranks))
+
+    def _get(self, key: Optional[ItemKey], k: int) -> Optional[Tuple[float, int, Tuple[int, ...]]]:
+        """
+        :return: the k-th best derivation of a key as (score, edge index, ranks of the premises), None if it has fewer
+        """
+        node = self._node(key)
+        while len(node.derivations) <= k:
+            if node.heap is None:
+                node.heap = []
+                for index, (_, tails, _) in enumerate(node.edges):
+                    self._push(node, index, (0,) * len(tails))
+            elif node.last is not None:
+                # the successors of the last derivation: one premise takes its next best derivation
+                index, ranks = node.last
+                for position in range(len(ranks)):
+                    self._push(node, index, ranks[:position] + (ranks[position] + 1,) + ranks[position + 1:])
+            node.last = None
+            if not node.heap:
+                return None
+            score, _, index, ranks = heapq.heappop(node.heap)
+            node.derivations.append((-score, index, ranks))
+            node.last = (index, ranks)
+        return node.derivations[k]
+
+    def _build(self, key: ItemKey, k: int) -> Derivation:
+        score, index, ranks = self._get(key, k)
+        rule, tails, _ = self._node(key).edges[index]
+        category, β, i, i_prime, j_prime, j, _ = key
+        cat_id = category if β == NO_CONTEXT else None
+        if not tails:
+            word = self.words[i] if self.words is not None and i < len(self.words) else None
+            return Derivation(category, rule, (), i, j, word, score)
+        children = [self._build(tail, rank) for tail, rank in zip(tails, ranks)]
+        if rule in PLUG_RULES:
+            filler, context = children
+            derivation = _plug(context, filler)
+            if β == NO_CONTEXT:
+                derivation.cat_id = category
+            return derivation
+        if rule in CONTEXT_RULES:
+            # the premise the context abstracts away is its hole
+            children.insert(CONTEXT_RULES[rule], Derivation(None, None, (), i_prime, j_prime))
+        return Derivation(cat_id, rule, tuple(children), i, j, score=score)
+
+    def derivations(self, items: Iterable[Item]) -> Iterator[Derivation]:
+        """
+        Yields the derivations of the items, best first over all of them.
+        :param items: items of the forest, e.g. parse_items(chart)
+        """
+        keys = list(dict.fromkeys(item_key(item) for item in items))
+        self._nodes[None] = _Node([('goal', (key,), None) for key in keys if key in self.forest.backpointers])
+        k = 0
+        while True:
+            found = self._get(None, k)
+            if found is None:
+                return
+            _, index, ranks = found
+            yield self._build(self._nodes[None].edges[index][1][0], ranks[0])
+            k += 1
+
+
+def parse_items(chart, goal: str = "S") -> List[Item]:
+    """
+    :return: the [S;0,n] items of a chart, the roots of its parses
+    """
+    goal_id = CATEGORIES.intern(goal)
+    n = len(chart)
+    if not n:
+        return []
+    return [item for item in chart[0][n - 1]
+            if not hasattr(item, 'beta_id') and CATEGORIES.matches(item.cat_id, goal_id)]
+
+
+def iter_derivations(forest: ParseForest, items: Iterable[Item], scores: Optional[Dict[ItemKey, float]] = None,
+                     words: Optional[Sequence[str]] = None) -> Iterator[Derivation]:
+    """
+    Yields the derivations of the items one at a time, best first, see KBest.
+
+    >>> from ccg import cky_parse
+    >>> forest = ParseForest()
+    >>> _, chart = cky_parse({"the": "NP/N", "dog": "N", "barks": "S\\\\NP"}, ["the", "dog", "barks"], forest=forest)
+    >>> next(iter_derivations(forest, parse_items(chart), words=["the", "dog", "barks"]))
+    (S (NP (NP/N the) (N dog)) (S\\NP barks))
+    """
+    return KBest(forest, scores, words).derivations(items)
+
+
+def k_best(forest: ParseForest, items: Iterable[Item], k: int, scores: Optional[Dict[ItemKey, float]] = None,
+           words: Optional[Sequence[str]] = None) -> List[Derivation]:
+    """
+    :return: the k best derivations of the items, fewer if there are not that many
+    """
+    return list(islice(iter_derivations(forest, items, scores, words), k))
@@ -1,274 +1,1048 @@
+import sys
 from ccg import Item
-from typing import Self, Optional, Union, List, Dict
-import re
+from categories import CATEGORIES, SLASHES
+from chart import make_chart, CellIndex, ItemKey, append_item, item_key
+from forest import ParseForest
+from goal_filter import GoalFilter, Recognised
+from parse_stats import ParseStats
+from chart_trace import ChartTrace
+from lattice import Lattice, SupertagBeam, make_lattice, lattice_categories
+from rule_cache import RuleCache, apply_rule
+from rule_table import RuleTable, CKY_RULES
+from wavefront import Wavefront
+from typing import Self, Callable, Iterable, Iterator, Optional, Union, List, Dict, Set, Tuple, FrozenSet
 
 
 class KuhlmannItem(Item):
     """
     The type of item introduced in Kuhlmann and Satta 2014 algorithm to avoid exponential runtime.
-    [/Y, β, i, i', j', j]: for any category X, if we can build a derivation tree t' with yield w[i', j'] and type
+    [/Y, β, i, i', j', j]: for any X, if we can build a derivation tree t' with yield w[i', j'] and type
     X/Y, then we can also build the derivation tree t' with yield w[i, j] and type Xβ.
 
-    Similarly, [\\Y, β, i, i', j', j]: for any category X, if we can build a derivation tree t' with yield w[i, j']
-    and type Y\\X, then we can build a derivation tree t' with yield w[i, j] and type βX.
+    Similarly, [\\Y, β, i, i', j', j]: for any X, if we can build a derivation tree t' with yield w[i', j']
+    and type X\\Y, then we can build a derivation tree t' with yield w[i, j] and type Xβ.
+
+    As in the paper X is left open: |Y are the arguments of the hole the rules of the context consumed, and β has
+    at most c_G arguments, a rule that would make it longer starts a new context with the old one as its hole (3).
+    The rules apply the first argument of a category that matches (see categories.CategoryTable.apply), so which
+    argument a rule takes can depend on X. The condition of a context (see intern_condition) holds what X needs:
+    its arity, and the guards of the rules whose argument could also have been found in X.
+    An item [X|Y, i', j'] fills the hole if X meets the condition.
     """
+    __slots__ = ('beta_id', 'i_prime', 'j_prime', 'condition')
 
-    def __init__(self, category: str, β: str, i: int, i_prime: int, j_prime: int, j: int):
+    def __init__(self, category: Union[str, int], β: Union[str, int], i: int, i_prime: int, j_prime: int, j: int,
+                 condition: int):
         super().__init__(category, i, j)
-        self.β = β
+        self.beta_id = β if isinstance(β, int) else CATEGORIES.intern(β)
         self.i_prime = i_prime
         self.j_prime = j_prime
+        self.condition = condition
+
+    @property
+    def β(self) -> str:
+        return CATEGORIES.categories[self.beta_id].string
 
     def __repr__(self):
-        return f"KuhlmannItem({self.category}, {self.β}, {self.i}, {self.i_prime}, {self.j_prime}, {self.j})"
-
-def split_category(category: str) -> List[str]:
-    parts = []
-    stack = []
-    i = 0
-    while i < len(category):
-        if category[i] == '(':
-            stack.append(i)
-        elif category[i] == ')':
-            start = stack.pop()
-            if not stack:  # Top-level parentheses
-                parts.append(category[start + 1:i])
-        elif category[i] in '/\\' and not stack:  # Split at / or \ only at top level
-            parts.append(category[:i])
-            category = category[i + 1:]
-            i = 0
-            continue
-        i += 1
-    if category:
-        parts.append(category)  # Remaining part if no split happens
-    return parts
+        return (f"KuhlmannItem({self.category}, {self.β}, {self.i}, {self.i_prime}, {self.j_prime}, {self.j}, "
+                f"{portable_condition(self.condition)})")
+
+
+class RecombinedItem(Item):
+    """
+    [Xβ, i, j] built by putting an item [X|Y, i', j'] into the hole of a derivation context
+    [|Y, β, i, i', j', j] (5). The context takes every rule Xβ is the functor of, so a recombined item is only
+    ever the argument of a rule, and it is only built once a rule needs it (see ContextIndex.recombined_items).
+    The hole i', j' is kept to tell it apart from an item [Xβ, i, j] that is not built from a context.
+    """
+    __slots__ = ('i_prime', 'j_prime')
+
+    def __init__(self, category: Union[str, int], i: int, i_prime: int, j_prime: int, j: int):
+        super().__init__(category, i, j)
+        self.i_prime = i_prime
+        self.j_prime = j_prime
+
+    def __repr__(self):
+        return f"RecombinedItem({self.category}, {self.i}, {self.i_prime}, {self.j_prime}, {self.j})"
+
+
+# the rules of fast_ccg, see rule_table.COMBINATORS: the functor is on the left, except for backward_crossing
+RULES = ('forward', 'backward', 'backward_crossing')
+
+# (rule, S, A): the rule takes the argument A of XS inside of S, not in X, see guard_holds
+Guard = Tuple[str, int, int]
+
+# the conditions of the derivation contexts by id, (arity of X, guards)
+_CONDITIONS: List[Tuple[int, Tuple[Guard, ...]]] = []
+_CONDITION_IDS: Dict[Tuple[int, Tuple[Guard, ...]], int] = {}
+
+# (rule, S, A) -> the guard of a context that took A with S, if X can take it first (see guard_of)
+_GUARDS: Dict[Guard, Tuple[Guard, ...]] = {}
 
 
-def ccg_extend(left: Item, right: Item, c_G: int) -> Union[None, Item, KuhlmannItem]:
+def intern_condition(arity: int, guards: Iterable[Guard] = ()) -> int:
+    """
+    :param arity: the arity of X
+    :param guards: the guards X has to meet, see guard_holds
+    :return: the id of the condition on the X of the hole of a derivation context
+    """
+    condition = (arity, tuple(sorted(set(guards))))
+    found = _CONDITION_IDS.get(condition)
+    if found is None:
+        found = _CONDITION_IDS[condition] = len(_CONDITIONS)
+        _CONDITIONS.append(condition)
+    return found
+
+
+def portable_condition(condition: int) -> tuple:
+    """
+    :return: the condition with category strings instead of ids, which differ per process
+    """
+    arity, guards = _CONDITIONS[condition]
+    return arity, tuple((rule, CATEGORIES.string(suffix), CATEGORIES.string(argument))
+                        for rule, suffix, argument in guards)
+
+
+def interned_condition(condition: tuple) -> int:
+    """
+    :return: the id of a condition given by portable_condition
+    """
+    arity, guards = condition
+    return intern_condition(arity, ((rule, CATEGORIES.intern(suffix), CATEGORIES.intern(argument))
+                                    for rule, suffix, argument in guards))
+
+
+def match_argument(rule: str, functor: int, argument: int) -> Optional[Tuple[int, int, int, int]]:
+    """
+    :param rule: one of RULES
+    :return: the first argument of the functor the rule finds in the argument, as categories.CategoryTable.apply
+    """
+    category = CATEGORIES[functor]
+    return CATEGORIES.apply(category.forward_args if rule == 'forward' else category.backward_args, argument)
+
+
+def guard_holds(head: int, guard: Guard) -> bool:
+    """
+    :param head: category id of X
+    :return: whether the rule of the guard takes the argument A of XS inside of S
     """
-    Applies the CKY style forward/backward rule if possible, except this checks if the arity
-    of the result is greater than some pre-defined arity
-    :param left: left item in the form [X|Y, i, j]
-    :param right: right item in the form [Yβ, j, k]
+    rule, suffix, argument = guard
+    match = match_argument(rule, CATEGORIES.concat(head, suffix), argument)
+    return match is not None and CATEGORIES[match[0]].arity >= CATEGORIES[head].arity
+
+
+def guard_of(rule: str, suffix: int, argument: int) -> Tuple[Guard, ...]:
+    """
+    :param suffix: category id of S, which the rule took the argument A of
+    :return: the guard XS needs for the rule to take A inside of S, none if no X can make a difference:
+             if A does not start with a longer category than S that ends like it
+    """
+    key = (rule, suffix, argument)
+    found = _GUARDS.get(key)
+    if found is None:
+        categories = CATEGORIES.categories
+        tail = categories[categories[suffix].plain].tokens
+        found = ()
+        for prefix in categories[argument].prefixes:
+            tokens = categories[categories[prefix].plain].tokens
+            if len(tokens) > len(tail) and tokens[len(tokens) - len(tail):] == tail:
+                found = (key,)
+                break
+        _GUARDS[key] = found
+    return found
+
+
+def _shifted_guards(guards: Tuple[Guard, ...], shift: int) -> Optional[Tuple[Guard, ...]]:
+    # the guards on X of a context as guards on X' for X = X'shift, None if shift takes the argument of one of them
+    shifted = []
+    for rule, suffix, argument in guards:
+        suffix = CATEGORIES.concat(shift, suffix)
+        match = match_argument(rule, suffix, argument)
+        if match is None or CATEGORIES[match[0]].arity < CATEGORIES[shift].arity:
+            return None
+        shifted.extend(guard_of(rule, suffix, argument))
+    return tuple(shifted)
+
+
+def _ends_with(tokens: Tuple[str, ...], suffix: Tuple[str, ...]) -> bool:
+    return len(tokens) >= len(suffix) and tokens[len(tokens) - len(suffix):] == suffix
+
+
+def extend_categories(left: int, right: int, c_G: int,
+                      combine: Callable = CKY_RULES.combine) -> Tuple[Tuple[str, int, Optional[int], int], ...]:
+    """
+    The category part of ccg_extend.
+    :param left: category id of the left item
+    :param right: category id of the right item
     :param c_G: arity bound for the grammar G
-    :return: new item in the form [Xβ, i, j] or [|Y, β, i, i, j, k]
-    """
-    category = left.category
-    # We need to get all possible parts, for example: A/B\C/D\F/G then
-    # B\C/D\F/G, D\F/G, G are all possible arguments we can expect with different return types.
-    parts = {category[:x.span()[0]]: category[x.span()[0] + 1:] for x in re.finditer(r'/([^/\\]+)', category)}
-    bwd_parts = {category[:x.span()[0]]: category[x.span()[0] + 1:] for x in re.finditer(r'\\([^/\\]+)', category)}
-    # print(category)
-    # parts = split_category(category)
-    # print(parts)
-    # bwd_parts = {category[:x.span()[0]]: category[x.span()[0] + 1:] for x in re.finditer(r'\\([^/\\]+)', category)}
-
-    parts.update(bwd_parts)
-    for func_type, expected_arg in parts.items():
-        right_category = right.category
-        if right_category.startswith(expected_arg):
-            β = right_category[len(expected_arg):]
-            new_category = f"{func_type}{β}" if β else func_type
-            new_item = Item(new_category, left.i, right.j)  # this is Xβ
-            # count the occurence of / \\ in Xβ
-            # should be [Y, β, i, i', j', j]
-            ar_xβ = new_item.category.count('/') + new_item.category.count('\\')
-            if ar_xβ > c_G:
-                new_item = KuhlmannItem(category[len(func_type)] + expected_arg, β, left.i, left.i, right.i, right.j)
-            return new_item
+    :param combine: the rules, as RuleTable.combine
+    :return: for every rule that applies, (rule, Xβ, None, None) for a regular item or (rule, |Y, β, condition)
+             for a derivation context, where X|Y is the functor of the rule and |Y what it consumed
+    """
+    results = []
+    for rule, category in combine(left, right):
+        # should be [|Y, β, i, i', j', j] if ar(Xβ) exceeds the bound
+        if CATEGORIES[category].arity > c_G:
+            functor, argument = (right, left) if rule == 'backward_crossing' else (left, right)
+            head, _, tail, β = match_argument(rule, functor, argument)
+            results.append((rule, tail, β, intern_condition(CATEGORIES[head].arity, guard_of(rule, tail, argument))))
+        else:
+            results.append((rule, category, None, None))
+    return tuple(results)
 
-    return None
 
+def ccg_extend(left: Item, right: Item, c_G: int, rule_cache: Optional[RuleCache] = None,
+               combine: Callable = CKY_RULES.combine) -> List[Tuple[str, Union[Item, KuhlmannItem]]]:
+    """
+    Applies the CKY style rules to a pair of items, except this checks if the arity of the result is greater than
+    some pre-defined arity (1, 2)
+    :param left: item in the form [X|Y, i, j], or [Yβ, i, j] for backward_crossing
+    :param right: item in the form [Yβ, j, k], or [X|Y, j, k] for backward_crossing
+    :param c_G: arity bound for the grammar G
+    :param rule_cache: optional memo for the category part of the rules, see rule_cache.py
+    :param combine: the rules, as RuleTable.combine
+    :return: (rule, new item) for every rule that applies, the new item in the form [Xβ, i, k]
+             or [|Y, β, i, i', j', k] where i', j' is the span of the functor
+    """
+    return _extended_items(left, right, apply_rule(rule_cache, extend_categories, left.cat_id, right.cat_id, c_G,
+                                                    combine))
 
-# TODO: ccg_backward crossing
-def ccg_backward_crossing(left: Item, right: Union[Item, KuhlmannItem]) -> Union[None, Item, KuhlmannItem]:
-    """
-    Applies the CKY style backward crossing rule if possible.
-    :param left: left item in the form [Yβ, i, j]
-    :param right: right item in the form [X/Y, j, k] OR [/F, X/Y, j, i', j', k]
-    :return: new item in the form [Xβ, i, k] or None if not applicable OR [/F, X, i, i', j', k]
-    """
-    category = right.β if isinstance(right, KuhlmannItem) else right.category
-    # Extract backward-slash components
-    parts = {category[:x.span()[0]]: category[x.span()[0] + 1:] for x in re.finditer(r'\\([^/\\]+)', category)}
-    for func_type, expected_arg in parts.items():
-        right_category = left.category
-        # Check if the left category matches the expected argument
-        if right_category.startswith(expected_arg):
-            β = right_category[len(expected_arg):]
-            new_category = f"{func_type}" if β == "" else f"{func_type}{β}"
-            if isinstance(right, KuhlmannItem):
-                new_item = KuhlmannItem(right.category, new_category, left.i, right.i_prime, right.j_prime, right.j)
-            else:
-                new_item = Item(new_category, left.i, right.j)
-            return new_item
-    return None
+
+def _extended_items(left: Item, right: Item,
+                    categories: Tuple[tuple, ...]) -> List[Tuple[str, Union[Item, KuhlmannItem]]]:
+    # the items of ccg_extend from the results of extend_categories
+    new_items = []
+    for rule, category, β, condition in categories:
+        if β is None:
+            new_items.append((rule, Item(category, left.i, right.j)))
+        else:
+            functor = right if rule == 'backward_crossing' else left
+            new_items.append((rule, KuhlmannItem(category, β, left.i, functor.i, functor.j, right.j, condition)))
+    return new_items
 
 
-def ccg_recombine(left: Item, right: KuhlmannItem, c_G: int) -> Union[None, Item]:
+def ctxt_extend_categories(rule: str, tail: int, β: int, condition: int, argument: int, c_G: int,
+                           max_degree: Optional[int] = None,
+                           shift: Optional[int] = None) -> Optional[Tuple[bool, int, int, int]]:
     """
-    Recombines the original derivation that triggered a KuhlmannItem. (3)
-    :param left: [X|Y, i', j']
-    :param right: [|Y, β, i, i', j', j]
+    The category part of ccg_derivation_ctxt_extend.
+    :param rule: one of RULES
+    :param tail: category id of the |Y of the context
+    :param β: category id of its β
+    :param condition: its condition, see intern_condition
+    :param argument: category id of the argument
     :param c_G: arity bound for the grammar G
-    :return: [Xβ, i, j]
-    """
-    # TODO: Requires a check that ar(Xβ) < c_G (solved?)
-    category = left.category
-    # this rule is a bit different, so we include the directions
-    parts = {category[:x.span()[0]]: category[x.span()[0]:] for x in re.finditer(r'/([^/\\]+)', category)}
-    bwd_parts = {category[:x.span()[0]]: category[x.span()[0]:] for x in re.finditer(r'\\([^/\\]+)', category)}
-    parts.update(bwd_parts)
-    for func_type, expected_arg in parts.items():
-        right_category = right.category
-        if right_category.startswith(expected_arg):
-            β = right_category[len(expected_arg):]
-            new_category = f"{func_type}{β}" if β else func_type
-            new_item = Item(new_category, right.i, right.j)
-            ar_xβ = new_item.category.count('/') + new_item.category.count('\\')
-            if ar_xβ < c_G:
-                return new_item
-    return None  # should never hit this case if checks done properly in algorithm
-
-
-def ccg_derivation_ctxt_extend(left: KuhlmannItem, right: Item, c_G: int) -> Union[None, Item]:
+    :param max_degree: the degree bound of the rules, see rule_table.RuleTable
+    :param shift: category id of the end |W of X = X'|W if the rule takes its argument there, None for β
+    :return: (whether the hole is the context, |Y', β', condition') of the new context, or None if not applicable.
+    """
+    arity, guards = _CONDITIONS[condition]
+    if shift is None:
+        # X|Y β|Z Zγ gives X|Y βγ
+        suffix = β
+        match = match_argument(rule, suffix, argument)
+    else:
+        # X'|W|Y β, |Wβ Wβγ gives X'|W|Y γ
+        suffix = CATEGORIES.concat(shift, β)
+        match = match_argument(rule, suffix, argument)
+        if match is None or match[0] != CATEGORIES.empty:
+            return None
+        arity -= CATEGORIES[shift].arity
+    if match is None:
+        return None
+    β0, _, consumed, γ = match
+    if max_degree is not None and CATEGORIES[γ].arity > max_degree:
+        return None
+    new_β = CATEGORIES.concat(β0, γ)
+    tokens = CATEGORIES[new_β].tokens
+    # Xβγ has to be well formed, as the category of any other item
+    if tokens and tokens[-1] in SLASHES:
+        return None
+    head_arity = arity + CATEGORIES[β0].arity
+    if head_arity + CATEGORIES[γ].arity > c_G:
+        # any item [X'|Z] of the span of the context takes the rule, as an item [X'|Z] would start it (1, 2)
+        return True, consumed, γ, intern_condition(head_arity, guard_of(rule, consumed, argument))
+    if shift is not None:
+        guards = _shifted_guards(guards, shift)
+        if guards is None:
+            return None
+        tail = CATEGORIES.concat(shift, tail)
+    return False, tail, new_β, intern_condition(arity, guards + guard_of(rule, suffix, argument))
+
+
+def ccg_derivation_ctxt_extend(rule: str, context: KuhlmannItem, argument: Item, c_G: int,
+                               rule_cache: Optional[RuleCache] = None, shift: Optional[int] = None,
+                               max_degree: Optional[int] = None) -> Optional[KuhlmannItem]:
     """
     Extends derivation contexts similarly to derivation trees if:
-    - X/Y Zγ -> Xγ
-    :param left: [|Y, β/Z, i, i', j', j]
-    :param right: [Zγ, j, k]
+    - X/Y Zγ -> Xγ (3)
+    the argument is taken from β, or from the end of X if shift is given (see ctxt_extend_categories).
+    If the new β would have more than c_G arguments, a context with this one as its hole is started instead.
+    :param rule: one of RULES, the context is the functor
+    :param context: [|Y, β|Z, i, i', j', j]
+    :param argument: [Zγ, j, k], or [Zγ, h, i] for backward_crossing
     :param c_G: arity bound for the grammar G
-    :param X: untouched part of derivation contex, see equation (4)
-    :return: [|Y, βγ, i, i', j', k] OR [/Z, γ, i, i, j, k]
-    """
-    category = left.β
-    parts = {category[:x.span()[0]]: category[x.span()[0] + 1:] for x in re.finditer(r'/([^/\\]+)', category)}
-    for func_type, expected_arg in parts.items():
-        # we should have something in the form of β and expected arg Z
-        right_category = right.category
-        if right_category.startswith(expected_arg):
-            γ = right_category[len(expected_arg):]
-            new_category = f"{func_type}{γ}" if γ else func_type
-            new_item = KuhlmannItem(left.category, new_category, left.i, left.i_prime, left.j_prime, right.j)
-            ar_Yβγ = left.category.count('/') + left.category.count('\\') + new_item.category.count('/') + new_item.category.count('\\')
-            if ar_Yβγ > c_G:
-                new_item = KuhlmannItem(f"/{expected_arg}", γ, left.i, left.i, right.j, right.j)
-            return new_item
+    :param rule_cache: optional memo for the category part of the rule, see rule_cache.py
+    :param shift: the end of X the argument is taken from, None for β
+    :param max_degree: the degree bound of the rules, see rule_table.RuleTable
+    :return: [|Y, βγ, i, i', j', k], or [|Z, γ, i, i, j, k]
+    """
+    result = apply_rule(rule_cache, ctxt_extend_categories, rule, context.cat_id, context.beta_id, context.condition,
+                        argument.cat_id, c_G, max_degree, shift)
+    if result is None:
+        return None
+    nested, tail, β, condition = result
+    i, j = min(context.i, argument.i), max(context.j, argument.j)
+    if nested:
+        return KuhlmannItem(tail, β, i, context.i, context.j, j, condition)
+    return KuhlmannItem(tail, β, i, context.i_prime, context.j_prime, j, condition)
+
+
+def recombine_categories(filler: int, tail: int, β: int, condition: int) -> Optional[int]:
+    """
+    The category part of ccg_recombine.
+    :param filler: category id of X|Y
+    :param tail: category id of the |Y of the derivation context
+    :param β: category id of its β
+    :param condition: its condition
+    :return: category id of Xβ or None if not applicable.
+    """
+    tokens, tail_tokens = CATEGORIES[filler].tokens, CATEGORIES[tail].tokens
+    if len(tokens) <= len(tail_tokens) or not _ends_with(tokens, tail_tokens):
+        return None
+    head = CATEGORIES.intern_tokens(tokens[:len(tokens) - len(tail_tokens)])
+    arity, guards = _CONDITIONS[condition]
+    if CATEGORIES[head].arity != arity or not all(guard_holds(head, guard) for guard in guards):
+        return None
+    return CATEGORIES.concat(head, β)
+
+
+def ccg_recombine(filler: Item, context: KuhlmannItem,
+                  rule_cache: Optional[RuleCache] = None) -> Union[Item, RecombinedItem, None]:
+    """
+    Recombines a derivation context with a derivation that fills its hole. (5)
+    :param filler: [X|Y, i', j']
+    :param context: [|Y, β, i, i', j', j]
+    :param rule_cache: optional memo for the category part of the rule, see rule_cache.py
+    :return: [Xβ, i, j], a plain item if β is empty
+    """
+    category = apply_rule(rule_cache, recombine_categories, filler.cat_id, context.cat_id, context.beta_id,
+                          context.condition)
+    if category is None:
+        return None
+    if context.beta_id == CATEGORIES.empty:
+        return Item(category, context.i, context.j)
+    return RecombinedItem(category, context.i, context.i_prime, context.j_prime, context.j)
+
+
+def ctxt_recombine_categories(inner_tail: int, inner_β: int, inner_condition: int, tail: int,
+                              condition: int) -> Optional[Tuple[int, int, int]]:
+    """
+    The category part of ccg_derivation_ctxt_recombine.
+    :param inner_tail: category id of the |Y' of the inner context
+    :param inner_β: category id of its β'
+    :param inner_condition: its condition
+    :param tail: category id of the |Y of the outer context, whose β is empty
+    :param condition: its condition
+    :return: (|Y, β, condition) of the context of both, or None if not applicable.
+    """
+    inner_tokens, tokens = CATEGORIES[inner_β].tokens, CATEGORIES[tail].tokens
+    inner_arity, inner_guards = _CONDITIONS[inner_condition]
+    arity, guards = _CONDITIONS[condition]
+    if _ends_with(inner_tokens, tokens):
+        # X'|Y' β0|Y fills [|Y, ε] with X = X'β0
+        β0 = CATEGORIES.intern_tokens(inner_tokens[:len(inner_tokens) - len(tokens)])
+        guards = _shifted_guards(guards, β0)
+        if inner_arity + CATEGORIES[β0].arity != arity or guards is None:
+            return None
+        return inner_tail, β0, intern_condition(inner_arity, inner_guards + guards)
+    if _ends_with(tokens, inner_tokens):
+        # X|W|Y' β' fills [|Wβ', ε] with X' = X|W
+        shift = CATEGORIES.intern_tokens(tokens[:len(tokens) - len(inner_tokens)])
+        inner_guards = _shifted_guards(inner_guards, shift)
+        if inner_arity - CATEGORIES[shift].arity != arity or inner_guards is None:
+            return None
+        return CATEGORIES.concat(shift, inner_tail), CATEGORIES.empty, intern_condition(arity, inner_guards + guards)
     return None
 
 
-def ccg_derivation_ctxt_recombine(left: KuhlmannItem, right: KuhlmannItem, c_G):
+def ccg_derivation_ctxt_recombine(inner: KuhlmannItem, context: KuhlmannItem,
+                                  rule_cache: Optional[RuleCache] = None) -> Optional[KuhlmannItem]:
     """
-    Recombine a derivation context with the context that originally triggered it.
-    :param left: [|_1 Y, β|_2 Z, i'', i', j', j'']
-    :param right: [|_2 Z, ε, i, i'', j'', j]
-    :param c_G: arity bound for the grammar G
-    :return: [|_1, Y, β, i, i', j', j]
+    Recombines a derivation context with a derivation context that fills its hole. (6)
+    :param inner: [|Y', β'|Y, i', i'', j'', j']
+    :param context: [|Y, ε, i, i', j', j]
+    :param rule_cache: optional memo for the category part of the rule, see rule_cache.py
+    :return: [|Y', β', i, i'', j'', j]
     """
-    slash_2 = right.category[0]
-    assert slash_2 in left.β
-    start_idx = left.β.find(slash_2)
-    return KuhlmannItem(left.category, left.β[:start_idx], right.i, left.i_prime, left.j_prime, right.j)
+    result = apply_rule(rule_cache, ctxt_recombine_categories, inner.cat_id, inner.beta_id, inner.condition,
+                        context.cat_id, context.condition)
+    if result is None:
+        return None
+    tail, β, condition = result
+    return KuhlmannItem(tail, β, context.i, inner.i_prime, inner.j_prime, context.j, condition)
 
 
-def compute_artiy_bound(lexicon: Dict[str, str]) -> int:
+class ContextIndex:
+    """
+    The items of the complete cells indexed by the hole of a derivation context they fill, so that
+    recombination is a lookup instead of a search. fillers maps (|Y, a, i', j') to the items [X|Y, i', j'] where X
+    has arity a, which fill the hole of a context [|Y, β, i, i', j', j] (see KuhlmannItem), contexts maps (i', j')
+    to the contexts of the span with a β, whose items [X'β'] fill it if β' and |Y end alike (6).
+    The hole of a context is always a shorter span than the context itself, so only complete cells are looked up.
+    A context is only made into the items it stands for (5) if one of them is the argument of a rule:
+    recombined_items builds them once, heads and shifts tell without building them whether a rule may apply.
+    Without a forest a context is in its cell once per derivation, arguments holds every context of a span once,
+    its items are those of all of its copies.
+    """
+
+    def __init__(self, unary: Optional['UnaryRules'] = None):
+        """
+        :param unary: the unary rules of the parse, the items of a context they may rewrite are built with it
+        """
+        self.fillers: Dict[Tuple[int, int, int, int], List[Item]] = {}
+        self.contexts: Dict[Tuple[int, int], List[KuhlmannItem]] = {}
+        self.arguments: Dict[Tuple[int, int], List[KuhlmannItem]] = {}
+        self.recombined: Dict[ItemKey, List[RecombinedItem]] = {}
+        # the number of recombined items added
+        self.edges = 0
+        self._heads: Dict[ItemKey, FrozenSet[str]] = {}
+        self._ends: Dict[Tuple[ItemKey, int], FrozenSet[Tuple[str, ...]]] = {}
+        self.unary = unary
+        categories = CATEGORIES.categories
+        self._unary = [categories[categories[CATEGORIES.intern(argument)].plain].tokens
+                       for argument, _ in (unary.rules if unary else ())]
+
+    def add_cell(self, cell):
+        """
+        Indexes the items of a complete cell, recombined items fill no hole.
+        """
+        categories = CATEGORIES.categories
+        seen = set()
+        for item in cell:
+            if type(item) is KuhlmannItem:
+                if item.beta_id != CATEGORIES.empty:
+                    self.contexts.setdefault((item.i, item.j), []).append(item)
+                    if item_key(item) not in seen:
+                        seen.add(item_key(item))
+                        self.arguments.setdefault((item.i, item.j), []).append(item)
+            elif type(item) is not RecombinedItem:
+                category = categories[item.cat_id]
+                for head, _, tail in category.forward_args + category.backward_args:
+                    self.fillers.setdefault((tail, categories[head].arity, item.i, item.j), []).append(item)
+
+    def hole_fillers(self, context: KuhlmannItem) -> List[Item]:
+        return self.fillers.get((context.cat_id, _CONDITIONS[context.condition][0], context.i_prime,
+                                 context.j_prime), [])
+
+    def inner_contexts(self, context: KuhlmannItem, copies: bool = False) -> Iterator[Tuple[KuhlmannItem, int]]:
+        """
+        :param copies: every copy of the contexts, instead of each of them once
+        :return: the contexts [|Y', β'] of the hole whose items may fill it, as (context, shift): X = X'β0 for
+                 β' = β0|Y with shift the number of tokens of β0, or X' = X|W for |Y = |Wβ' with shift minus
+                 the number of tokens of |W
+        """
+        tokens = CATEGORIES[context.cat_id].tokens
+        arity = _CONDITIONS[context.condition][0]
+        for inner in (self.contexts if copies else self.arguments).get((context.i_prime, context.j_prime), ()):
+            inner_tokens = CATEGORIES[inner.beta_id].tokens
+            if not (_ends_with(inner_tokens, tokens) or _ends_with(tokens, inner_tokens)):
+                continue
+            # every argument is two tokens, the arities have to add up
+            shift = len(inner_tokens) - len(tokens)
+            if _CONDITIONS[inner.condition][0] + shift // 2 == arity:
+                yield inner, shift
+
+    def heads(self, context: KuhlmannItem) -> FrozenSet[str]:
+        """
+        :return: the result atoms X may start with
+        """
+        key = item_key(context)
+        found = self._heads.get(key)
+        if found is None:
+            categories = CATEGORIES.categories
+            found = {categories[filler.cat_id].head for filler in self.hole_fillers(context)}
+            for inner, _ in self.inner_contexts(context):
+                found.update(self.heads(inner))
+            found = self._heads[key] = frozenset(found)
+        return found
+
+    def ends(self, context: KuhlmannItem, length: int) -> FrozenSet[Tuple[str, ...]]:
+        """
+        :return: the last length tokens X may end with, length is at most twice the arity of X
+        """
+        key = (item_key(context), length)
+        found = self._ends.get(key)
+        if found is None:
+            found = set()
+            tail = len(CATEGORIES[context.cat_id].tokens)
+            for filler in self.hole_fillers(context):
+                tokens = CATEGORIES[filler.cat_id].tokens
+                found.add(tokens[len(tokens) - tail - length:len(tokens) - tail])
+            for inner, shift in self.inner_contexts(context):
+                if shift >= 0:
+                    β0 = CATEGORIES[inner.beta_id].tokens[:shift]
+                    if length <= shift:
+                        found.add(β0[shift - length:])
+                    else:
+                        found.update(end + β0 for end in self.ends(inner, length - shift))
+                else:
+                    end_of_inner = CATEGORIES[context.cat_id].tokens[:-shift]
+                    found.update(end[:length] for end in self.ends(inner, length - shift)
+                                 if end[length:] == end_of_inner)
+            found = self._ends[key] = frozenset(found)
+        return found
+
+    def shifts(self, context: KuhlmannItem, rule: str, argument: int) -> Set[int]:
+        """
+        :return: the ends |W of X = X'|W the rule may take the argument of the context from,
+                 see ctxt_extend_categories
+        """
+        categories = CATEGORIES.categories
+        β = categories[categories[context.beta_id].plain].tokens
+        slash = '/' if rule == 'forward' else '\\'
+        arity = _CONDITIONS[context.condition][0]
+        found = set()
+        for prefix in categories[argument].prefixes:
+            # the argument has to start with W β
+            tokens = categories[categories[prefix].plain].tokens
+            length = len(tokens) - len(β) + 1
+            if length < 2 or length > 2 * arity or not _ends_with(tokens, β):
+                continue
+            for end in self.ends(context, length):
+                if end[0] == slash and categories[categories[CATEGORIES.intern_tokens(end[1:])].plain].tokens == \
+                        tokens[:length - 1]:
+                    found.add(CATEGORIES.intern_tokens(end))
+        return found
+
+    def may_take(self, rule: str, functor: Item, argument: KuhlmannItem, max_degree: Optional[int]) -> bool:
+        """
+        Whether the rule may take an item of the argument context, without building them.
+        :param functor: an item, or a derivation context
+        """
+        categories = CATEGORIES.categories
+        arity = _CONDITIONS[argument.condition][0] + categories[argument.beta_id].arity
+        heads = self.heads(argument)
+        if type(functor) is KuhlmannItem:
+            category = categories[functor.beta_id]
+            β = len(category.tokens)
+            functor_arity = _CONDITIONS[functor.condition][0]
+            # the arguments that start in X, see shifts
+            slash = '/' if rule == 'forward' else '\\'
+            for length in range(2, min(2 * functor_arity, 2 * arity - β + 2) + 1, 2):
+                for end in self.ends(functor, length):
+                    if end[0] == slash and CATEGORIES[CATEGORIES.intern(end[1])].head in heads and (
+                            max_degree is None or arity - length // 2 + 1 - category.arity <= max_degree):
+                        return True
+        else:
+            category = categories[functor.cat_id]
+        for _, suffix, _ in category.forward_args if rule == 'forward' else category.backward_args:
+            if categories[suffix].head in heads and (max_degree is None or
+                                                     arity - categories[suffix].arity <= max_degree):
+                return True
+        return False
+
+    def rewritten(self, context: KuhlmannItem) -> bool:
+        """
+        :return: whether the unary rules may rewrite an item of the context
+        """
+        categories = CATEGORIES.categories
+        β = categories[categories[context.beta_id].plain].tokens
+        return any(len(argument) > len(β) and _ends_with(argument, β) for argument in self._unary)
+
+    def recombined_items(self, context: KuhlmannItem, chart, add: Callable, recombine: Callable,
+                         rule_cache: Optional[RuleCache],
+                         copies: Optional[List[KuhlmannItem]] = None) -> List[RecombinedItem]:
+        """
+        The items [Xβ] of a context with a β, built the first time they are asked for and added to its cell.
+        :param copies: the copies of the context, those indexed by default
+        """
+        key = item_key(context)
+        found = self.recombined.get(key)
+        if found is not None:
+            return found
+        found = self.recombined[key] = []
+        if copies is None:
+            copies = [copy for copy in self.contexts.get((context.i, context.j), ()) if item_key(copy) == key]
+        fillers = list(self.hole_fillers(context))
+        for inner, _ in self.inner_contexts(context):
+            fillers.extend(self.recombined_items(inner, chart, add, recombine, rule_cache))
+        cell = chart[context.i][context.j - 1]
+        for copy in copies:
+            for filler in fillers:
+                new_item = recombine(filler, copy, rule_cache)
+                if new_item is not None and add(cell, new_item, 'recombine', filler, copy):
+                    self.edges += 1
+                    found.append(new_item)
+        return found
+
+
+def compute_artiy_bound(lexicon: Dict[str, str], rules: RuleTable = CKY_RULES,
+                        unary: Optional['UnaryRules'] = None) -> int:
     """
     Computes the arity bound c_G given a lexicon
     As defined in section 5.2 of the paper: c_G >= max{l, a + d}
     where l is the maximum arity of a lexicon entry,
-    a is the maximum arity of an argument 
-    d is the maximum degree of a composition rule
+    a is the maximum arity of an argument
+    d is the maximum degree of a composition rule, taken from the rule table
     :param lexicon: a dictionary mapping tokens (str) to a category (str)
+    :param rules: the combinators of the grammar, see rule_table.RuleTable
+    :param unary: the unary rules of the grammar, their results count as lexical categories
     :return: The arity bound
     """
-    d = max(entry.count('/') + entry.count('\\') for k, entry in lexicon.items())
-    return max(d, d + 1)  # okay so wouldnt it always be a + d??
+    entries = list(lexicon.values())
+    if unary:
+        entries.extend(unary.results())
+    # the arity of the category, a bracketed argument is one argument
+    l = max((CATEGORIES[CATEGORIES.intern(entry)].arity for entry in entries), default=0)
+    # arguments are taken to be of arity 1, without bounded composition this is l + 1 as it always was
+    return max(l, rules.degree(l) + 1)
+
+
+def make_rules(stats: Optional[ParseStats] = None, rules: RuleTable = CKY_RULES) -> Tuple[Callable, ...]:
+    """
+    The rules of fast_ccg in the order _fill_cell expects them.
+    :param stats: if given, the rules are counted and timed into it (see parse_stats.ParseStats)
+    :param rules: the combinators, some of RULES (see rule_table.RuleTable)
+    :return: extend, ctxt_extend, recombine and ctxt_recombine, and the degree bound of the rules
+    """
+    if any(combinator.name not in RULES for combinator in rules.combinators):
+        raise ValueError(f"fast_ccg only has derivation contexts for the rules {list(RULES)}, "
+                         f"got {[combinator.name for combinator in rules.combinators]}")
+    max_degree = rules.max_degree
+
+    def ctxt_extend(rule, context, argument, c_G, rule_cache=None, shift=None):
+        return ccg_derivation_ctxt_extend(rule, context, argument, c_G, rule_cache, shift, max_degree)
+
+    if stats is None:
+        def extend(left, right, c_G, rule_cache=None):
+            return ccg_extend(left, right, c_G, rule_cache, rules.combine)
+
+        return extend, ctxt_extend, ccg_recombine, ccg_derivation_ctxt_recombine, max_degree
+    # every combinator is counted under its name, as in cky_parse. The categories are looked up where they are
+    # without stats, in the rule cache or else in the compiled pairs of the rules, only computed with counted rules
+    counted = rules.counted(stats)
+
+    def counted_categories(left: int, right: int, c_G: int, combine: Callable):
+        return extend_categories(left, right, c_G, counted)
+
+    def extend(left, right, c_G, rule_cache=None):
+        if rule_cache is None:
+            categories = extend_categories(left.cat_id, right.cat_id, c_G, counted)
+        else:
+            misses = rule_cache.misses
+            categories = rule_cache.compute(extend_categories, counted_categories, left.cat_id, right.cat_id, c_G,
+                                            rules.combine)
+            if rule_cache.misses == misses:
+                rules.count_hit(stats, categories)
+        for rule, _, β, _ in categories:
+            # the arity bound turns a plain item into a derivation context
+            if β is not None:
+                stats.rule(rule).arity_rejections += 1
+        return _extended_items(left, right, categories)
+
+    return (extend, stats.wrap('ctxt_extend', ctxt_extend), stats.wrap('recombine', ccg_recombine),
+            stats.wrap('ctxt_recombine', ccg_derivation_ctxt_recombine), max_degree)
+
+
+def _cell_pairs(chart, i: int, k: int, j: int, indexes) -> Iterator[Tuple[int, Item, int, Item]]:
+    # chart.cell_pairs of the plain items with their positions in their cells, which tell apart identical items
+    left_cell, right_cell = chart[i][k], chart[k + 1][j]
+    if indexes is None:
+        right_items = [(position, item) for position, item in enumerate(right_cell) if type(item) is Item]
+        for left_position, left_item in enumerate(left_cell):
+            if type(left_item) is Item:
+                for right_position, right_item in right_items:
+                    yield left_position, left_item, right_position, right_item
+        return
+    right_index = indexes.get((k + 1, j))
+    if right_index is None:
+        right_index = indexes[(k + 1, j)] = CellIndex(right_cell)
+    for left_position, left_item in enumerate(left_cell):
+        if type(left_item) is Item:
+            for right_position in right_index.candidates(left_item):
+                yield left_position, left_item, right_position, right_cell[right_position]
+
+
+def _fill_cell(chart, i: int, j: int, c_G: int, add: Callable, rules: Tuple[Callable, ...],
+               index: ContextIndex, indexes, rule_cache: Optional[RuleCache]) -> Tuple[int, int]:
+    """
+    Fills chart[i][j] from the cells of the shorter spans, the body of the CKY loop of fast_ccg.
+    Every derivation is built in one way only. The functor of a rule is an item, which gives an item or starts a
+    derivation context (1, 2), or a context, which extends it or starts a context with it as its hole (3).
+    The argument is an item, or an item of a context, built from it once it is needed (see ContextIndex).
+    Once the cell is filled its contexts without β are recombined with what fills their hole: the items give
+    items (5), the contexts give contexts (6).
+    :param rules: extend, ctxt_extend, recombine and ctxt_recombine and the degree bound, see make_rules
+    :param index: the complete cells indexed for recombination
+    :return: the number of edges and of KuhlmannItem edges added
+    """
+    extend, ctxt_extend, recombine, ctxt_recombine, max_degree = rules
+    cell = chart[i][j]
+    recombined_edges = index.edges
+    total_edges, num_km_edges = 0, 0
+    # (rule, context, argument): a context started by the items of a span with the same argument is started once,
+    # whichever item or context of the span is its hole
+    started = set()
+
+    def put(rule, new_item, left, right, argument=None, functor=None):
+        # argument tells apart the arguments of the rule, functor is the context that is the functor, if any
+        nonlocal total_edges, num_km_edges
+        if type(new_item) is KuhlmannItem:
+            if functor is not None and (new_item.i_prime, new_item.j_prime) == (functor.i_prime, functor.j_prime):
+                rule = 'ctxt_' + rule
+            else:
+                key = (rule, item_key(new_item), argument)
+                if key in started:
+                    return
+                started.add(key)
+                rule += '_context'
+            if add(cell, new_item, rule, left, right):
+                num_km_edges += 1
+                total_edges += 1
+        elif add(cell, new_item, rule, left, right):
+            total_edges += 1
+
+    def instances(context):
+        return index.recombined_items(context, chart, add, recombine, rule_cache)
+
+    def context_rule(rule, context, argument, identity):
+        # the context is the functor, the argument an item
+        left, right = (argument, context) if rule == 'backward_crossing' else (context, argument)
+        new_item = ctxt_extend(rule, context, argument, c_G, rule_cache)
+        if new_item:
+            put(rule, new_item, left, right, identity, context)
+        for shift in index.shifts(context, rule, argument.cat_id):
+            new_item = ctxt_extend(rule, context, argument, c_G, rule_cache, shift)
+            if new_item:
+                put(rule, new_item, left, right, identity, context)
+
+    def item_rule(rule, functor, context):
+        # the functor is an item, the argument an item of the context
+        if not index.may_take(rule, functor, context, max_degree):
+            return
+        for argument in instances(context):
+            left, right = (argument, functor) if rule == 'backward_crossing' else (functor, argument)
+            for result_rule, new_item in extend(left, right, c_G, rule_cache):
+                if result_rule == rule:
+                    put(rule, new_item, left, right, id(argument))
+
+    def contexts_rule(rule, functor, context):
+        # both are contexts, the argument is an item of the second one
+        if index.may_take(rule, functor, context, max_degree):
+            for argument in instances(context):
+                context_rule(rule, functor, argument, id(argument))
+
+    for k in range(i, j):
+        for left_position, left_item, right_position, right_item in _cell_pairs(chart, i, k, j, indexes):
+            for rule, new_item in extend(left_item, right_item, c_G, rule_cache):
+                argument = (i, k, left_position) if rule == 'backward_crossing' else (k + 1, j, right_position)
+                put(rule, new_item, left_item, right_item, argument)
+        left_contexts, right_contexts = index.contexts.get((i, k + 1), ()), index.contexts.get((k + 1, j + 1), ())
+        if not left_contexts and not right_contexts:
+            continue
+        # a context is the functor of the rules of its items, every copy of it, and their argument through them
+        left_arguments, right_arguments = index.arguments.get((i, k + 1), ()), index.arguments.get((k + 1, j + 1), ())
+        left_items = [(position, item) for position, item in enumerate(chart[i][k]) if type(item) is Item]
+        right_items = [(position, item) for position, item in enumerate(chart[k + 1][j]) if type(item) is Item]
+        for context in left_contexts:
+            for position, item in right_items:
+                for rule in ('forward', 'backward'):
+                    context_rule(rule, context, item, (k + 1, j, position))
+            for other in right_arguments:
+                for rule in ('forward', 'backward'):
+                    contexts_rule(rule, context, other)
+        for context in right_contexts:
+            for position, item in left_items:
+                context_rule('backward_crossing', context, item, (i, k, position))
+            for other in left_arguments:
+                contexts_rule('backward_crossing', context, other)
+        for context in left_arguments:
+            for _, item in right_items:
+                item_rule('backward_crossing', item, context)
+        for context in right_arguments:
+            for _, item in left_items:
+                for rule in ('forward', 'backward'):
+                    item_rule(rule, item, context)
+
+    # recombine the derivation contexts of the cell without β (5, 6)
+    empty = CATEGORIES.empty
+    agenda = [item for item in cell if type(item) is KuhlmannItem and item.beta_id == empty]
+    while agenda:
+        context = agenda.pop()
+        for filler in index.hole_fillers(context):
+            new_item = recombine(filler, context, rule_cache)
+            if new_item:
+                put('recombine', new_item, filler, context)
+        for inner, _ in index.inner_contexts(context, copies=True):
+            new_item = ctxt_recombine(inner, context, rule_cache)
+            if new_item and add(cell, new_item, 'ctxt_recombine', inner, context):
+                num_km_edges += 1
+                total_edges += 1
+                if new_item.beta_id == empty:
+                    agenda.append(new_item)
+    # the unary rules rewrite items as they are added, into the cell they are added to
+    if index.unary:
+        copies = {}
+        for item in cell:
+            if type(item) is KuhlmannItem and item.beta_id != empty and index.rewritten(item):
+                copies.setdefault(item_key(item), []).append(item)
+        for context in copies.values():
+            index.recombined_items(context[0], chart, add, recombine, rule_cache, context)
+    return total_edges + index.edges - recombined_edges, num_km_edges
+
+
+def _portable(item: Optional[Item]) -> Optional[tuple]:
+    # items sent back by a worker carry their category strings, the ids of new categories differ per process
+    if item is None:
+        return None
+    if isinstance(item, KuhlmannItem):
+        return (item.category, item.β, item.i, item.i_prime, item.j_prime, item.j,
+                portable_condition(item.condition))
+    if isinstance(item, RecombinedItem):
+        return item.category, item.i, item.i_prime, item.j_prime, item.j
+    return item.category, item.i, item.j
+
+
+def _from_portable(item: Optional[tuple]) -> Optional[Item]:
+    if item is None:
+        return None
+    if len(item) == 7:
+        return KuhlmannItem(*item[:6], interned_condition(item[6]))
+    if len(item) == 5:
+        return RecombinedItem(*item)
+    return Item(*item)
+
+
+def _fill_wavefront(wavefront: Wavefront, chart, n: int, length: int, c_G: int, add: Callable,
+                    rules: Tuple[Callable, ...], index: ContextIndex, indexes,
+                    rule_cache: Optional[RuleCache], stats: Optional[ParseStats]) -> Iterator[Tuple[int, int]]:
+    """
+    Fills the cells of one span length in parallel (see wavefront.Wavefront), with the same result as _fill_cell
+    on every cell in order: a cell only reads the cells of shorter spans, and the ContextIndex of them.
+    The items the workers found are added to the chart here, in order. The items of a context a worker built are
+    added to the cell of the context, unless they were already built for it.
+    :return: the number of edges and of KuhlmannItem edges of every cell, in order
+    """
+    before = stats.as_dict()['rules'] if stats is not None else {}
+
+    def fill(i):
+        calls = []
+
+        def recording(cell, item, rule, left=None, right=None):
+            calls.append((rule, _portable(item), _portable(left), _portable(right)))
+            return add(cell, item, rule, left, right)
+
+        counts = _fill_cell(chart, i, i + length - 1, c_G, recording, rules, index, indexes, rule_cache)
+        # the rules only counted into the copy of stats of this worker
+        rule_counters = {}
+        if stats is not None:
+            for name, counters in stats.as_dict()['rules'].items():
+                old = before.get(name, {})
+                rule_counters[name] = {counter: value - old.get(counter, 0) for counter, value in counters.items()
+                                       if counter != 'edges'}
+            before.update(stats.as_dict()['rules'])
+        return counts, calls, rule_counters
+
+    for i, (counts, calls, rule_counters) in enumerate(wavefront.map(fill, range(n - length + 1))):
+        cell = chart[i][i + length - 1]
+        # the contexts whose items this worker built, and the number of them built before by another one
+        replayed, built = set(), 0
+        for rule, item, left, right in calls:
+            item, left, right = _from_portable(item), _from_portable(left), _from_portable(right)
+            if type(item) is RecombinedItem:
+                context = item_key(right)
+                if context not in replayed:
+                    if context in index.recombined:
+                        built += 1
+                        continue
+                    replayed.add(context)
+                    index.recombined[context] = []
+                if add(chart[item.i][item.j - 1], item, rule, left, right):
+                    index.edges += 1
+                    index.recombined[context].append(item)
+                continue
+            add(cell, item, rule, left, right)
+        for name, counters in rule_counters.items():
+            rule_stats = stats.rule(name)
+            for counter, value in counters.items():
+                setattr(rule_stats, counter, getattr(rule_stats, counter) + value)
+        yield counts[0] - built, counts[1]
+
+
+
+
+def recombine_chart(chart, forest: ParseForest):
+    """
+    Builds the items of every derivation context of a packed chart of fast_ccg with a β, the parse only builds
+    those that are the argument of a rule. Every item then counts all of its derivations, as in cky_parse.
+    :param chart: the chart of fast_ccg
+    :param forest: its forest
+    """
+    index = ContextIndex()
+    for length in range(1, len(chart) + 1):
+        for i in range(len(chart) - length + 1):
+            index.add_cell(chart[i][i + length - 1])
+    listed = set()
 
-def fast_ccg(lexicon: Dict[str, str], input_tokens: List[str]) -> Optional[Item]:
+    def add(cell, item, rule, left=None, right=None):
+        # the items the parse built are listed as well, without a second backpointer
+        key = item_key(item)
+        if (rule, item_key(left), item_key(right)) not in forest.backpointers.get(key, ()):
+            forest.add(cell, item, rule, left, right)
+        if key in listed:
+            return False
+        listed.add(key)
+        return True
+
+    for contexts in index.arguments.values():
+        for context in contexts:
+            index.recombined_items(context, chart, add, ccg_recombine, None)
+
+
+def fast_ccg(lexicon: Dict[str, str], input_tokens: List[str], chart_backend: str = 'list',
+             rule_cache: Optional[RuleCache] = None,
+             indexed: bool = True,
+             forest: Optional[ParseForest] = None,
+             stats: Optional[ParseStats] = None,
+             trace: Optional[ChartTrace] = None,
+             lattice: Optional[Lattice] = None,
+             beam: Optional[SupertagBeam] = None,
+             wavefront: Optional[Wavefront] = None,
+             goal_filter: Optional[GoalFilter] = None,
+             recognize: bool = False,
+             rules: RuleTable = CKY_RULES,
+             unary: Optional['UnaryRules'] = None,
+             budget: Optional['ParseBudget'] = None) -> Tuple[int, List[List[List[Item]]], int, int]:
     """
-    Parses a sentence from the given lexicon.
-    This algorithm runs in O(N^6), where N is the input length. See section 4.4 of Kuhlmann, Satta 2014
+    Parses a sentence from the given lexicon, with the derivations of cky_parse, each of them built once.
+    The items whose category is longer than c_G are kept as derivation contexts, which leave open all of the
+    category but the arguments their rules consumed and the at most c_G arguments of β (see KuhlmannItem).
+    With a bounded degree of composition (see rule_table.RuleTable) there are then O(N^4) contexts per pair of
+    categories, which are extended and recombined in O(N^6) as in section 4.4 of Kuhlmann, Satta 2014
     :param lexicon: a dictionary mapping tokens (str) to a category (str)
     :param input_tokens: the input words (tokens) to be parsed
-    :return: An Item representing the parse of the entire input, or None if no parse is possible.
+    :param chart_backend: how the chart is stored, see chart.make_chart
+    :param rule_cache: optional memo for rule applications, can be shared across sentences
+    :param indexed: only try pairs of items that share an argument (see chart.CellIndex)
+                    instead of every pair of the two cells
+    :param forest: if given, identical items are merged into this packed forest and the number of
+                   parses is the number of derivations counted over the forest instead of the number of items
+    :param stats: if given, the rules are counted and timed into it (see parse_stats.ParseStats)
+    :param trace: if given, the growth of the chart is recorded into it (see chart_trace.ChartTrace)
+    :param lattice: the categories of every token with their probability (see lattice.py),
+                    used instead of input_tokens if given. c_G is computed from the categories of the lattice
+    :param beam: if given, the categories of the lattice and the items of every cell are pruned by it
+    :param wavefront: if given, the cells of long enough sentences are filled in parallel, one span length
+                      at a time (see wavefront.Wavefront). The result is the same as filling them serially
+    :param goal_filter: if given, items that can not take part in a parse are discarded (see goal_filter.GoalFilter)
+    :param recognize: only find out whether there is a parse: stop as soon as an [S;0,n] item is added,
+                      or if a word has no categories. The number of parses is then 1 or 0 and the chart is partial.
+                      Identical items are merged as with a forest and no derivation contexts are built,
+                      see bitset_ccg.bitset_parse for a faster recogniser
+    :param rules: the combinators to use (see rule_table.RuleTable), some of RULES, a ValueError is raised otherwise
+    :param unary: if given, every new item is rewritten by these unary rules (see unary_rules.UnaryRules),
+                  derivation contexts are not, the items of a context they may rewrite are built with it
+    :param budget: if given, the parse stops with a budget.BudgetExceeded once it stores more edges or bytes
+                   than the budget allows, its peak_bytes and edges tell what the parse took
+    :return: the number of [S;0,n] items (parses) and the chart, like cky_parse, then the number of edges
+             added to the chart and how many of them are KuhlmannItem edges
     """
-    n = len(input_tokens)
-    chart = [[[] for _ in range(n)] for _ in range(n)]
+    if lattice is None:
+        lattice = make_lattice(lexicon, input_tokens)
+    n = len(lattice)
+    chart = make_chart(n, chart_backend)
+    goal = CATEGORIES.intern("S")
+    if recognize and forest is None:
+        # derivations are not counted, identical items are merged so that they are not combined again
+        forest = ParseForest()
+    add = append_item if forest is None else forest.add
+    if budget is not None:
+        budget.begin(chart, forest is not None)
+        add = budget.wrap_add(add)
+    if goal_filter is not None:
+        goal_filter.check_rules(rules)
+        add = goal_filter.wrap_add(add, n)
+    # the categories of the sentence, not of the whole lexicon. Derivation contexts only share derivations,
+    # so there are none when the derivations are not counted
+    c_G = sys.maxsize if recognize else compute_artiy_bound(lattice_categories(lattice), rules, unary)
+    rules = make_rules(stats, rules)
+    if stats is not None:
+        stats.sentences += 1
+        add = stats.wrap_add(add)
+    if beam is not None:
+        beam.begin()
+        add = beam.wrap_add(add)
+    if recognize:
+        add = GoalFilter.stop_at_goal(add, goal, n)
+    if unary:
+        add = unary.wrap_add(add)
 
-    # c_G = compute_arity_bound(lexicon)
-    c_G = compute_artiy_bound(lexicon)
-    # print(c_G)
 
     # Parse axioms CKY style
-    for j in range(n):
-        word = input_tokens[j]
-        if word in lexicon:
-            category = lexicon[word]
-            chart[j][j].append(Item(category, j, j + 1))
-
-    derivation_contexts = {}
+    if trace is not None:
+        trace.begin('fast_ccg', n)
+        trace.begin_span(1)
+    indexes = {} if indexed else None
     # track number of edges
     total_edges, num_km_edges = 0, 0
-    for length in range(2, n + 1):
-        for i in range(n - length + 1):
-            j = i + length - 1
-            for k in range(i, j):
-                for left_item in chart[i][k]:
-                    for right_item in chart[k + 1][j]:
-                        new_derivation_ctxt = None      
-                        # Check if you can apply the rules
-                        # this rule should only be applied in case of KulhmannItem
-                        new_item = ccg_extend(left_item, right_item, c_G)
-                        # print(new_item, left_item, right_item)
-                        if (new_item and new_item.category and new_item.category[0] not in {'\\', '/'}
-                                and new_item.category[-1] not in {'\\', '/'}):
-                            chart[i][j].append(new_item)
-                            total_edges += 1
-
-                        # check if derivation ctxt
-                        if isinstance(new_item, KuhlmannItem):
-                            derivation_contexts.setdefault(new_item.category, left_item)
-                            chart[i][j].append(new_item)
-                            num_km_edges += 1
-                            total_edges += 1
-                            new_derivation_ctxt = new_item
-
-                        # check if you can apply backward crossing
-                        new_item = ccg_backward_crossing(left_item, right_item)
-                        if (new_item and new_item.category and new_item.category[0] not in {'\\', '/'}
-                                and new_item.category[-1] not in {'\\', '/'}):
-                            chart[i][j].append(new_item)
-                            total_edges += 1
-                        elif isinstance(new_item, KuhlmannItem):
-                            chart[i][j].append(new_item)
-                            new_derivation_ctxt = new_item
-                            num_km_edges += 1
-                            total_edges += 1
-
-                        # check if you can extend a derivation context:
-                        if isinstance(left_item, KuhlmannItem) and isinstance(right_item, Item):
-                            new_item = ccg_derivation_ctxt_extend(left_item, right_item, c_G)
-                            if isinstance(new_item, KuhlmannItem) and new_item.category:
-                                chart[i][j].append(new_item)
-                                new_derivation_ctxt = new_item
-                                num_km_edges += 1
-                                total_edges += 1
-
-                        # naively check if derivation ctxt can be recombined
-                        # TODO, rule 6
-                        if new_derivation_ctxt and new_derivation_ctxt.β == '':
-                            if new_derivation_ctxt.category in derivation_contexts:
-                                left_ctxt = derivation_contexts[new_derivation_ctxt.category]
-                                new_item = ccg_recombine(left_ctxt, new_derivation_ctxt, c_G)
-                                if new_item and new_item.category:
-                                    if isinstance(new_item, KuhlmannItem):
-                                        num_km_edges += 1
-                                        num_edges += 1
-                                    chart[i][j].append(new_item)
+    recognised = False
+    try:
+        for j, tags in enumerate(lattice):
+            if beam is not None:
+                tags = beam.prune_tags(tags)
+            for category, probability in tags:
+                item = Item(category, j, j + 1)
+                if beam is not None:
+                    beam.axiom(item, probability)
+                add(chart[j][j], item, 'lexicon')
+        index = ContextIndex(unary)
+        for j in range(n):
+            index.add_cell(chart[j][j])
+        if trace is not None:
+            for j in range(n):
+                trace.cell(j, j, chart[j][j])
+            trace.end_span(1)
+
+        # a word without categories can not be covered, so there is nothing left to recognise
+        last = n if not recognize or all(len(chart[j][j]) for j in range(n)) else 1
+        for length in range(2, last + 1):
+            if trace is not None:
+                trace.begin_span(length)
+            if wavefront is not None and wavefront.use_pool(chart, n, length):
+                counts = _fill_wavefront(wavefront, chart, n, length, c_G, add, rules, index, indexes, rule_cache,
+                                         stats)
+            else:
+                counts = (_fill_cell(chart, i, i + length - 1, c_G, add, rules, index, indexes, rule_cache)
+                          for i in range(n - length + 1))
+            for i, (edges, km_edges) in enumerate(counts):
+                j = i + length - 1
+                total_edges += edges
+                num_km_edges += km_edges
+                if beam is not None:
+                    beam.prune_cell(chart[i][j])
+                index.add_cell(chart[i][j])
+                if trace is not None:
+                    trace.cell(i, j, chart[i][j])
+            if trace is not None:
+                trace.end_span(length)
+    except Recognised:
+        recognised = True
+    finally:
+        if budget is not None:
+            budget.end()
 
     # Look for a complete parse item [S;0,n]
     # print(chart)
-    return sum(1 for item in chart[0][n - 1] if item.category == "S"), chart, total_edges, num_km_edges
+    if recognize:
+        num_parses = int(recognised)
+    elif forest is not None:
+        num_parses = forest.count_items(item for item in chart[0][n - 1] if CATEGORIES.matches(item.cat_id, goal))
+    else:
+        num_parses = sum(1 for item in chart[0][n - 1] if CATEGORIES.matches(item.cat_id, goal))
+    if trace is not None:
+        trace.end(num_parses)
+    return num_parses, chart, total_edges, num_km_edges
     # for item in chart[0][n - 1]:
     #     if item.category == "S":
     #         return item
@@ -299,24 +1073,25 @@ def fast_ccg(lexicon: Dict[str, str], input_tokens: List[str]) -> Optional[Item]
 
 
 #
-lexicon = {
-    "w1": "A",
-    "w2": "B",
-    "w3": r"C\A/F",
-    "w4": r"S/E",
-    "w5": r"E/H\C",
-    "w6": r"F/G\B",
-    "w7": "G",
-    "w8": "H"
-}
-
-input_tokens = [f"w{i}" for i in range(1, 9)]
-parsed_item = fast_ccg(lexicon, input_tokens)
-
-if parsed_item:
-    print("Parsed Item:", parsed_item)
-else:
-    print("No valid parse found.")
+if __name__ == "__main__":
+    lexicon = {
+        "w1": "A",
+        "w2": "B",
+        "w3": r"C\A/F",
+        "w4": r"S/E",
+        "w5": r"E/H\C",
+        "w6": r"F/G\B",
+        "w7": "G",
+        "w8": "H"
+    }
+
+    input_tokens = [f"w{i}" for i in range(1, 9)]
+    parsed_item = fast_ccg(lexicon, input_tokens)
+
+    if parsed_item:
+        print("Parsed Item:", parsed_item)
+    else:
+        print("No valid parse found.")
 
 #
 # lexicon = {
@@ -0,0 +1,102 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+from ccg import Item
+from chart import ItemKey, item_key
+
+# (rule, left child, right child); axioms have no children
+Backpointer = Tuple[str, Optional[ItemKey], Optional[ItemKey]]
+
+# Rules that start a derivation context [|Y, β, i, i', j', j], with the child that is its hole (0 left, 1 right):
+# the functor X|Y is abstracted away and only put back (and counted) when the context is recombined.
+CONTEXT_RULES = {'forward_context': 0, 'backward_context': 0, 'backward_crossing_context': 1}
+
+
+class ParseForest:
+    """
+    A packed parse forest. Identical items of a cell are stored once and carry a list of
+    (rule, left child, right child) backpointers, one for every way the item was built.
+    Passing a ParseForest to cky_parse or fast_ccg turns on packing: a duplicate item only
+    adds a backpointer instead of a new chart entry, so it is not combined again.
+    """
+
+    def __init__(self):
+        self.backpointers: Dict[ItemKey, List[Backpointer]] = {}
+        self._counts: Dict[ItemKey, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.backpointers)
+
+    def __contains__(self, item: Item) -> bool:
+        return item_key(item) in self.backpointers
+
+    def add(self, cell, item: Item, rule: str, left: Optional[Item] = None, right: Optional[Item] = None) -> bool:
+        """
+        Adds an item to a chart cell unless the cell already holds an identical one,
+        and records how it was derived.
+        :param cell: the chart cell the item belongs to
+        :param item: the new item
+        :param rule: the name of the rule that built it
+        :param left: the left premise, None for axioms
+        :param right: the right premise, None for axioms
+        :return: True if the item is new, False if only a backpointer was added
+        """
+        key = item_key(item)
+        backpointers = self.backpointers.get(key)
+        is_new = backpointers is None
+        if is_new:
+            backpointers = self.backpointers[key] = []
+            cell.append(item)
+        backpointers.append((rule, None if left is None else item_key(left), None if right is None else item_key(right)))
+        self._counts.clear()
+        return is_new
+
+    def clear(self):
+        self.backpointers.clear()
+        self._counts.clear()
+
+    def num_backpointers(self) -> int:
+        return sum(len(backpointers) for backpointers in self.backpointers.values())
+
+    def count(self, item: Item) -> int:
+        """
+        Counts the derivations of an item by dynamic programming over the forest,
+        every node and backpointer is visited once. The hole of a derivation context (see CONTEXT_RULES)
+        is counted when the context is recombined, so the counts of fast_ccg are those of cky_parse,
+        see benchmark.check_parsers.
+        :param item: an item of the forest
+        :return: the number of derivations, 0 if the item is not in the forest
+        """
+        key = item_key(item)
+        if key not in self.backpointers:
+            return 0
+        counts = self._counts
+        # post-order traversal with an explicit stack, derivations can be deeper than the recursion limit
+        stack = [(key, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if node in counts:
+                continue
+            if expanded:
+                total = 0
+                for rule, left, right in self.backpointers[node]:
+                    derivations = 1
+                    hole = CONTEXT_RULES.get(rule)
+                    if left is not None and hole != 0:
+                        derivations *= counts[left]
+                    if right is not None and hole != 1:
+                        derivations *= counts[right]
+                    total += derivations
+                counts[node] = total
+                continue
+            stack.append((node, True))
+            for _, left, right in self.backpointers[node]:
+                for child in (left, right):
+                    if child is not None and child not in counts:
+                        stack.append((child, False))
+        return counts[key]
+
+    def count_items(self, items: Iterable[Item]) -> int:
+        """
+        :return: the total number of derivations of distinct items, e.g. all [S, 0, n] items
+        """
+        keys = {item_key(item): item for item in items}
+        return sum(self.count(item) for item in keys.values())
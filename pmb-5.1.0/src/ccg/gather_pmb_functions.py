@@ -1,5 +1,5 @@
 import re
-import os
+from pmb_reader import read_corpus
 
 
 def extract_function_types(prolog_code: str):
@@ -25,25 +25,13 @@ def traverse_directory_for_function_types(directory_path: str):
     all_function_types = set()
     sample_files = {}
 
-    # print(directory_path)
-    for root, dirs, files in os.walk(directory_path):
-        # print(files)
-        for file in files:
-            # print(file)
-            if file.endswith(".ccg"):
-                # print('ok', all_function_types)
-                file_path = os.path.join(root, file)
-                with open(file_path, "r") as f:
-                    prolog_code = f.read()
-                    function_types = extract_function_types(prolog_code)
-                    if len(all_function_types.difference(function_types)) > 0:
-                        difference = [x for x in function_types.difference(all_function_types)]
-                        # print(all_function_types)
-                        # print(function_types)
-                        # print(difference)
-                        for diff in difference:
-                            sample_files[diff] = file
-                    all_function_types.update(function_types)
+    for record in read_corpus(directory_path):
+        function_types = record.rules
+        if len(all_function_types.difference(function_types)) > 0:
+            difference = [x for x in function_types.difference(all_function_types)]
+            for diff in difference:
+                sample_files[diff] = record.file
+        all_function_types.update(function_types)
 
     return all_function_types, sample_files
 
@@ -54,6 +42,7 @@ def traverse_directory_for_function_types(directory_path: str):
 # dutch has generalized foward crossing
 directory_path = "/Users/paulhe/Desktop/CCG Parsing/pmb-5.1.0/src/ccg/it_ccg"
 
-function_types, difference_dict = traverse_directory_for_function_types(directory_path)
-print("Function types found:", function_types)
-print("Example of each rule:", difference_dict)
+if __name__ == "__main__":
+    function_types, difference_dict = traverse_directory_for_function_types(directory_path)
+    print("Function types found:", function_types)
+    print("Example of each rule:", difference_dict)
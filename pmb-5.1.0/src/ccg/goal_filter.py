@@ -0,0 +1,163 @@
+from typing import Callable, Dict, Iterable, List, Optional, Set
+from bitset_ccg import BitsetGrammar
+from categories import CATEGORIES, SLASHES, head_atom
+from rule_table import RuleTable, CKY_RULES
+
+
+class Recognised(Exception):
+    """
+    Raised by the add function of GoalFilter.stop_at_goal once a goal item is in the chart.
+    """
+
+
+class GoalFilter:
+    """
+    Top-down reachability: which categories can take part in a derivation of the goal (S) over the whole span.
+    Computed once from the categories of a lexicon and shared by all sentences over it.
+    If the lexicon is closed (see bitset_ccg.BitsetGrammar.close) these are exactly the categories that are
+    one side of a rule application that leads to the goal. Otherwise the result atom is checked instead:
+    a derived category returns the result atom of its functor, so an item can only be useful if its
+    result atom is the goal, or follows a slash in a lexical category (it can be consumed as an argument).
+    The rules that are not argument driven (conj, lp and rp) keep the result atom of one side, the atom of the
+    other side (CONJ or the punctuation) is then useful too.
+    On top of that, the cell of the whole sentence only keeps goal items, since nothing combines with them.
+    Pass one as goal_filter= to cky_parse or fast_ccg; the number of parses stays the same.
+    Derivation contexts are not filtered, only plain items.
+    A parser needs a filter over the same rules: the same rule table, and the same unary rules, an item is then
+    useful if what it is rewritten into is.
+
+    >>> from ccg import cky_parse
+    >>> rules = RuleTable(('forward', 'backward', 'backward_crossing', 'conj'))
+    >>> lexicon = {'john': 'NP', 'and': 'CONJ', 'mary': 'NP', 'sleep': 'S\\\\NP'}
+    >>> tokens = ['john', 'and', 'mary', 'sleep']
+    >>> goal_filter = GoalFilter(lexicon.values(), rules=rules)
+    >>> cky_parse(lexicon, tokens, rules=rules)[0], cky_parse(lexicon, tokens, rules=rules, goal_filter=goal_filter)[0]
+    (2, 2)
+    """
+
+    def __init__(self, categories: Iterable[str], goal: str = "S", max_categories: int = 256,
+                 unary: Optional['UnaryRules'] = None, rules: RuleTable = CKY_RULES):
+        """
+        :param categories: the lexical categories, e.g. lexicon.values()
+        :param goal: the category of a complete parse
+        :param max_categories: the lexicon is only closed if it derives at most this many categories
+        :param unary: the unary rules of the parser, see unary_rules.UnaryRules
+        :param rules: the combinators of the parser, see rule_table.RuleTable
+        """
+        categories = list(categories)
+        self.goal = CATEGORIES.intern(goal)
+        self.unary = unary
+        self.rules = rules
+        self.discarded = 0
+        # category id -> whether its items are kept below the cell of the whole sentence, filled as they are seen
+        self._kept: Dict[int, bool] = {}
+        # ids of the useful categories if the lexicon closes, else None
+        self.useful: Optional[Set[int]] = None
+        grammar = BitsetGrammar(categories, rules=rules, unary=unary)
+        try:
+            grammar.close(max_categories)
+        except ValueError:
+            pass
+        else:
+            useful = grammar.useful(goal)
+            self.useful = {cat_id for bit, cat_id in enumerate(grammar.ids) if useful >> bit & 1}
+        # result atoms are compared without features
+        self.atoms = {CATEGORIES[self.goal].head}
+        if unary:
+            categories.extend(unary.results())
+        for category in categories:
+            tokens = CATEGORIES[CATEGORIES.intern(category)].tokens
+            self.atoms.update(head_atom(atom) for slash, atom in zip(tokens, tokens[1:]) if slash in SLASHES)
+        if self.useful is None:
+            self.atoms.update(self._consumed_atoms(categories))
+        # whether every category the lexicon derives is kept, e.g. for benchmark.composition_family:
+        # a derived category has the result atom of a lexical one
+        if self.useful is not None:
+            self.keeps_all = len(self.useful) == len(grammar)
+        else:
+            self.keeps_all = all(CATEGORIES[CATEGORIES.intern(category)].head in self.atoms for category in categories)
+
+    def check_rules(self, rules: RuleTable):
+        """
+        Raises a ValueError if a parser does not use the rule table the filter was built over:
+        the items of a rule the filter does not know would be discarded.
+        """
+        if (rules.combinators, rules.max_degree) != (self.rules.combinators, self.rules.max_degree):
+            raise ValueError(f"the goal filter is built over the rules {[c.name for c in self.rules.combinators]}, "
+                             f"the parser uses {[c.name for c in rules.combinators]}")
+
+    def _consumed_atoms(self, categories: List[str]) -> Set[str]:
+        # the result atoms of the lexical categories a rule that is not argument driven drops, e.g. CONJ:
+        # CONJ and X give X\(X), whose result atom is the one of X. Tried on every pair of them
+        ids = {CATEGORIES.intern(category) for category in categories}
+        atoms = set()
+        for combinator in self.rules.combinators:
+            if combinator.argument_driven:
+                continue
+            for left in ids:
+                for right in ids:
+                    result = combinator.rule(left, right)
+                    if result is not None:
+                        head = CATEGORIES[result[0]].head
+                        atoms.update(CATEGORIES[side].head for side in (left, right) if CATEGORIES[side].head != head)
+        return atoms
+
+    def _rewrites(self, item) -> Iterable[int]:
+        # the item and what the unary rules rewrite it into
+        return (item.cat_id, *self.unary.closure(item.cat_id)) if self.unary else (item.cat_id,)
+
+    def keeps(self, item, n: int) -> bool:
+        """
+        :param item: an item (contexts are always kept)
+        :param n: the length of the sentence
+        :return: whether the item can take part in a derivation of [goal;0,n]
+        """
+        if hasattr(item, 'beta_id'):
+            return True
+        if item.i == 0 and item.j == n:
+            return any(CATEGORIES.matches(category, self.goal) for category in self._rewrites(item))
+        kept = self._kept.get(item.cat_id)
+        if kept is None:
+            kept = self._kept[item.cat_id] = self._keeps_category(item)
+        return kept
+
+    def _keeps_category(self, item) -> bool:
+        # only depends on the category of the item
+        if self.useful is not None:
+            return item.cat_id in self.useful
+        if not self.unary:
+            return CATEGORIES[item.cat_id].head in self.atoms
+        categories = CATEGORIES.categories
+        return any(categories[category].head in self.atoms for category in self._rewrites(item))
+
+    def wrap_add(self, add: Callable, n: int) -> Callable:
+        """
+        Wraps the function a parser adds items with, to discard the items that are not kept.
+        If the filter keeps all categories add is returned as it is, the items of the cell of the whole sentence
+        that are not goal items are then kept too: nothing is combined with them, the parse stays the same.
+        """
+        if self.keeps_all:
+            return add
+        kept = self._kept
+        keeps = self.keeps
+
+        def filtered(cell, item, rule, left=None, right=None):
+            # below the cell of the whole sentence the items of a kept category need no other check
+            if not kept.get(item.cat_id) or (item.i == 0 and item.j == n):
+                if not keeps(item, n):
+                    self.discarded += 1
+                    return False
+            return add(cell, item, rule, left, right)
+        return filtered
+
+    @staticmethod
+    def stop_at_goal(add: Callable, goal: int, n: int) -> Callable:
+        """
+        Wraps the function a parser adds items with, to raise Recognised as soon as [goal;0,n] is added.
+        """
+        def stopping(cell, item, rule, left=None, right=None):
+            is_new = add(cell, item, rule, left, right)
+            if item.i == 0 and item.j == n and CATEGORIES.matches(item.cat_id, goal) and not hasattr(item, 'beta_id'):
+                raise Recognised
+            return is_new
+        return stopping
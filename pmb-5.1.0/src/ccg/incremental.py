@@ -0,0 +1,179 @@
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+from categories import CATEGORIES
+from ccg import Item
+from chart import make_chart, grow_chart, append_item
+from fast_ccg import ContextIndex, compute_artiy_bound, make_rules, _fill_cell
+from forest import ParseForest
+from goal_filter import GoalFilter
+from lattice import Tag, make_lattice
+from parse_stats import ParseStats
+from rule_cache import RuleCache
+from rule_table import CKY_RULES
+from unary_rules import UnaryRules
+
+# what add_token accepts as the categories of a word: one category, several, or (category, probability) pairs
+Categories = Union[str, Sequence[str], Sequence[Tag]]
+
+
+class IncrementalParser:
+    """
+    fast_ccg for words that arrive one at a time. Every word adds a column to the chart and only the new cells
+    [i, n] are filled, right to left, from the cells that are already there, so the work for all prefixes of a
+    sentence is the work of one fast_ccg parse of the whole sentence, and the chart after the last word is the
+    chart fast_ccg would build.
+    The arity bound c_G is given, or computed from the categories seen so far as fast_ccg computes it from those of
+    the sentence. In the last case a word with a longer category raises the bound, and the chart is refilled for it.
+
+    >>> parser = IncrementalParser({"the": "NP/N", "dog": "N", "barks": "S\\\\NP"})
+    >>> for word in ["the", "dog", "barks"]:
+    ...     parser.add_token(word)
+    >>> parser.complete(), parser.num_parses()
+    (True, 1)
+
+    The lexicon does not bound the arity of the categories add_token is given:
+
+    >>> parser = IncrementalParser({"x": "S"})
+    >>> for category in ["S\\\\A/A", "A/B", "B", "A/B\\\\A", "A/B"]:
+    ...     parser.add_token("w", category)
+    >>> parser.num_parses(), parser.c_G, parser.refills
+    (1, 3, 1)
+    """
+
+    def __init__(self, lexicon: Optional[Dict[str, str]] = None, c_G: Optional[int] = None,
+                 chart_backend: str = 'list',
+                 rule_cache: Optional[RuleCache] = None,
+                 indexed: bool = True,
+                 forest: Optional[ParseForest] = None,
+                 stats: Optional[ParseStats] = None,
+                 goal_filter: Optional[GoalFilter] = None,
+                 unary: Optional[UnaryRules] = None):
+        """
+        :param lexicon: used for the words add_token gets no categories for
+        :param c_G: the arity bound, see fast_ccg.compute_artiy_bound. Fixed if given, raised by the words otherwise
+        :param chart_backend: how the chart is stored, see chart.make_chart
+        :param rule_cache: optional memo for rule applications, can be shared across sentences
+        :param indexed: only try pairs of items that share an argument, see fast_ccg
+        :param forest: if given, identical items are merged into this packed forest, see fast_ccg
+        :param stats: if given, the rules are counted and timed into it (see parse_stats.ParseStats)
+        :param goal_filter: if given, items that can not take part in a parse are discarded. The length of the
+                            sentence is not known, so the cell of the whole prefix keeps more than S items
+        :param unary: if given, every new item is rewritten by these unary rules, see fast_ccg
+        """
+        self.lexicon = lexicon
+        self.fixed_bound = c_G is not None
+        self.unary = unary
+        self.c_G = compute_artiy_bound({}, unary=unary) if c_G is None else c_G
+        self.chart_backend = chart_backend
+        self.rule_cache = rule_cache
+        self.indexed = indexed
+        self.forest = forest
+        self.stats = stats
+        self.goal_filter = goal_filter
+        self.goal = CATEGORIES.intern("S")
+        # number of times the chart was refilled for a larger c_G
+        self.refills = 0
+        if stats is not None:
+            stats.sentences += 1
+        self._reset()
+
+    def _reset(self):
+        self.tags: List[List[Tag]] = []
+        self.chart = make_chart(0, self.chart_backend)
+        self.total_edges = 0
+        self.num_km_edges = 0
+        self._index = ContextIndex(self.unary)
+        self._indexes = {} if self.indexed else None
+        # covered[k]: w[0..k) is a sequence of non-empty cells, so a parse of a longer sentence can still start so
+        self._covered = [True]
+        add = append_item if self.forest is None else self.forest.add
+        if self.goal_filter is not None:
+            self.goal_filter.check_rules(CKY_RULES)
+            add = self.goal_filter.wrap_add(add, None)
+        self._rules = make_rules(self.stats)
+        if self.stats is not None:
+            add = self.stats.wrap_add(add)
+        if self.unary:
+            add = self.unary.wrap_add(add)
+        self._add = add
+
+    def __len__(self) -> int:
+        return len(self.tags)
+
+    def add_token(self, word: str, categories: Optional[Categories] = None):
+        """
+        Extends the parse by one word and fills the cells ending at it.
+        :param word: the next word
+        :param categories: its categories, a category string, a list of them, or (category, probability) pairs.
+                           Looked up in the lexicon if not given, a word that is not in it gets no categories
+        """
+        if categories is None:
+            tags = make_lattice(self.lexicon or {}, [word])[0]
+        elif isinstance(categories, str):
+            tags = [(categories, 1.0)]
+        else:
+            tags = [(tag, 1.0) if isinstance(tag, str) else tuple(tag) for tag in categories]
+
+        if not self.fixed_bound:
+            c_G = max(self.c_G, compute_artiy_bound({category: category for category, _ in tags}) if tags else 0)
+            if c_G > self.c_G:
+                # the cells that are there were filled under the smaller bound
+                self.c_G = c_G
+                self.refills += 1
+                words = self.tags
+                if self.forest is not None:
+                    self.forest.clear()
+                self._reset()
+                for old_tags in words:
+                    self._extend(old_tags)
+        self._extend(tags)
+
+    def _extend(self, tags: List[Tag]):
+        chart = self.chart
+        n = len(self.tags)
+        self.tags.append(tags)
+        grow_chart(chart)
+        add, index = self._add, self._index
+        for category, _ in tags:
+            add(chart[n][n], Item(category, n, n + 1), 'lexicon')
+        index.add_cell(chart[n][n])
+
+        # every cell [i, n] only needs the cells [i, k] of earlier words and [k + 1, n] with k >= i
+        for i in range(n - 1, -1, -1):
+            edges, km_edges = _fill_cell(chart, i, n, self.c_G, add, self._rules, index, self._indexes,
+                                         self.rule_cache)
+            self.total_edges += edges
+            self.num_km_edges += km_edges
+            index.add_cell(chart[i][n])
+        self._covered.append(any(self._covered[i] and len(chart[i][n]) for i in range(n + 1)))
+
+    def complete(self) -> bool:
+        """
+        :return: whether the words so far are a sentence, i.e. there is an [S;0,n] item
+        """
+        return next(self._goal_items(), None) is not None
+
+    def viable(self) -> bool:
+        """
+        Whether the words so far can still be the start of a sentence: the maximal subtrees of a parse that lie
+        within the prefix are items of non-empty cells that follow each other from 0 to n. Without a goal filter
+        this only fails if a word has no categories, with one cells only keep items that can lead to S.
+        """
+        return self._covered[-1]
+
+    def _goal_items(self):
+        n = len(self.tags)
+        return (item for item in self.chart[0][n - 1] if CATEGORIES.matches(item.cat_id, self.goal)) if n else iter(())
+
+    def num_parses(self) -> int:
+        """
+        :return: the number of [S;0,n] items, or of their derivations if a forest is used, as in fast_ccg
+        """
+        if self.forest is not None:
+            return self.forest.count_items(self._goal_items())
+        return sum(1 for _ in self._goal_items())
+
+    def result(self) -> Tuple[int, object, int, int]:
+        """
+        :return: the number of parses, the chart, the number of edges and of KuhlmannItem edges, like fast_ccg
+        """
+        return self.num_parses(), self.chart, self.total_edges, self.num_km_edges
@@ -0,0 +1,133 @@
+import math
+from typing import Callable, Dict, List, Optional, Tuple, Union
+from ccg import Item
+from chart import ItemKey, item_key, replace_items
+from forest import CONTEXT_RULES
+
+# Supertagger output: for every token position the candidate categories with their probability.
+Tag = Tuple[str, float]
+Lattice = List[List[Tag]]
+
+
+def make_lattice(lexicon: Dict[str, Union[str, List[Tag]]], input_tokens: List[str]) -> Lattice:
+    """
+    Builds a lattice from a lexicon. A word maps to one category (probability 1)
+    or to a list of (category, probability) pairs.
+    Words that are not in the lexicon get no categories, like in the parsers.
+    """
+    lattice = []
+    for word in input_tokens:
+        entry = lexicon.get(word, [])
+        lattice.append([(entry, 1.0)] if isinstance(entry, str) else list(entry))
+    return lattice
+
+
+def lattice_categories(lattice: Lattice) -> Dict[str, str]:
+    """
+    :return: every category of the lattice as a lexicon (category -> category), e.g. for compute_artiy_bound
+    """
+    return {category: category for tags in lattice for category, _ in tags}
+
+
+def _log(probability: float) -> float:
+    return math.log(probability) if probability > 0 else -math.inf
+
+
+class SupertagBeam:
+    """
+    Pruning for ambiguous (lattice) input. Scores are probabilities as given by a supertagger, an item
+    scores the product of the scores of the categories it was built from (its best derivation).
+    On the axioms, tag_beam keeps the categories of a token with at least tag_beam times the probability
+    of its best category, tag_threshold drops categories below a fixed probability, max_tags keeps the best k.
+    cell_beam, cell_threshold and max_cell do the same for the items of every chart cell once it is complete,
+    before it is combined with other cells.
+    Pass one as beam= to cky_parse or fast_ccg together with a lattice. The scores are kept for one parse,
+    the counts of pruned tags and items add up over all parses.
+    """
+
+    def __init__(self, tag_beam: Optional[float] = None, tag_threshold: Optional[float] = None,
+                 max_tags: Optional[int] = None, cell_beam: Optional[float] = None,
+                 cell_threshold: Optional[float] = None, max_cell: Optional[int] = None):
+        self.tag_beam = tag_beam
+        self.tag_threshold = tag_threshold
+        self.max_tags = max_tags
+        self.cell_beam = cell_beam
+        self.cell_threshold = cell_threshold
+        self.max_cell = max_cell
+        # best log probability of every item
+        self.scores: Dict[ItemKey, float] = {}
+        self.pruned_tags = 0
+        self.pruned_items = 0
+
+    def begin(self):
+        """
+        Called by a parser before it parses a sentence, forgets the scores of the previous one.
+        """
+        self.scores.clear()
+
+    @staticmethod
+    def _keep(scored: list, beam: Optional[float], threshold: Optional[float], limit: Optional[int]) -> list:
+        # scored is a list of (log probability, x), the best first
+        if not scored:
+            return scored
+        best = scored[0][0]
+        if beam is not None:
+            scored = [entry for entry in scored if entry[0] >= best + _log(beam)]
+        if threshold is not None:
+            scored = [entry for entry in scored if entry[0] >= _log(threshold)]
+        if limit is not None:
+            scored = scored[:limit]
+        return scored
+
+    def prune_tags(self, tags: List[Tag]) -> List[Tag]:
+        """
+        :return: the categories of one token that are kept, best first
+        """
+        scored = sorted(((_log(probability), (category, probability)) for category, probability in tags),
+                        key=lambda entry: -entry[0])
+        kept = self._keep(scored, self.tag_beam, self.tag_threshold, self.max_tags)
+        self.pruned_tags += len(tags) - len(kept)
+        return [tag for _, tag in kept]
+
+    def axiom(self, item: Item, probability: float):
+        self.scores[item_key(item)] = max(self.scores.get(item_key(item), -math.inf), _log(probability))
+
+    def score(self, item: Item) -> float:
+        """
+        :return: the log probability of the best derivation of the item
+        """
+        return self.scores.get(item_key(item), 0.0)
+
+    def wrap_add(self, add: Callable) -> Callable:
+        """
+        Wraps the function a parser adds items with, to score every derived item.
+        """
+        scores = self.scores
+
+        def scored(cell, item, rule, left=None, right=None):
+            if left is not None:
+                # a derivation context leaves its hole out, it is put back when recombined
+                hole = CONTEXT_RULES.get(rule)
+                score = 0.0 if hole == 0 else scores.get(item_key(left), 0.0)
+                if right is not None and hole != 1:
+                    score += scores.get(item_key(right), 0.0)
+                key = item_key(item)
+                if score > scores.get(key, -math.inf):
+                    scores[key] = score
+            return add(cell, item, rule, left, right)
+        return scored
+
+    def prune_cell(self, cell):
+        """
+        Removes the items of a complete cell that fall outside the beam, keeping the order of the rest.
+        """
+        if self.cell_beam is None and self.cell_threshold is None and self.max_cell is None:
+            return
+        items = list(cell)
+        if not items:
+            return
+        scored = sorted(((self.score(item), index) for index, item in enumerate(items)), key=lambda entry: -entry[0])
+        kept = self._keep(scored, self.cell_beam, self.cell_threshold, self.max_cell)
+        if len(kept) < len(items):
+            self.pruned_items += len(items) - len(kept)
+            replace_items(cell, [items[index] for index in sorted(index for _, index in kept)])
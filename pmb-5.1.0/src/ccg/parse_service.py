@@ -0,0 +1,634 @@
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import sys
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http import HTTPStatus
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+from benchmark import FAMILIES
+from corpus_runner import make_job, parse_sentence
+from lattice import make_lattice
+from pmb_reader import SentenceRecord
+
+# the parsers a request can ask for, see corpus_runner.parse_sentence
+SERVICE_PARSERS = ('fast', 'naive', 'bitset')
+# Besides the statuses of parse_sentence, a response can be 'rejected' (the queue was full), 'invalid'
+# (a malformed request), 'timeout' (the deadline passed before it was parsed) or 'cancelled'.
+# Over HTTP these have their own status code, everything else is a 200.
+HTTP_STATUS = {'rejected': 503, 'invalid': 400, 'timeout': 504}
+_HTTP_METHODS = {b'GET', b'POST', b'PUT', b'DELETE', b'HEAD', b'OPTIONS'}
+# the longest request (a line of the line protocol, or the body of an HTTP request)
+_LINE_LIMIT = 1 << 22
+# the number of latencies kept for the percentiles of ParseService.stats
+_LATENCY_WINDOW = 10000
+# the result a cancelled request is answered with
+_CANCELLED = {'status': 'cancelled'}
+
+RequestId = Union[str, int]
+
+
+class InvalidRequest(ValueError):
+    pass
+
+
+def make_request_job(request: dict, request_id: RequestId, structured: bool = False) -> dict:
+    """
+    Turns a parse request into a job for corpus_runner.parse_sentence.
+    :param request: {'ccg': a PMB `ccg(...)` derivation} or {'tokens': [words], 'lexicon': {word: category}}
+                    with optionally 'unary': [[argument, result], ...] (see unary_rules.UnaryRules).
+                    Both can have a 'language', the workers keep a rule cache per language
+    :param request_id: the name of the sentence in the job
+    :param structured: keep the brackets and features of the categories of a derivation, see pmb_reader
+    :raises InvalidRequest: if the request is neither
+    """
+    language = request.get('language')
+    if language is not None and not isinstance(language, str):
+        raise InvalidRequest("'language' is not a string")
+    if 'ccg' in request:
+        if not isinstance(request['ccg'], str):
+            raise InvalidRequest("'ccg' is not a string")
+        job = make_job(SentenceRecord.from_text(request['ccg'], str(request_id), language, structured))
+        if job['lattice'] is None:
+            raise InvalidRequest("'ccg' holds no derivation")
+        return job
+
+    tokens, lexicon = request.get('tokens'), request.get('lexicon')
+    if not isinstance(tokens, list) or not all(isinstance(token, str) for token in tokens):
+        raise InvalidRequest("'tokens' is not a list of words")
+    if not isinstance(lexicon, dict) or not all(isinstance(category, str) for category in lexicon.values()):
+        raise InvalidRequest("'lexicon' does not map words to categories")
+    try:
+        unary = tuple(sorted({(str(argument), str(result)) for argument, result in request.get('unary', ())
+                              if argument != result}))
+    except (TypeError, ValueError):
+        raise InvalidRequest("'unary' is not a list of [argument, result] pairs")
+    return {'file': str(request_id), 'language': language, 'lattice': make_lattice(lexicon, tokens),
+            'tokens': tokens, 'lx': bool(unary), 'unary': unary}
+
+
+def _parse_batch(batch: List[Tuple[dict, Tuple[str, ...], float]], max_edges: Optional[int],
+                 max_bytes: Optional[int]) -> List[Optional[dict]]:
+    """
+    Parses a micro batch in a worker, one (job, parsers, deadline) after the other. The deadlines are
+    time.monotonic() times, a clock all processes of a machine share, so every parse gets the time its request
+    has left when it starts, and one whose deadline passed while the ones before it were parsed is not
+    started (None).
+    """
+    results = []
+    for job, parsers, deadline in batch:
+        remaining = deadline - time.monotonic()
+        results.append(parse_sentence(job, parsers, remaining, max_edges=max_edges, max_bytes=max_bytes)
+                       if remaining > 0 else None)
+    return results
+
+
+def percentile(values: Sequence[float], q: float) -> Optional[float]:
+    """
+    :return: the q-th percentile (nearest rank) of sorted values, None if there are none
+    """
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(len(values) * q / 100))]
+
+
+class _Request:
+    __slots__ = ('id', 'job', 'parsers', 'received', 'deadline', 'dispatched', 'future')
+
+    def __init__(self, request_id: RequestId, job: dict, parsers: Tuple[str, ...], received: float,
+                 deadline: float, future: asyncio.Future):
+        self.id = request_id
+        self.job = job
+        self.parsers = parsers
+        self.received = received
+        self.deadline = deadline
+        self.dispatched = None
+        self.future = future
+
+    def live(self) -> bool:
+        # not answered (cancelled or timed out) yet, and still time to parse it
+        return not self.future.done() and self.deadline > time.monotonic()
+
+
+class ParseService:
+    """
+    An asyncio front end to the parsers. Parse requests (see make_request_job) come in over a TCP or unix socket
+    and are parsed by corpus_runner.parse_sentence on a pool of worker processes, so the event loop only reads,
+    queues and answers requests and is never blocked by a parse.
+
+    Requests wait in a bounded queue: when it is full a request is answered 'rejected' right away (HTTP 503),
+    so a burst the workers can not keep up with is turned away at the door instead of making every request
+    that is already queued late. Requests are sent to the workers in micro batches, at most one batch per
+    worker at a time, so that the queue stays in the service, where deadlines and cancellations can still
+    drop requests before they are parsed. A batch takes its share of the queue over the idle workers (at most
+    batch_size), so a burst is spread over all workers and the requests of a batch do not wait behind each
+    other more than needed; the last idle worker waits up to batch_wait for a batch to fill.
+    Every request has a deadline (deadline seconds, or its own 'deadline'): it is answered 'timeout' when it
+    passes, and a worker stops a parse that runs past it (see corpus_runner.time_limit). With max_edges and
+    max_bytes a parse is also stopped when its chart grows too large (see budget.ParseBudget).
+    A request can be cancelled until it is answered. One that a worker already parses is not stopped,
+    its result is dropped.
+
+    Two protocols share the socket. The line protocol takes one JSON object per line: a parse request with an
+    optional 'id', {'cancel': id} or {'stats': true}, and answers each with one JSON line with the same 'id',
+    as soon as it is done, so a client can have many requests pending on one connection (see ParseClient).
+    A connection starting with an HTTP request line gets HTTP: POST /parse, POST /cancel ({"id": ...})
+    and GET /stats, one request per connection.
+
+    >>> async def serve():
+    ...     async with ParseService(workers=0) as service:
+    ...         return await service.parse({'tokens': ["the", "dog", "barks"],
+    ...                                     'lexicon': {"the": "NP/N", "dog": "N", "barks": "S\\\\NP"}})
+    >>> response = asyncio.run(serve())
+    >>> response['status'], response['fast_parses']
+    ('ok', 1)
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, path: Optional[str] = None,
+                 workers: Optional[int] = None, batch_size: int = 4, batch_wait: float = 0.002,
+                 max_queue: int = 256, deadline: float = 10.0, parsers: Tuple[str, ...] = ('fast',),
+                 max_edges: Optional[int] = None, max_bytes: Optional[int] = None, structured: bool = False):
+        """
+        :param host: the address to listen on, the default only accepts local connections
+        :param port: the TCP port, 0 for a free one (see port after start)
+        :param path: listen on this unix socket instead of TCP
+        :param workers: number of worker processes, None for one per CPU,
+                        0 to parse in a thread of this process (the deadlines then do not stop a parse)
+        :param batch_size: the most requests sent to a worker at once
+        :param batch_wait: seconds the last idle worker waits for a batch to fill
+        :param max_queue: the most requests waiting for a worker, more are rejected
+        :param deadline: seconds a request has by default, from when it is read
+        :param parsers: the parsers a request is parsed with by default, see SERVICE_PARSERS
+        :param max_edges: the edge budget of a parse, see corpus_runner.parse_sentence
+        :param max_bytes: the memory budget of a parse
+        :param structured: keep the brackets and features of the categories of derivations, see pmb_reader
+        """
+        self.host = host
+        self.port = port
+        self.path = path
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.max_queue = max_queue
+        self.deadline = deadline
+        self.parsers = tuple(parsers)
+        self.max_edges = max_edges
+        self.max_bytes = max_bytes
+        self.structured = structured
+        # answered requests by status, and the latencies of the last ones that were queued
+        self.counts = Counter()
+        self.batches = 0
+        self.batched = 0
+        self._latencies = deque(maxlen=_LATENCY_WINDOW)
+        self._ids = itertools.count()
+        self._pending: Dict[RequestId, _Request] = {}
+        self._running = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._executor = None
+        self._server = None
+        self._batcher = None
+        self._tasks = set()
+        self._connections: Dict[asyncio.Task, asyncio.StreamWriter] = {}
+
+    def _make_executor(self):
+        return ProcessPoolExecutor(self.workers) if self.workers else ThreadPoolExecutor(1)
+
+    async def start(self):
+        """
+        Starts the workers, and listens on the socket.
+        """
+        loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(self.max_queue)
+        self._slots = asyncio.Semaphore(max(self.workers, 1))
+        self._executor = self._make_executor()
+        # the worker processes are started now, not by the first requests
+        await asyncio.gather(*(loop.run_in_executor(self._executor, _parse_batch, [], None, None)
+                               for _ in range(max(self.workers, 1))))
+        if self.path is not None:
+            self._server = await asyncio.start_unix_server(self._serve, self.path, limit=_LINE_LIMIT)
+        else:
+            self._server = await asyncio.start_server(self._serve, self.host, self.port, limit=_LINE_LIMIT)
+            self.port = self._server.sockets[0].getsockname()[1]
+        self._batcher = asyncio.create_task(self._batch_loop())
+
+    async def stop(self):
+        """
+        Stops listening, drops the connections and answers the pending requests 'cancelled'.
+        """
+        if self._server is not None:
+            self._server.close()
+        tasks = [task for task in (*self._tasks, self._batcher) if task is not None]
+        for task in tasks:
+            task.cancel()
+        for request in self._pending.values():
+            if not request.future.done():
+                request.future.set_result(_CANCELLED)
+        for writer in self._connections.values():
+            writer.close()
+        await asyncio.gather(*tasks, *self._connections, return_exceptions=True)
+        self._batcher = None
+        if self._server is not None:
+            await self._server.wait_closed()
+            self._server = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def __aenter__(self) -> 'ParseService':
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
+
+    async def serve_forever(self):
+        async with self:
+            await self._server.serve_forever()
+
+    def _respond(self, response: dict, status: str, request: Optional[_Request] = None, **fields) -> dict:
+        response.update(fields)
+        response['status'] = status
+        self.counts[status] += 1
+        if request is not None:
+            now = time.monotonic()
+            response['queued'] = (request.dispatched or now) - request.received
+            response['latency'] = now - request.received
+            self._latencies.append(response['latency'])
+        return response
+
+    async def parse(self, request: dict) -> dict:
+        """
+        Queues a parse request and waits for its answer.
+        :param request: see make_request_job, with optionally an 'id' (a string or int unique among the pending
+                        requests, one is made up if not given), 'deadline' in seconds from now
+                        and 'parsers' (see SERVICE_PARSERS)
+        :return: the result of corpus_runner.parse_sentence with the 'id' and 'status' of the request,
+                 and the seconds it was 'queued' and its 'latency' in the service
+        """
+        received = time.monotonic()
+        request_id = request.get('id')
+        if request_id is None:
+            request_id = f"r{next(self._ids)}"
+        response = {'id': request_id}
+        try:
+            if not isinstance(request_id, (str, int)):
+                raise InvalidRequest("'id' is not a string or an int")
+            if request_id in self._pending:
+                raise InvalidRequest(f"request {request_id!r} is already pending")
+            deadline = received + float(request.get('deadline', self.deadline))
+            parsers = request.get('parsers', self.parsers)
+            if isinstance(parsers, str) or not set(parsers) <= set(SERVICE_PARSERS):
+                raise InvalidRequest(f"'parsers' are not some of {SERVICE_PARSERS}")
+            job = make_request_job(request, request_id, self.structured)
+        except (InvalidRequest, TypeError, ValueError) as e:
+            return self._respond(response, 'invalid', error=str(e))
+
+        pending = _Request(request_id, job, tuple(parsers), received, deadline,
+                           asyncio.get_running_loop().create_future())
+        try:
+            self._queue.put_nowait(pending)
+        except asyncio.QueueFull:
+            self._compact_queue()
+            if self._queue.full():
+                return self._respond(response, 'rejected')
+            self._queue.put_nowait(pending)
+        self._pending[request_id] = pending
+        try:
+            result = await asyncio.wait_for(pending.future, deadline - time.monotonic())
+        except asyncio.TimeoutError:
+            result = None
+        finally:
+            del self._pending[request_id]
+        if result is None:
+            return self._respond(response, 'timeout', pending)
+        result = dict(result)
+        result.pop('file', None)
+        return self._respond(response, result.pop('status'), pending, **result)
+
+    def _compact_queue(self):
+        # drops the requests that were answered (cancelled or timed out) while they were queued
+        queue = self._queue
+        waiting = [queue.get_nowait() for _ in range(queue.qsize())]
+        for request in waiting:
+            if request.live():
+                queue.put_nowait(request)
+
+    def cancel(self, request_id: RequestId) -> bool:
+        """
+        Cancels a pending request, it is answered 'cancelled'.
+        :return: whether the request was pending
+        """
+        pending = self._pending.get(request_id) if isinstance(request_id, (str, int)) else None
+        if pending is None or pending.future.done():
+            return False
+        pending.future.set_result(_CANCELLED)
+        return True
+
+    def stats(self) -> dict:
+        """
+        :return: the requests queued, pending (queued or parsed) and the batches being parsed, the number of
+                 requests answered by status, the batches sent and their mean size, and the median and p99
+                 latency in seconds of the last requests that were queued
+        """
+        latencies = sorted(self._latencies)
+        return {'queued': self._queue.qsize() if self._queue is not None else 0, 'pending': len(self._pending),
+                'running': self._running, 'statuses': dict(self.counts), 'batches': self.batches,
+                'mean_batch': self.batched / self.batches if self.batches else 0.0,
+                'p50': percentile(latencies, 50), 'p99': percentile(latencies, 99)}
+
+    async def handle(self, message) -> dict:
+        """
+        Answers one message of a client: a parse request (see parse), {'cancel': id} or {'stats': true}.
+        A cancel or stats message can have an 'id' of its own, its answer has it.
+        """
+        if not isinstance(message, dict):
+            return self._respond({'id': None}, 'invalid', error="a message is a JSON object")
+        if 'cancel' in message:
+            return {'id': message.get('id'), 'cancel': message['cancel'], 'cancelled': self.cancel(message['cancel'])}
+        if message.get('stats'):
+            return {'id': message.get('id'), **self.stats()}
+        return await self.parse(message)
+
+    async def _next_batch(self) -> List[_Request]:
+        queue = self._queue
+        batch = [await queue.get()]
+        idle = max(self.workers, 1) - self._running
+        # the share of the queue of every idle worker
+        size = min(self.batch_size, max(1, -(-(queue.qsize() + 1) // idle)))
+        wait_until = time.monotonic()
+        if idle == 1:
+            size = self.batch_size
+            wait_until += self.batch_wait
+        while len(batch) < size:
+            if queue.empty():
+                timeout = wait_until - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            else:
+                batch.append(queue.get_nowait())
+        return [request for request in batch if request.live()]
+
+    async def _batch_loop(self):
+        while True:
+            await self._slots.acquire()
+            try:
+                batch = await self._next_batch()
+            except BaseException:
+                self._slots.release()
+                raise
+            if not batch:
+                self._slots.release()
+                continue
+            self._running += 1
+            task = asyncio.create_task(self._run_batch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, batch: List[_Request]):
+        self.batches += 1
+        self.batched += len(batch)
+        now = time.monotonic()
+        for request in batch:
+            request.dispatched = now
+        jobs = [(request.job, request.parsers, request.deadline) for request in batch]
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(
+                self._executor, _parse_batch, jobs, self.max_edges, self.max_bytes)
+        except BrokenProcessPool as e:
+            # a worker died (e.g. killed for its memory), the pool can not be used anymore
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = self._make_executor()
+            results = [{'status': 'error', 'error': repr(e)}] * len(batch)
+        except Exception as e:
+            results = [{'status': 'error', 'error': repr(e)}] * len(batch)
+        finally:
+            self._running -= 1
+            self._slots.release()
+        for request, result in zip(batch, results):
+            if not request.future.done():
+                request.future.set_result(result)
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._connections[asyncio.current_task()] = writer
+        try:
+            line = await reader.readline()
+            if line.split(b' ', 1)[0] in _HTTP_METHODS:
+                await self._serve_http(line, reader, writer)
+            else:
+                await self._serve_lines(line, reader, writer)
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            self._connections.pop(asyncio.current_task(), None)
+            writer.close()
+
+    async def _serve_lines(self, line: bytes, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        lock = asyncio.Lock()
+        answers = set()
+
+        async def answer(message):
+            response = await self.handle(message)
+            async with lock:
+                writer.write(json.dumps(response).encode() + b'\n')
+                await writer.drain()
+
+        try:
+            while line:
+                if line.strip():
+                    try:
+                        message = json.loads(line)
+                    except ValueError:
+                        message = None
+                    task = asyncio.create_task(answer(message))
+                    answers.add(task)
+                    task.add_done_callback(answers.discard)
+                line = await reader.readline()
+            # the client is done sending, it still gets its answers
+            while answers:
+                await next(iter(answers))
+        finally:
+            # the client is gone (or the service stops): its pending requests are dropped
+            for task in answers:
+                task.cancel()
+
+    async def _serve_http(self, request_line: bytes, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        method, target = request_line.decode('latin-1').split()[:2]
+        length = 0
+        while True:
+            header = await reader.readline()
+            if header in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = header.decode('latin-1').partition(':')
+            if name.strip().lower() == 'content-length':
+                length = int(value)
+        if length > _LINE_LIMIT:
+            code, response = 413, {'error': f"the body is longer than {_LINE_LIMIT} bytes"}
+        elif method == 'GET' and target == '/stats':
+            code, response = 200, self.stats()
+        elif method == 'POST' and target in ('/parse', '/cancel'):
+            try:
+                message = json.loads(await reader.readexactly(length))
+            except ValueError:
+                message = None
+            if target == '/cancel':
+                message = {'cancel': message.get('id')} if isinstance(message, dict) else None
+            response = await self.handle(message)
+            code = HTTP_STATUS.get(response.get('status'), 200)
+        else:
+            code, response = 404, {'error': f"no {method} {target}"}
+        body = json.dumps(response).encode()
+        writer.write(f"HTTP/1.1 {code} {HTTPStatus(code).phrase}\r\nContent-Type: application/json\r\n"
+                     f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode('latin-1') + body)
+        await writer.drain()
+
+
+class ParseClient:
+    """
+    A client of the line protocol of a ParseService. Any number of requests can be pending on the connection,
+    each is answered as soon as the service is done with it.
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._reader = reader
+        self._writer = writer
+        self._ids = itertools.count()
+        self._waiting: Dict[RequestId, asyncio.Future] = {}
+        self._reading = asyncio.create_task(self._read())
+
+    @classmethod
+    async def connect(cls, host: str = '127.0.0.1', port: Optional[int] = None,
+                      path: Optional[str] = None) -> 'ParseClient':
+        """
+        :param path: connect to this unix socket instead of host and port
+        """
+        if path is not None:
+            reader, writer = await asyncio.open_unix_connection(path, limit=_LINE_LIMIT)
+        else:
+            reader, writer = await asyncio.open_connection(host, port, limit=_LINE_LIMIT)
+        return cls(reader, writer)
+
+    async def _read(self):
+        try:
+            while line := await self._reader.readline():
+                response = json.loads(line)
+                future = self._waiting.pop(response.get('id'), None)
+                if future is not None and not future.done():
+                    future.set_result(response)
+        finally:
+            for future in self._waiting.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("the service closed the connection"))
+            self._waiting.clear()
+
+    async def _send(self, message: dict) -> dict:
+        message.setdefault('id', f"c{next(self._ids)}")
+        future = self._waiting[message['id']] = asyncio.get_running_loop().create_future()
+        self._writer.write(json.dumps(message).encode() + b'\n')
+        await self._writer.drain()
+        return await future
+
+    async def parse(self, request: dict, deadline: Optional[float] = None) -> dict:
+        """
+        :param request: see ParseService.parse
+        :param deadline: seconds the service has for the request, its default if None
+        :return: the response of the service
+        """
+        request = dict(request)
+        if deadline is not None:
+            request['deadline'] = deadline
+        return await self._send(request)
+
+    async def cancel(self, request_id: RequestId) -> bool:
+        """
+        :return: whether the request was still pending
+        """
+        return (await self._send({'cancel': request_id}))['cancelled']
+
+    async def stats(self) -> dict:
+        return await self._send({'stats': True})
+
+    async def close(self):
+        self._writer.close()
+        self._reading.cancel()
+        await asyncio.gather(self._reading, return_exceptions=True)
+
+    async def __aenter__(self) -> 'ParseClient':
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+
+async def burst(client: ParseClient, requests: List[dict], deadline: Optional[float] = None) -> dict:
+    """
+    Sends all requests at once, as a burst of load.
+    :return: the number of responses by status, and the median, p99 and largest latency in seconds
+             seen by the client of the ones that were not rejected
+    """
+    async def timed(request):
+        start = time.monotonic()
+        response = await client.parse(request, deadline)
+        return response['status'], time.monotonic() - start
+
+    answers = await asyncio.gather(*(timed(request) for request in requests))
+    latencies = sorted(latency for status, latency in answers if status not in ('rejected', 'invalid'))
+    return {'statuses': dict(Counter(status for status, _ in answers)), 'p50': percentile(latencies, 50),
+            'p99': percentile(latencies, 99), 'max': latencies[-1] if latencies else None}
+
+
+async def _main(args: argparse.Namespace) -> int:
+    service = ParseService(args.host, 0 if args.burst else args.port, args.unix, args.workers, args.batch_size,
+                           args.batch_wait, args.max_queue, args.deadline, tuple(args.parsers), args.max_edges,
+                           args.max_bytes, args.structured)
+    if not args.burst:
+        await service.serve_forever()
+        return 0
+
+    # sentences of the composition family of the benchmark, of a few lengths
+    requests = []
+    for number in range(args.burst):
+        lexicon, tokens = FAMILIES['composition'](4 + number % 5)
+        requests.append({'tokens': tokens, 'lexicon': lexicon})
+    async with service:
+        async with await ParseClient.connect(args.host, service.port, args.unix) as client:
+            for round_number in range(args.rounds):
+                result = await burst(client, requests)
+                print(f"burst {round_number + 1}: {result['statuses']} p50 {result['p50']:.4f}s "
+                      f"p99 {result['p99']:.4f}s max {result['max']:.4f}s")
+            print(json.dumps(await client.stats()))
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Parsing service for the CCG parsers over a local socket or HTTP")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8463)
+    parser.add_argument('--unix', help="listen on this unix socket instead of TCP")
+    parser.add_argument('--workers', type=int, help="worker processes, one per CPU by default, 0 for a thread")
+    parser.add_argument('--batch-size', type=int, default=4)
+    parser.add_argument('--batch-wait', type=float, default=0.002)
+    parser.add_argument('--max-queue', type=int, default=256)
+    parser.add_argument('--deadline', type=float, default=10.0, help="default seconds per request")
+    parser.add_argument('--parsers', nargs='+', default=['fast'], choices=list(SERVICE_PARSERS))
+    parser.add_argument('--max-edges', type=int)
+    parser.add_argument('--max-bytes', type=int)
+    parser.add_argument('--structured', action='store_true')
+    parser.add_argument('--burst', type=int, default=0,
+                        help="instead of serving, send bursts of this many requests to a service on a free port "
+                             "and print their latencies")
+    parser.add_argument('--rounds', type=int, default=3, help="the number of bursts")
+    args = parser.parse_args(argv)
+    return asyncio.run(_main(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+import time
+from collections import Counter
+from typing import Callable, Dict, Optional
+
+# the names parsers add items under that belong to another rule: fast_ccg starts derivation contexts
+# with the rules of cky_parse and extends them with ctxt_extend
+EDGE_RULES = {'forward_context': 'forward', 'backward_context': 'backward',
+              'backward_crossing_context': 'backward_crossing', 'ctxt_forward': 'ctxt_extend',
+              'ctxt_backward': 'ctxt_extend', 'ctxt_backward_crossing': 'ctxt_extend'}
+
+
+class RuleStats:
+    """
+    Counters of a single rule: how often it was tried, how often it built an item, how often the
+    arity bound c_G stopped it from building the plain item, the time spent in it and the edges it added.
+    The attempts include the cache_hits, the pairs whose result was found in a cache without trying the rule.
+    """
+    __slots__ = ('attempts', 'successes', 'arity_rejections', 'time_ns', 'edges', 'cache_hits')
+
+    def __init__(self):
+        self.attempts = 0
+        self.successes = 0
+        self.arity_rejections = 0
+        self.time_ns = 0
+        self.edges = 0
+        self.cache_hits = 0
+
+    def merge(self, other: 'RuleStats'):
+        for name in self.__slots__:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+
+    def as_dict(self) -> Dict[str, int]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class ParseStats:
+    """
+    Opt-in instrumentation of cky_parse and fast_ccg. Pass one as stats= to a parser and it records per rule
+    the attempts, successes, arity rejections, time and edges, and the number of edges per span length.
+    Without it the parsers call their rules directly, so the counters cost nothing when they are not wanted.
+    One ParseStats can be passed to many parses to add them up.
+    """
+
+    def __init__(self):
+        self.rules: Dict[str, RuleStats] = {}
+        self.edges_by_length: Counter = Counter()
+        self.sentences = 0
+
+    def rule(self, name: str) -> RuleStats:
+        stats = self.rules.get(name)
+        if stats is None:
+            stats = self.rules[name] = RuleStats()
+        return stats
+
+    def wrap(self, name: str, rule: Callable, hit_bound: Optional[Callable] = None) -> Callable:
+        """
+        Wraps a rule so that every call is counted and timed.
+        :param name: the name the rule is reported under
+        :param rule: an item level rule, e.g. ccg_extend, returning None when it does not apply
+        :param hit_bound: called with the result and the arguments of the rule,
+                          returns True if the arity bound changed or blocked the result
+        :return: a function with the same signature as rule
+        """
+        stats = self.rule(name)
+        clock = time.perf_counter_ns
+
+        def counted(*args):
+            start = clock()
+            result = rule(*args)
+            stats.time_ns += clock() - start
+            stats.attempts += 1
+            if result is not None:
+                stats.successes += 1
+            if hit_bound is not None and hit_bound(result, *args):
+                stats.arity_rejections += 1
+            return result
+        return counted
+
+    def wrap_add(self, add: Callable) -> Callable:
+        """
+        Wraps the function a parser adds items with (chart.append_item or ParseForest.add)
+        to count the new edges per rule and per span length.
+        """
+        def counted(cell, item, rule, left=None, right=None):
+            is_new = add(cell, item, rule, left, right)
+            if is_new:
+                self.rule(EDGE_RULES.get(rule, rule)).edges += 1
+                self.edges_by_length[item.j - item.i] += 1
+            return is_new
+        return counted
+
+    def merge(self, other: 'ParseStats'):
+        for name, stats in other.rules.items():
+            self.rule(name).merge(stats)
+        self.edges_by_length.update(other.edges_by_length)
+        self.sentences += other.sentences
+
+    def as_dict(self) -> dict:
+        return {'sentences': self.sentences,
+                'rules': {name: stats.as_dict() for name, stats in self.rules.items()},
+                'edges_by_length': dict(sorted(self.edges_by_length.items()))}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'ParseStats':
+        stats = cls()
+        stats.sentences = data['sentences']
+        for name, counters in data['rules'].items():
+            rule = stats.rule(name)
+            for counter, value in counters.items():
+                setattr(rule, counter, value)
+        stats.edges_by_length.update({int(length): edges for length, edges in data['edges_by_length'].items()})
+        return stats
+
+    def summary(self) -> str:
+        """
+        :return: a table of the rules, the most expensive first
+        """
+        lines = [f"{'rule':<20}{'attempts':>12}{'hits':>12}{'successes':>12}{'arity':>10}{'edges':>10}{'ms':>10}"]
+        for name, stats in sorted(self.rules.items(), key=lambda rule: -rule[1].time_ns):
+            lines.append(f"{name:<20}{stats.attempts:>12}{stats.cache_hits:>12}{stats.successes:>12}"
+                         f"{stats.arity_rejections:>10}{stats.edges:>10}{stats.time_ns / 1e6:>10.2f}")
+        lines.append("edges per span length: " + ", ".join(f"{length}: {edges}"
+                                                            for length, edges in sorted(self.edges_by_length.items())))
+        return "\n".join(lines)
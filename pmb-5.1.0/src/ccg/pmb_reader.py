@@ -0,0 +1,189 @@
+import os
+import re
+import string
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
+from read_ccg import read_entries, read_unary_rules, flatten_category, structured_category
+
+_DERIVATION = re.compile(r'ccg\(.*', re.DOTALL)
+_RULE = re.compile(r'\b([a-z]+)\(')
+
+
+class SentenceRecord:
+    """
+    One `.ccg` file of the PMB. Nothing is read when a record is created: the file is read on first
+    access, and the lexical entries and rules are only extracted when they are asked for,
+    so filters on cheap properties (like uses_lx) can drop a sentence before it is parsed.
+    A structured record keeps the brackets and features of its categories (see categories.split_category),
+    otherwise they are flattened as the parsers have always had them.
+    """
+    __slots__ = ('path', 'language', 'structured', '_derivation', '_raw_entries', '_entries', '_rules')
+
+    def __init__(self, path: str, language: Optional[str] = None, structured: bool = False):
+        self.path = path
+        self.language = language
+        self.structured = structured
+        self._derivation = None
+        self._raw_entries = None
+        self._entries = None
+        self._rules = None
+
+    @classmethod
+    def from_text(cls, text: str, path: str = '<text>', language: Optional[str] = None,
+                  structured: bool = False) -> 'SentenceRecord':
+        """
+        A record of a derivation that is not read from a file, e.g. one sent to parse_service.
+        :param text: the `ccg(...)` derivation, or the text of a `.ccg` file
+        :param path: what file and repr show for the record
+        """
+        record = cls(path, language, structured)
+        match = _DERIVATION.search(text)
+        record._derivation = match.group(0) if match else ''
+        return record
+
+    @property
+    def file(self) -> str:
+        return os.path.basename(self.path)
+
+    @property
+    def derivation(self) -> str:
+        """
+        :return: the `ccg(...)` derivation of the file, '' if it has none
+        """
+        if self._derivation is None:
+            with open(self.path, "r") as f:
+                match = _DERIVATION.search(f.read())
+            self._derivation = match.group(0) if match else ''
+        return self._derivation
+
+    @property
+    def rules(self) -> Set[str]:
+        """
+        :return: the rules (functors) used in the derivation, e.g. {'ba', 'fa', 't'}
+        """
+        if self._rules is None:
+            self._rules = set(_RULE.findall(self.derivation))
+        return self._rules
+
+    @property
+    def uses_lx(self) -> bool:
+        return 'lx' in self.rules
+
+    @property
+    def raw_entries(self) -> List[Tuple[str, str]]:
+        """
+        :return: the (word, category) pairs of the sentence with the categories as written in the file
+        """
+        if self._raw_entries is None:
+            self._raw_entries = read_entries(self.derivation)
+        return self._raw_entries
+
+    @property
+    def entries(self) -> List[Tuple[str, str]]:
+        """
+        :return: the (word, category) pairs of the sentence, see read_ccg.parse_ccg_structure
+        """
+        if self._entries is None:
+            convert = structured_category if self.structured else flatten_category
+            self._entries = [(word, convert(category)) for word, category in self.raw_entries]
+        return self._entries
+
+    @property
+    def raw_unary_rules(self) -> List[Tuple[str, str]]:
+        """
+        :return: the (argument, result) categories of the lx nodes of the derivation, as written in the file
+        """
+        return read_unary_rules(self.derivation) if self.uses_lx else []
+
+    @property
+    def unary_rules(self) -> List[Tuple[str, str]]:
+        """
+        :return: the (argument, result) categories of the lx rules of the derivation, without duplicates,
+                 converted like the entries (see unary_rules.UnaryRules). Rules that only change features
+                 are left out of flattened categories, there they rewrite a category into itself
+        """
+        convert = structured_category if self.structured else flatten_category
+        rules = {(convert(argument), convert(result)) for argument, result in self.raw_unary_rules}
+        return sorted((argument, result) for argument, result in rules if argument != result)
+
+    @property
+    def tokens(self) -> List[str]:
+        """
+        :return: the words of the sentence without punctuation, the input for the parsers
+        """
+        return [word for word, _ in self.entries if word not in string.punctuation]
+
+    @property
+    def categories(self) -> List[str]:
+        """
+        :return: the category of every token, in the same order
+        """
+        return [category for word, category in self.entries if word not in string.punctuation]
+
+    @property
+    def lattice(self) -> List[List[Tuple[str, float]]]:
+        """
+        :return: the gold category of every token as a lattice (see lattice.py), the input for the parsers.
+                 A word that occurs twice keeps both of its categories
+        """
+        return [[(category, 1.0)] for category in self.categories]
+
+    def __len__(self) -> int:
+        return len(self.tokens)
+
+    def __repr__(self):
+        return f"SentenceRecord({self.path!r}, {self.language!r})"
+
+
+Filter = Callable[[SentenceRecord], bool]
+
+
+def has_derivation(record: SentenceRecord) -> bool:
+    # every derivation uses the ccg(...) rule, so this does not need the text of the derivation
+    return len(record.rules) > 0
+
+
+def no_lx(record: SentenceRecord) -> bool:
+    """
+    Keeps the sentences that can be derived without the unary lx rule.
+    """
+    return has_derivation(record) and not record.uses_lx
+
+
+def max_length(n: int) -> Filter:
+    """
+    :return: a filter keeping the sentences of at most n tokens
+    """
+    return lambda record: len(record) <= n
+
+
+def iter_ccg_files(directory_path: str) -> Iterator[str]:
+    """
+    Yields the paths of all `.ccg` files below a directory in a fixed (sorted) order.
+    Only the entries of one directory per level are held at a time.
+    """
+    with os.scandir(directory_path) as it:
+        entries = sorted(it, key=lambda entry: entry.name)
+    for entry in entries:
+        if entry.is_dir():
+            yield from iter_ccg_files(entry.path)
+        elif entry.name.endswith(".ccg") and entry.is_file():
+            yield entry.path
+
+
+def read_corpus(paths: Union[str, Dict[str, str]], filters: Iterable[Filter] = (),
+                structured: bool = False) -> Iterator[SentenceRecord]:
+    """
+    Streams the sentences of one or more PMB directories.
+    :param paths: a directory, or a dict mapping a language code to its directory
+    :param filters: predicates on a record, a sentence is only yielded if all of them hold.
+                    They are tried in order, so put the cheap ones (no_lx) before the ones that parse (max_length).
+    :param structured: keep the brackets and features of the categories, see SentenceRecord
+    """
+    if isinstance(paths, str):
+        paths = {None: paths}
+    filters = list(filters)
+    for language, directory_path in paths.items():
+        for path in iter_ccg_files(directory_path):
+            record = SentenceRecord(path, language, structured)
+            if all(keep(record) for keep in filters):
+                yield record
@@ -151,11 +151,241 @@ def parse_tokens(tokens):
 
 
 
+# One alternative per kind of chunk scan_tokens has to tell apart, whitespace in front of a chunk is skipped.
+# A quoted atom may contain escaped quotes (\\'), a feature (:dcl) runs up to the next slash, bracket or comma.
+_TERM_TOKEN = re.compile(r"""\s*(?:
+    ([(),])
+  | ('(?:\\'|[^'])*+')
+  | ([^\s(),':\[\]]+)
+  | (:[^/\\(),]*)
+  | ([\[\]])
+  | (')
+  | $)
+""", re.VERBOSE)
+_PUNCT, _QUOTED, _PLAIN, _FEATURE, _BRACKET, _QUOTE = range(1, 7)
+
+# A [lemma:'a', from:0, ...] list (with at most one nested list) without parentheses, and without whitespace
+# other than after commas and inside quotes. These make up most of a derivation and are split in one go.
+_ATTRIBUTES = re.compile(r"""\[(?:
+    [^\s'()\[\]] | '(?:\\'|[^'])*+'(?!') | ,\s+
+  | \[(?:[^\s'()\[\]] | '(?:\\'|[^'])*+'(?!') | ,\s+)*\]
+)*\]""", re.VERBOSE)
+_ATTRIBUTE_PIECE = re.compile(r"[^\s,']*'(?:\\'|[^'])*+'|[^\s,']+|,")
+
+_CLOSE_PREV = {'<': '(', '>': ')'}
+
+
+def scan_tokens(expr):
+    """
+    Same tokens as tokenize, but the input is consumed a chunk at a time by one compiled regex
+    instead of a character at a time, and attribute lists are split without going through the loop.
+    """
+    tokens = []
+    current_token = []
+    pos = 0
+    n = len(expr)
+    prev = ''
+    sq = False
+    stack_count = 0
+    match = _TERM_TOKEN.match
+    while pos < n:
+        m = match(expr, pos)
+        kind = m.lastindex
+        pos = m.end()
+        if kind == _PUNCT:
+            chunk = m.group(kind)
+            if chunk == '(' and prev in ('/', '\\', '('):
+                # bracket inside a category
+                current_token.append('<')
+                prev = '('
+                continue
+            if chunk == ')' and prev.isalpha():
+                current_token.append('>')
+                prev = ')'
+                continue
+            if current_token:
+                tokens.append(''.join(current_token))
+                current_token = []
+            tokens.append(chunk)
+            prev = chunk
+        elif kind == _PLAIN:
+            chunk = m.group(kind)
+            current_token.append(chunk)
+            prev = _CLOSE_PREV.get(chunk[-1], chunk[-1])
+        elif kind == _QUOTED and prev != "'":
+            current_token.append("'" + m.group(kind)[1:-1].replace("\\'", "'") + "'")
+            tokens.append(''.join(current_token))
+            current_token = []
+            prev = "'"
+        elif kind == _QUOTED or kind == _QUOTE:
+            if prev != "'":
+                raise ValueError(f'Unterminated quoted atom at {m.start(kind)}/{n}')
+            # a quote right after a quoted atom is kept as a plain character
+            current_token.append("'")
+            pos = m.start(kind) + 1
+        elif kind == _FEATURE:
+            if sq:
+                # only features of categories are dropped, not the ones in the [lemma:..., ...] list
+                current_token.append(':')
+                pos = m.start(kind) + 1
+                prev = ':'
+            elif pos == n:
+                raise ValueError(f'Unterminated feature at {m.start(kind)}/{n}')
+        elif kind == _BRACKET:
+            chunk = m.group(kind)
+            if chunk == '[' and stack_count == 0 and not sq:
+                attributes = _ATTRIBUTES.match(expr, m.start(kind))
+                if attributes:
+                    for piece in _ATTRIBUTE_PIECE.findall(attributes.group()):
+                        if piece == ',':
+                            if current_token:
+                                tokens.append(''.join(current_token))
+                                current_token = []
+                            tokens.append(piece)
+                        elif piece[-1] == "'":
+                            quote = piece.index("'")
+                            current_token.append(piece[:quote] + piece[quote:].replace("\\'", "'"))
+                            tokens.append(''.join(current_token))
+                            current_token = []
+                        else:
+                            current_token.append(piece)
+                    pos = attributes.end()
+                    prev = ']'
+                    continue
+            if chunk == '[':
+                sq = True
+                stack_count += 1
+            elif stack_count == 1:
+                sq = False
+                stack_count -= 1
+            else:
+                stack_count -= 1
+            current_token.append(chunk)
+            prev = chunk
+    if current_token:
+        tokens.append(''.join(current_token))
+    return tokens
+
+
+def _term_leaf(token):
+    if token.isalnum() or token[0] == "'" or ":" in token:
+        return token.strip("'")
+    elif '/' in token or '\\' in token:
+        return token
+    return None
+
+
+def read_tokens(tokens):
+    """
+    Builds the same nested dictionary as parse_tokens, but reads the tokens with a cursor instead of pop(0)
+    and keeps the open terms on an explicit stack instead of recursing, so it is linear in the number of tokens
+    and works for derivations of any depth. The token list is not modified.
+    """
+    n = len(tokens)
+    pos = 0
+    # open terms: [functor, arguments, nesting level]
+    stack = []
+    while True:
+        # read one argument, the commas in front of it are skipped
+        value = None
+        while pos < n and tokens[pos] == ',':
+            pos += 1
+        if pos < n:
+            token = tokens[pos]
+            pos += 1
+            if token in FUNCTION_TYPES:
+                if pos == n:
+                    raise ValueError(f'Expected the arguments of {token}')
+                # skip the opening '('
+                pos += 1
+                stack.append([token, [], 1])
+            elif token != ')':
+                value = _term_leaf(token)
+        # hand the value to the innermost open term, and close terms until one needs another argument
+        while stack:
+            term = stack[-1]
+            if value is not None:
+                term[1].append(value)
+                value = None
+            while pos < n:
+                current_token = tokens[pos]
+                if current_token == '(':
+                    term[2] += 1
+                elif current_token == ')':
+                    term[2] -= 1
+                    if term[2] == 0:
+                        pos += 1
+                        break
+                # skip commas that are within nested structures
+                if current_token == ',' and term[2] > 1:
+                    pos += 1
+                    continue
+                break
+            else:
+                term[2] = 0
+            if term[2] != 0:
+                break
+            stack.pop()
+            value = {term[0]: term[1]}
+        if not stack:
+            return value
+
+
 def parse_prolog_to_dict(expr):
-    tokens = tokenize(expr)
-    # for token in tokens:
-    #     print(token)
-    return parse_tokens(tokens)
+    # same result as parse_tokens(tokenize(expr)), which is kept as the reference
+    return read_tokens(scan_tokens(expr))
+
+
+def remove_features(input_str):
+    result = []
+    i = 0
+    while i < len(input_str):
+        if input_str[i:i+2] == "s:":
+            # Add just "s" and skip over the feature part until we hit a '/' or ')'
+            result.append("s")
+            i += 2  # Skip over "s:"
+            while i < len(input_str) and input_str[i] not in ['/','(',')', '\\']:
+                i += 1
+        else:
+            result.append(input_str[i])
+            i += 1
+    return ''.join(result)
+
+def flatten_category(category):
+    # the category as the parsers have always seen it: without brackets and s: features, in upper case
+    return remove_features(re.sub(r'[()]', '', category)).upper()
+
+
+def structured_category(category):
+    # brackets and features kept, see categories.split_category
+    return category.upper()
+
+
+def read_entries(ccg_text):
+    """ The (word, category) pairs of the t(...) leaves of a derivation, with the categories as they are written. """
+    ccg_entries = []
+    pattern_token = r"t\((.*?), '(.*?)', \[(.*?)\]\)"
+    lines = ccg_text.splitlines()
+    for line in lines:
+        token_match = re.search(pattern_token, line)
+        if token_match:
+            category, word, features = token_match.groups()
+            ccg_entries.append((word, category))
+    return ccg_entries
+
+
+def read_unary_rules(ccg_text):
+    """ The (argument, result) categories of the lx(result, argument, ...) nodes of a derivation, as they are written. """
+    return [(argument, result) for result, argument in re.findall(r"\blx\(([^,]+), ([^,]+),", ccg_text)]
+
+
+def parse_ccg_structure(ccg_text, keep_structure=False):
+    """
+    The (word, category) pairs of a derivation. Categories lose their brackets and s: features,
+    unless keep_structure is set, then only their case changes.
+    """
+    convert = structured_category if keep_structure else flatten_category
+    return [(word, convert(category)) for word, category in read_entries(ccg_text)]
 
 
 def print_recursive(data, level=0):
@@ -365,29 +595,20 @@ def traverse_directory_for_parse_items(directory_path: str):
     :param directory_path: Path to the directory containing `.ccg` files.
     :return: A set of all unique function types found across all `.ccg` files.
     """
+    # imported here since pmb_reader imports this module
+    from pmb_reader import read_corpus, no_lx
     count = 0
     total = 0
-    for root, dirs, files in os.walk(directory_path):
-        # print(files)
-        for file in files:
-            # print(file)
-            if file.endswith(".ccg"):
-                print(file)
-                total += 1
-                # print('ok', all_function_types)
-                file_path = os.path.join(root, file)
-                with open(file_path, "r") as f:
-                    prolog_code = f.read()
-                    match = re.search(r'ccg\(.*', prolog_code, re.DOTALL)
-                    if match and 'lx' not in match.group(0):
-                        count += 1
-                        result = match.group(0)
-                        # print(result)
-                        parsed_result = parse_prolog_to_dict(result)
-                        # print_recursive(parsed_result)
-                        inference_tree, r = extract_inference_tree(parsed_result)
-                        print(inference_tree)
-        print(f'NO LX: {count}; TOTAL: {total}')
+    for record in read_corpus(directory_path):
+        print(record.file)
+        total += 1
+        if no_lx(record):
+            count += 1
+            parsed_result = parse_prolog_to_dict(record.derivation)
+            # print_recursive(parsed_result)
+            inference_tree, r = extract_inference_tree(parsed_result)
+            print(inference_tree)
+    print(f'NO LX: {count}; TOTAL: {total}')
 
 
 # directory_path = "/Users/paulhe/Desktop/CCG Parsing/pmb-5.1.0/src/ccg/standard"
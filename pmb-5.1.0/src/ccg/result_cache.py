@@ -0,0 +1,188 @@
+import hashlib
+import json
+import sqlite3
+from collections import OrderedDict
+from typing import List, Optional, Sequence, Tuple, Union
+from categories import CATEGORIES
+from chart import NO_CONTEXT, ItemKey
+from fast_ccg import interned_condition, portable_condition
+from forest import ParseForest
+from lattice import Lattice
+
+# bump when the parsers change what they count, the entries of older runs are then no longer found
+RESULT_VERSION = 4
+
+
+def sentence_key(categories: Sequence[str], parser: str, c_G: int,
+                 unary: Sequence[Tuple[str, str]] = ()) -> str:
+    """
+    The chart of a sentence only depends on the categories of its words (the parsers never look at the words),
+    on the parser, on the arity bound and on the unary rules, so sentences that share these share their result.
+    :param categories: the categories of every token as the parser sees them, see sentence_categories
+    :param parser: the parser variant, e.g. 'fast' or 'naive' (see corpus_runner.parse_sentence)
+    :param c_G: the arity bound of the categories, see fast_ccg.compute_artiy_bound
+    :param unary: the (argument, result) unary rules of the sentence, see unary_rules.UnaryRules
+    :return: a hex digest identifying the result
+    """
+    key = [RESULT_VERSION, parser, c_G, list(categories)]
+    if unary:
+        # sentences without unary rules keep the keys they had before there were any
+        key.append(sorted(map(list, unary)))
+    data = json.dumps(key, separators=(',', ':'))
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+def _portable_key(key: ItemKey) -> list:
+    category, β, i, i_prime, j_prime, j, condition = key
+    if β == NO_CONTEXT:
+        return [CATEGORIES.string(category), None, i, i_prime, j_prime, j, None]
+    return [CATEGORIES.string(category), CATEGORIES.string(β), i, i_prime, j_prime, j, portable_condition(condition)]
+
+
+def _interned_key(key: list) -> ItemKey:
+    category, β, i, i_prime, j_prime, j, condition = key
+    if β is None:
+        return CATEGORIES.intern(category), NO_CONTEXT, i, i_prime, j_prime, j, NO_CONTEXT
+    return CATEGORIES.intern(category), CATEGORIES.intern(β), i, i_prime, j_prime, j, interned_condition(condition)
+
+
+def encode_forest(forest: ParseForest) -> dict:
+    """
+    :return: the forest as json data, with category strings since the ids differ per process
+    """
+    keys = list(forest.backpointers)
+    index = {key: n for n, key in enumerate(keys)}
+    return {'items': [_portable_key(key) for key in keys],
+            'backpointers': [[[rule, None if left is None else index[left], None if right is None else index[right]]
+                              for rule, left, right in forest.backpointers[key]] for key in keys]}
+
+
+def decode_forest(data: dict) -> ParseForest:
+    """
+    :return: the forest encoded by encode_forest, with the ids of this process
+    """
+    forest = ParseForest()
+    keys = [_interned_key(key) for key in data['items']]
+    for key, backpointers in zip(keys, data['backpointers']):
+        forest.backpointers[key] = [(rule, None if left is None else keys[left], None if right is None else keys[right])
+                                    for rule, left, right in backpointers]
+    return forest
+
+
+class ResultCache:
+    """
+    Caches the result of parsing a sentence (parse counts, edges, rule stats, optionally a forest) under
+    its sentence_key, in memory with least recently used eviction, and optionally in a sqlite file
+    so that the results survive across runs and are shared by the worker processes of a corpus run.
+    Results are json data, e.g. a ParseStats as_dict() and an encode_forest() as their 'forest'.
+    The forests are only kept by a cache made with forests=True (see corpus_runner.parse_sentence),
+    it only returns results that have one.
+
+    >>> cache = ResultCache(maxsize=1)
+    >>> key = sentence_key(['NP', 'S\\\\NP'], 'fast', 2)
+    >>> cache.get(key), cache.put(key, {'parses': 1}), cache.get(key)
+    (None, None, {'parses': 1})
+    >>> forests = ResultCache(forests=True)
+    >>> forests.put(key, {'parses': 1}), forests.get(key), cache.put(key, {'parses': 1, 'forest': {}}), cache.get(key)
+    (None, None, None, {'parses': 1})
+    """
+
+    def __init__(self, maxsize: Optional[int] = 1 << 16, path: Optional[str] = None, forests: bool = False):
+        """
+        :param maxsize: the number of results kept in memory, None keeps everything
+        :param path: a sqlite file that every result is also written to, created if it does not exist
+        :param forests: keep the 'forest' of the results, otherwise it is dropped from what is put
+        """
+        self.maxsize = maxsize
+        self.path = path
+        self.forests = forests
+        self._entries = OrderedDict()
+        self._db = None
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        if path is not None:
+            # several worker processes write to the same file, so wait for the lock instead of failing
+            self._db = sqlite3.connect(path, timeout=60)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('PRAGMA synchronous=NORMAL')
+            self._db.execute('CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+            self._db.commit()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def _remember(self, key: str, value: dict):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        if self.maxsize is not None and len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def get(self, key: str) -> Optional[dict]:
+        """
+        :return: the cached result, None if there is none (or if it has no forest in a cache of forests)
+        """
+        value = self._entries.get(key)
+        if self._usable(value):
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return value
+        if self._db is not None:
+            row = self._db.execute('SELECT value FROM results WHERE key = ?', (key,)).fetchone()
+            value = json.loads(row[0]) if row is not None else None
+            if self._usable(value):
+                self.hits += 1
+                self.disk_hits += 1
+                self._remember(key, value)
+                return value
+        self.misses += 1
+        return None
+
+    def _usable(self, value: Optional[dict]) -> bool:
+        # a cache of forests only returns results with a forest
+        return value is not None and (not self.forests or 'forest' in value)
+
+    def put(self, key: str, value: dict):
+        """
+        Caches a result, replacing the one cached under the same key.
+        """
+        if not self.forests and 'forest' in value:
+            value = {name: data for name, data in value.items() if name != 'forest'}
+        self._remember(key, value)
+        if self._db is not None:
+            self._db.execute('INSERT OR REPLACE INTO results (key, value) VALUES (?, ?)',
+                             (key, json.dumps(value, separators=(',', ':'))))
+            self._db.commit()
+
+    def clear(self):
+        """
+        Forgets every result, also the ones in the sqlite file.
+        """
+        self._entries.clear()
+        if self._db is not None:
+            self._db.execute('DELETE FROM results')
+            self._db.commit()
+
+    def counters(self) -> dict:
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'disk_hits': self.disk_hits,
+                'size': len(self._entries), 'hit_rate': self.hits / lookups if lookups else 0.0}
+
+
+def sentence_categories(lattice: Lattice) -> List[Union[str, List[str]]]:
+    """
+    :return: the categories of every position of a lattice as the parsers see them, the probabilities are not
+             used without a beam: the category of a position with one, '' for none and a list for several
+    """
+    return [[category for category, _ in tags] if len(tags) > 1 else tags[0][0] if tags else '' for tags in lattice]
@@ -0,0 +1,88 @@
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+# marks a key that is not in the cache, None is a valid (and the most common) rule result
+_MISSING = object()
+
+
+class RuleCache:
+    """
+    Memoises the category level part of the combinatory rules.
+    Whether two categories combine under a rule, and into what, only depends on the rule,
+    the two categories and c_G, so one cache can be shared by every sentence of a corpus run.
+    Keys are (rule, left category id, right category id[, c_G]); ids come from the
+    process wide category table, so a cache must not be shared across processes.
+
+    >>> cache = RuleCache(maxsize=2)
+    >>> cache(max, 1, 2), cache(max, 1, 2), cache.hits, cache.misses
+    (2, 2, 1, 1)
+    """
+
+    def __init__(self, maxsize: Optional[int] = 1 << 20):
+        """
+        :param maxsize: the number of results kept, the least recently used one is evicted first.
+                        None keeps everything.
+        """
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __call__(self, rule: Callable, *args):
+        """
+        Returns rule(*args), computing it only if it is not cached yet.
+        """
+        return self.compute(rule, rule, *args)
+
+    def compute(self, rule: Callable, compute: Callable, *args):
+        """
+        Returns rule(*args) from the cache, computing it as compute(*args) if it is not cached yet.
+        compute has to give the same result as rule, e.g. a counted version of it (see RuleTable.counted),
+        so that it shares the entries of rule.
+        """
+        key = (rule, *args)
+        result = self._entries.get(key, _MISSING)
+        if result is not _MISSING:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return result
+
+        self.misses += 1
+        result = compute(*args)
+        self._entries[key] = result
+        if self.maxsize is not None and len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        return result
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self):
+        self._entries.clear()
+
+    def reset_counters(self):
+        self.hits = self.misses = self.evictions = 0
+
+    def counters(self) -> Dict[str, float]:
+        """
+        :return: hits, misses, evictions, current size and hit rate since the last reset
+        """
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self._entries),
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+
+def apply_rule(rule_cache: Optional[RuleCache], rule: Callable, *args):
+    """
+    Calls rule(*args), through rule_cache if one is given.
+    """
+    if rule_cache is None:
+        return rule(*args)
+    return rule_cache(rule, *args)
@@ -0,0 +1,241 @@
+import time
+from typing import Callable, Dict, Iterable, Optional, Tuple
+from categories import CATEGORIES
+from rule_cache import RuleCache
+
+# A binary rule on category ids: (left, right) -> (result, degree) or None.
+# The degree is the number of arguments of β the result inherits from the secondary category,
+# 0 for application, 1 for (crossed) composition, more for generalised composition.
+CategoryRule = Callable[[int, int], Optional[Tuple[int, int]]]
+
+
+def _degree_of(β: int) -> int:
+    return CATEGORIES[β].arity
+
+
+def forward_rule(left: int, right: int) -> Optional[Tuple[int, int]]:
+    # X/Y and Yβ give Xβ
+    match = CATEGORIES.apply(CATEGORIES[left].forward_args, right)
+    if match is None:
+        return None
+    func_type, _, _, β = match
+    return CATEGORIES.concat(func_type, β), _degree_of(β)
+
+
+def backward_rule(left: int, right: int) -> Optional[Tuple[int, int]]:
+    # X\Y and Yβ give Xβ
+    match = CATEGORIES.apply(CATEGORIES[left].backward_args, right)
+    if match is None:
+        return None
+    func_type, _, _, β = match
+    return CATEGORIES.concat(func_type, β), _degree_of(β)
+
+
+def backward_crossing_rule(left: int, right: int) -> Optional[Tuple[int, int]]:
+    # Yβ and X\Y give Xβ
+    match = CATEGORIES.apply(CATEGORIES[right].backward_args, left)
+    if match is None:
+        return None
+    func_type, _, _, β = match
+    return CATEGORIES.concat(func_type, β), _degree_of(β)
+
+
+def is_punctuation(category: int) -> bool:
+    # punctuation keeps its token as its category, e.g. '.' or ','
+    return not any(character.isalnum() for character in CATEGORIES[category].string)
+
+
+def conj_rule(left: int, right: int) -> Optional[Tuple[int, int]]:
+    # CONJ and X give X\X
+    if CATEGORIES[left].string != 'CONJ' or is_punctuation(right):
+        return None
+    category = CATEGORIES[right].string
+    return CATEGORIES.intern(f"{category}\\({category})"), 0
+
+
+def left_punctuation_rule(left: int, right: int) -> Optional[Tuple[int, int]]:
+    # punctuation and X give X
+    return (right, 0) if is_punctuation(left) and not is_punctuation(right) else None
+
+
+def right_punctuation_rule(left: int, right: int) -> Optional[Tuple[int, int]]:
+    # X and punctuation give X
+    return (left, 0) if is_punctuation(right) and not is_punctuation(left) else None
+
+
+class Combinator:
+    """
+    An entry of a rule table: a binary rule on categories with the PMB functors (see read_ccg.FUNCTION_TYPES)
+    it covers. Combinators that only combine items sharing an argument (the slash rules) are argument_driven,
+    only those pairs of items are tried when cells are indexed (see chart.CellIndex).
+    """
+    __slots__ = ('name', 'rule', 'functors', 'composes', 'argument_driven')
+
+    def __init__(self, name: str, rule: CategoryRule, functors: Tuple[str, ...] = (), composes: bool = True,
+                 argument_driven: bool = True):
+        """
+        :param name: the name the items built by the rule are added under
+        :param rule: the rule on category ids
+        :param functors: the PMB functors the rule covers
+        :param composes: whether the degree bound of the table applies, False for rules of degree 0
+        :param argument_driven: whether the two categories always share an argument
+        """
+        self.name = name
+        self.rule = rule
+        self.functors = functors
+        self.composes = composes
+        self.argument_driven = argument_driven
+
+    def __repr__(self):
+        return f"Combinator({self.name}, {self.functors})"
+
+
+# The binary rules the parsers know. forward covers fa, fc, fxc and their generalisations (X/Y Yβ),
+# backward_crossing covers ba, bc, bxc, gbc and gbxc (Yβ X\Y), backward is the X\Y Yβ rule of cky_parse.
+COMBINATORS: Dict[str, Combinator] = {combinator.name: combinator for combinator in (
+    Combinator('forward', forward_rule, ('fa', 'fc', 'fxc')),
+    Combinator('backward', backward_rule),
+    Combinator('backward_crossing', backward_crossing_rule, ('ba', 'bc', 'bxc', 'gbc', 'gbxc')),
+    Combinator('conj', conj_rule, ('conj',), composes=False, argument_driven=False),
+    Combinator('lp', left_punctuation_rule, ('lp',), composes=False, argument_driven=False),
+    Combinator('rp', right_punctuation_rule, ('rp',), composes=False, argument_driven=False),
+)}
+
+# PMB functors that are not binary rules: t is a lexical entry, ccg wraps a derivation,
+# lx is a unary type changing rule and op is not a combination of two categories.
+NON_BINARY_FUNCTORS = {'t', 'ccg', 'lx', 'op'}
+
+
+class RuleTable:
+    """
+    A set of combinators compiled into one dispatch per pair of categories: the first time two categories
+    meet, every combinator of the table is tried once, and the (rule name, result) pairs they give are kept,
+    so a parser makes one lookup per pair of items whatever the number of rules.
+    Adding a combinator to the table is all it takes to have the parsers use it.
+    max_degree bounds generalised composition (0 only allows application), None leaves it unbounded.
+    A table can be shared by all sentences of a process, the ids come from the process wide category table.
+
+    >>> table = RuleTable(('forward', 'backward_crossing'), max_degree=0)
+    >>> left, right = CATEGORIES.intern("S/NP"), CATEGORIES.intern("NP/N")
+    >>> table.combine(left, right), table.combine(left, CATEGORIES.intern("NP"))[0][0]
+    ((), 'forward')
+    """
+
+    def __init__(self, combinators: Iterable[str] = ('forward', 'backward', 'backward_crossing'),
+                 max_degree: Optional[int] = None):
+        """
+        :param combinators: names of COMBINATORS, in the order their items are added
+        :param max_degree: the largest degree of composition, None for any
+        """
+        self.combinators = tuple(COMBINATORS[name] for name in combinators)
+        self.max_degree = max_degree
+        # items of every pair of cells have to be tried, not only the ones sharing an argument
+        self.all_pairs = not all(combinator.argument_driven for combinator in self.combinators)
+        self._pairs: Dict[Tuple[int, int], Tuple[Tuple[str, int], ...]] = {}
+
+    def __len__(self) -> int:
+        return len(self.combinators)
+
+    @property
+    def functors(self):
+        """
+        :return: the PMB functors covered by the table
+        """
+        return {functor for combinator in self.combinators for functor in combinator.functors}
+
+    def degree(self, max_arity: int) -> int:
+        """
+        The maximum degree d of a composition, as used for the arity bound c_G (see fast_ccg.compute_artiy_bound).
+        :param max_arity: the maximum arity of a lexical category, the degree an unbounded table can reach
+        """
+        return max_arity if self.max_degree is None else min(self.max_degree, max_arity)
+
+    def results(self, left: int, right: int) -> Tuple[Tuple[str, int], ...]:
+        """
+        Tries every combinator on a pair of categories, without looking at the compiled pairs.
+        :return: (rule name, result category id) for every rule that gives a well formed category
+        """
+        results = []
+        for combinator in self.combinators:
+            category = self._kept(combinator, combinator.rule(left, right))
+            if category is not None:
+                results.append((combinator.name, category))
+        return tuple(results)
+
+    def _kept(self, combinator: Combinator, result: Optional[Tuple[int, int]]) -> Optional[int]:
+        # the result category of a combinator, None if it does not apply, composes too deep or is not well formed
+        if result is None:
+            return None
+        category, degree = result
+        if self.max_degree is not None and combinator.composes and degree > self.max_degree:
+            return None
+        return category if CATEGORIES[category].well_formed else None
+
+    def combine(self, left: int, right: int) -> Tuple[Tuple[str, int], ...]:
+        """
+        :return: the results of results(left, right), computed once per pair
+        """
+        key = (left, right)
+        found = self._pairs.get(key)
+        if found is None:
+            found = self._pairs[key] = self.results(left, right)
+        return found
+
+    def counted(self, stats,
+                rule_cache: Optional[RuleCache] = None) -> Callable[[int, int], Tuple[Tuple[str, int], ...]]:
+        """
+        :param stats: a parse_stats.ParseStats
+        :param rule_cache: the cache the parse uses, if any (see rule_cache.RuleCache)
+        :return: a function like combine that counts and times every combinator under its name. It looks the pairs
+                 up where the parse without stats does, in rule_cache if given or else in the compiled pairs,
+                 so that the stats describe the same work. The rules are timed when a pair is computed,
+                 a pair found counts as an attempt of every combinator (see count_hit)
+        """
+        counters = tuple((combinator, stats.rule(combinator.name)) for combinator in self.combinators)
+        clock = time.perf_counter_ns
+
+        def timed(left: int, right: int) -> Tuple[Tuple[str, int], ...]:
+            results = []
+            for combinator, rule_stats in counters:
+                start = clock()
+                result = combinator.rule(left, right)
+                rule_stats.time_ns += clock() - start
+                rule_stats.attempts += 1
+                category = self._kept(combinator, result)
+                if category is not None:
+                    rule_stats.successes += 1
+                    results.append((combinator.name, category))
+            return tuple(results)
+
+        def combine(left: int, right: int) -> Tuple[Tuple[str, int], ...]:
+            if rule_cache is not None:
+                misses = rule_cache.misses
+                found = rule_cache.compute(self.results, timed, left, right)
+                if rule_cache.misses == misses:
+                    self.count_hit(stats, found)
+                return found
+            key = (left, right)
+            found = self._pairs.get(key)
+            if found is None:
+                found = self._pairs[key] = timed(left, right)
+            else:
+                self.count_hit(stats, found)
+            return found
+        return combine
+
+    def count_hit(self, stats, results: Iterable[tuple]):
+        """
+        Counts a pair whose results were found in a cache into stats as if the rules were tried: an attempt and
+        a cache hit of every combinator, a success of every rule in results. No time is spent in the rules.
+        :param results: the results found, tuples that start with the rule name as those of combine
+        """
+        for combinator in self.combinators:
+            rule_stats = stats.rule(combinator.name)
+            rule_stats.attempts += 1
+            rule_stats.cache_hits += 1
+        for result in results:
+            stats.rule(result[0]).successes += 1
+
+
+# the rules of cky_parse and bitset_parse
+CKY_RULES = RuleTable()
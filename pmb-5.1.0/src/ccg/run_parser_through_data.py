@@ -1,41 +1,10 @@
 import re
-from fast_ccg import fast_ccg
-from ccg import cky_parse 
-import os
-import string
+from corpus_runner import load_sentences, run_corpus
 import matplotlib.pyplot as plt
 from collections import defaultdict
-import time
 import numpy as np
 
 
-def remove_features(input_str):
-    result = []
-    i = 0
-    while i < len(input_str):
-        if input_str[i:i+2] == "s:":
-            # Add just "s" and skip over the feature part until we hit a '/' or ')'
-            result.append("s")
-            i += 2  # Skip over "s:"
-            while i < len(input_str) and input_str[i] not in ['/','(',')', '\\']:
-                i += 1
-        else:
-            result.append(input_str[i])
-            i += 1
-    return ''.join(result)
-
-def parse_ccg_structure(ccg_text):
-    ccg_entries = []
-    pattern_token = r"t\((.*?), '(.*?)', \[(.*?)\]\)"
-    lines = ccg_text.splitlines()
-    for line in lines:
-        token_match = re.search(pattern_token, line)
-        if token_match:
-            category, word, features = token_match.groups()
-            cat_no_feature = remove_features(re.sub(r'[()]', '', category))
-            ccg_entries.append((word, cat_no_feature.upper()))
-    return ccg_entries
-
 def human_readable_format_simple(ccg_entries):
     output = []
     for word, category in ccg_entries:
@@ -66,6 +35,28 @@ all_paths = ["/Users/paulhe/Desktop/CCG Parsing/pmb-5.1.0/src/ccg/standard",
              "/Users/paulhe/Desktop/CCG Parsing/pmb-5.1.0/src/ccg/de_ccg",
              "/Users/paulhe/Desktop/CCG Parsing/pmb-5.1.0/src/ccg/it_ccg"]
 
+# None uses one worker process per CPU, 0 parses everything in this process
+NUM_WORKERS = None
+# seconds allowed per sentence (both parsers), None for no limit
+SENTENCE_TIMEOUT = 600
+# the sentences of all_paths are compiled into this file on the first run, None to read the .ccg files every time
+CORPUS_CACHE = "pmb_corpus.cache"
+# a sqlite file to keep the parse results in, e.g. "pmb_results.sqlite", so sentences parsed in an earlier run
+# (or with the same categories) are not parsed again. None always parses, which is what a run after a change
+# to the parsers needs: the results of older runs are only told apart by result_cache.RESULT_VERSION
+RESULT_CACHE = None
+# keep the brackets and s: features of the categories, so features have to agree for rules to apply
+STRUCTURED_CATEGORIES = False
+# also parse the sentences with lx nodes, with the unary rules of their derivation
+PARSE_LX = True
+# items and estimated chart bytes a parser may store per sentence before it is stopped, None for no limit
+MAX_EDGES = None
+MAX_BYTES = 2 * 1024 ** 3
+# print which rules the parsers spend their time in, per language
+COLLECT_RULE_STATS = False
+# write a Chrome trace of the chart growth of every sentence to this directory, None for no traces
+TRACE_DIR = None
+
 
 count = 0
 total = 0
@@ -92,82 +83,57 @@ naive_derivation_time = defaultdict(int)
 mismatched_parses = 0
 mismatched_km = 0
 
-for idx in range(len(all_paths)):
-    directory_path = all_paths[idx]
-    for root, dirs, files in os.walk(directory_path):
-        # print(files)
-        for file in files:
-            # print(file)
-            if file.endswith(".ccg"):
-                # print(file)
-                total += 1
-                total_per_lan[mapping_language[idx]] += 1
-                
-                # print('ok', all_function_types)
-                file_path = os.path.join(root, file)
-                with open(file_path, "r") as f:
-                    prolog_code = f.read()
-                    match = re.search(r'ccg\(.*', prolog_code, re.DOTALL)
-                    if match and 'lx' not in prolog_code:
-                        # if file == 'p74_d1790.ccg':
-                        #     print(prolog_code)
-                        #     print(match.group(0))
-                        count += 1
-                        result = match.group(0)
-                        ccg_entries_simple = parse_ccg_structure(result)
-                        lexicon = {x:y for x, y in ccg_entries_simple}
-                        input_tokens = [x[0] for x in ccg_entries_simple if x[0] not in string.punctuation]
-
-                        start_time = time.time()
-                        num_parses, chart, num_edges, num_km_edges = fast_ccg(lexicon, input_tokens)
-                        end_time = time.time()
-                        total_edges += num_edges
-                        kulhmann_edges += num_km_edges
-                        
-                        elapsed_time = end_time - start_time
-                        # derivation_length_time[len(lexicon)].append(elapsed_time)
-                        derivation_length_time[file] = elapsed_time
-
-                        # print(num_parses)
-                        
-                        start_naive_time = time.time()
-                        naive_parses, chart_naive = cky_parse(lexicon, input_tokens)
-                        end_naive_time = time.time()
-                        elapsed_time = end_naive_time - start_naive_time
-                        # naive_derivation_time[len(lexicon)].append(elapsed_time)
-                        naive_derivation_time[file] = elapsed_time
-
-                        print(f'FAST PARSES {num_parses}, NAIVE PARSES {naive_parses}')
-                        if num_parses != naive_parses:
-                            print(file)
-                            mismatched_parses += 1
-                            if int('KuhlmannItem' in str(chart)) >= 1:
-                                mismatched_km += 1
-                        if idx == 0:
-                            derivation_length_en[num_parses] += 1
-                            kulhmann_edges_per_lan['en'] += num_km_edges
-                            total_edges_per_lan['en'] += num_edges
-                        elif idx == 1:
-                            derivation_length_de[num_parses] += 1
-                            kulhmann_edges_per_lan['de'] += num_km_edges
-                            total_edges_per_lan['de'] += num_edges
-                        elif idx == 2:
-                            derivation_length_it[num_parses] += 1
-                            kulhmann_edges_per_lan['it'] += num_km_edges
-                            total_edges_per_lan['it'] += num_edges
-
-
-                        kulhmann_count += int('KuhlmannItem' in str(chart))
-                        kulhmann_per_lan[mapping_language[idx]] += int('KuhlmannItem' in str(chart))
-                        # if int('KuhlmannItem' in str(chart)):
-                        #     print(str(chart))   
-                        #     for item in chart[0][len(input_tokens) - 1]:
-                        #         if item.category == "S":
-                        #             print('nice')
-                        # print('KULMANN COUNT',kulhmann_count, 'TOTAL', total)
-                    else:
-                        lx_rules[mapping_language[idx]] += 1
-
+derivation_length_per_lan = {'en': derivation_length_en, 'de': derivation_length_de, 'it': derivation_length_it}
+
+if __name__ == "__main__":
+    # sentences are parsed on a process pool, results come back in corpus order
+    jobs = load_sentences({mapping_language[idx]: all_paths[idx] for idx in range(len(all_paths))},
+                          cache_path=CORPUS_CACHE, structured=STRUCTURED_CATEGORIES, parse_lx=PARSE_LX)
+    results, language_stats = run_corpus(jobs, workers=NUM_WORKERS, timeout=SENTENCE_TIMEOUT,
+                                         rule_stats=COLLECT_RULE_STATS, trace_dir=TRACE_DIR,
+                                         result_cache=RESULT_CACHE, max_edges=MAX_EDGES, max_bytes=MAX_BYTES)
+
+    for result in results:
+        file, lan = result['file'], result['language']
+        total += 1
+        total_per_lan[lan] += 1
+        lx_rules[lan] += int(result['lx'])
+        if result['status'] == 'skipped':
+            continue
+        if result['status'] != 'ok':
+            print(f"{result['status'].upper()}: {file}")
+            continue
+
+        count += 1
+        num_parses, naive_parses = result['fast_parses'], result['naive_parses']
+        num_edges, num_km_edges = result['edges'], result['km_edges']
+        total_edges += num_edges
+        kulhmann_edges += num_km_edges
+        derivation_length_time[file] = result['fast_time']
+        naive_derivation_time[file] = result['naive_time']
+
+        print(f'FAST PARSES {num_parses}, NAIVE PARSES {naive_parses}')
+        used_kuhlmann = int(num_km_edges > 0)
+        if num_parses != naive_parses:
+            print(file)
+            mismatched_parses += 1
+            mismatched_km += used_kuhlmann
+        derivation_length_per_lan[lan][num_parses] += 1
+        kulhmann_edges_per_lan[lan] += num_km_edges
+        total_edges_per_lan[lan] += num_edges
+
+        kulhmann_count += used_kuhlmann
+        kulhmann_per_lan[lan] += used_kuhlmann
+
+    for lan, stats in language_stats.items():
+        lookups = stats['cache_hits'] + stats['cache_misses']
+        print(f"{lan}: {stats['parsed']} parsed, {stats['timeouts']} timeouts, {stats['errors']} errors, "
+              f"rule cache hit rate {stats['cache_hits'] / lookups if lookups else 0.0:.2f}, "
+              f"{stats['cached']} parses taken from the result cache, "
+              f"{stats['over_budget']} over budget, peak chart memory {stats['peak_bytes'] / 1024 ** 2:.1f} MiB")
+        for parser, rule_stats in stats['rule_stats'].items():
+            print(f"{lan} {parser}:")
+            print(rule_stats.summary())
 
 
 
@@ -271,94 +237,95 @@ def plot_runtimes():
 # plt.show()
 
 
-all_lang = ['EN', 'DE', 'IT']
-total_count = [total_per_lan['en'], total_per_lan['de'], total_per_lan['it']]
-lx_count = list(lx_rules.values())
-non_lx_count = [total_count[lang] - lx_count[lang] for lang in range(len(total_count))]
+if __name__ == "__main__":
+    all_lang = ['EN', 'DE', 'IT']
+    total_count = [total_per_lan['en'], total_per_lan['de'], total_per_lan['it']]
+    lx_count = list(lx_rules.values())
+    non_lx_count = [total_count[lang] - lx_count[lang] for lang in range(len(total_count))]
 
-x = np.arange(len(total_count))
+    x = np.arange(len(total_count))
 
-# print(total_edges_per_lan)
-# print(kulhmann_edges_per_lan)
+    # print(total_edges_per_lan)
+    # print(kulhmann_edges_per_lan)
 
-kulhmann_edges = list(kulhmann_edges_per_lan.values())
-non_kulhmann_edges = [total_edges_per_lan[lang] - kulhmann_edges_per_lan[lang] for lang in ['en', 'de', 'it']]
+    kulhmann_edges = list(kulhmann_edges_per_lan.values())
+    non_kulhmann_edges = [total_edges_per_lan[lang] - kulhmann_edges_per_lan[lang] for lang in ['en', 'de', 'it']]
 
-# # Plot stacked bars
-# plt.figure(figsize=(10, 6))
-# plt.bar(x, lx_count, label="Magic Counts", color="skyblue")
-# plt.bar(x, non_lx_count, bottom=lx_count, label="Non-Magic Count", color="orange")
+    # # Plot stacked bars
+    # plt.figure(figsize=(10, 6))
+    # plt.bar(x, lx_count, label="Magic Counts", color="skyblue")
+    # plt.bar(x, non_lx_count, bottom=lx_count, label="Non-Magic Count", color="orange")
 
-# plt.title("'Magic' and 'Non-Magic 'Counts")
-# plt.xlabel("Languages")
-# plt.ylabel("Counts")
-# plt.xticks(x, all_lang)
-# plt.legend()
-# plt.grid(axis="y", linestyle="--", alpha=0.7)
+    # plt.title("'Magic' and 'Non-Magic 'Counts")
+    # plt.xlabel("Languages")
+    # plt.ylabel("Counts")
+    # plt.xticks(x, all_lang)
+    # plt.legend()
+    # plt.grid(axis="y", linestyle="--", alpha=0.7)
 
-# plt.tight_layout()
-# plt.show()
+    # plt.tight_layout()
+    # plt.show()
 
-kulhmann_edges = list(kulhmann_edges_per_lan.values())
-non_kulhmann_edges = [total_edges_per_lan[lang] - kulhmann_edges_per_lan[lang] for lang in ['en', 'de', 'it']]
-kulhmann_count = list(kulhmann_per_lan.values())
-non_km_count = [total_count[lang] - kulhmann_count[lang] for lang in range(len(total_count))]
-bar_width = 0.4  
+    kulhmann_edges = list(kulhmann_edges_per_lan.values())
+    non_kulhmann_edges = [total_edges_per_lan[lang] - kulhmann_edges_per_lan[lang] for lang in ['en', 'de', 'it']]
+    kulhmann_count = list(kulhmann_per_lan.values())
+    non_km_count = [total_count[lang] - kulhmann_count[lang] for lang in range(len(total_count))]
+    bar_width = 0.4  
 
-# plt.figure(figsize=(10, 6))
-# plt.bar(x - bar_width / 2, kulhmann_count, width=bar_width, label="Kulhmann Count", color="skyblue")
-# plt.bar(x - bar_width / 2, non_km_count, width=bar_width, bottom=kulhmann_count, label="Non-Kulhmann Count", color="orange")
-# plt.bar(x + bar_width / 2, kulhmann_edges, width=bar_width, label="Kulhmann Edges", color="lightgreen")
-# plt.bar(x + bar_width / 2, non_kulhmann_edges, width=bar_width, bottom=kulhmann_edges, label="Non-Kulhmann Edges", color="salmon")
-
-# # Adding titles and labels
-# plt.title("Ratio of Kuhlmann Rules Applied")
-# plt.xlabel("Languages")
-# plt.ylabel("Counts")
-# plt.xticks(x, all_lang)  # Add language names as x-axis labels
-# plt.legend()
-# plt.grid(axis="y", linestyle="--", alpha=0.7)
+    # plt.figure(figsize=(10, 6))
+    # plt.bar(x - bar_width / 2, kulhmann_count, width=bar_width, label="Kulhmann Count", color="skyblue")
+    # plt.bar(x - bar_width / 2, non_km_count, width=bar_width, bottom=kulhmann_count, label="Non-Kulhmann Count", color="orange")
+    # plt.bar(x + bar_width / 2, kulhmann_edges, width=bar_width, label="Kulhmann Edges", color="lightgreen")
+    # plt.bar(x + bar_width / 2, non_kulhmann_edges, width=bar_width, bottom=kulhmann_edges, label="Non-Kulhmann Edges", color="salmon")
 
-# plt.tight_layout()
-# plt.show()
+    # # Adding titles and labels
+    # plt.title("Ratio of Kuhlmann Rules Applied")
+    # plt.xlabel("Languages")
+    # plt.ylabel("Counts")
+    # plt.xticks(x, all_lang)  # Add language names as x-axis labels
+    # plt.legend()
+    # plt.grid(axis="y", linestyle="--", alpha=0.7)
 
+    # plt.tight_layout()
+    # plt.show()
 
-# Bar width
-bar_width = 0.4
-
-# Plot 1: Counts
-plt.figure(figsize=(10, 6))
-plt.bar(x, kulhmann_count, width=bar_width, label="Kulhmann Count", color="skyblue")
-plt.bar(x, non_km_count, width=bar_width, bottom=kulhmann_count, label="Non-Kulhmann Count", color="orange")
-plt.title("Ratio of Kuhlmann Rules Applied: Per Sentence")
-plt.xlabel("Languages")
-plt.ylabel("Counts")
-plt.xticks(x, all_lang)  
-plt.legend()
-plt.grid(axis="y", linestyle="--", alpha=0.7)
-plt.tight_layout()
-plt.show()
-
-# Plot 2: Edges
-plt.figure(figsize=(10, 6))
-plt.bar(x, kulhmann_edges, width=bar_width, label="Kulhmann Edges", color="lightgreen")
-plt.bar(x, non_kulhmann_edges, width=bar_width, bottom=kulhmann_edges, label="Non-Kulhmann Edges", color="salmon")
-plt.title("Ratio of Kuhlmann Rules Applied: Per Edge")
-plt.xlabel("Languages")
-plt.ylabel("Edges")
-plt.xticks(x, all_lang)  
-plt.legend()
-plt.grid(axis="y", linestyle="--", alpha=0.7)
-plt.tight_layout()
-plt.show()
-
-
-# plt.bar(x, total_count)
-# plt.show()
 
-# plt.bar(x, lx_count)
-# plt.show()
+    # Bar width
+    bar_width = 0.4
 
-# plt.bar(x, kulhmann_count)
-# plt.show()
+    # Plot 1: Counts
+    plt.figure(figsize=(10, 6))
+    plt.bar(x, kulhmann_count, width=bar_width, label="Kulhmann Count", color="skyblue")
+    plt.bar(x, non_km_count, width=bar_width, bottom=kulhmann_count, label="Non-Kulhmann Count", color="orange")
+    plt.title("Ratio of Kuhlmann Rules Applied: Per Sentence")
+    plt.xlabel("Languages")
+    plt.ylabel("Counts")
+    plt.xticks(x, all_lang)  
+    plt.legend()
+    plt.grid(axis="y", linestyle="--", alpha=0.7)
+    plt.tight_layout()
+    plt.show()
+
+    # Plot 2: Edges
+    plt.figure(figsize=(10, 6))
+    plt.bar(x, kulhmann_edges, width=bar_width, label="Kulhmann Edges", color="lightgreen")
+    plt.bar(x, non_kulhmann_edges, width=bar_width, bottom=kulhmann_edges, label="Non-Kulhmann Edges", color="salmon")
+    plt.title("Ratio of Kuhlmann Rules Applied: Per Edge")
+    plt.xlabel("Languages")
+    plt.ylabel("Edges")
+    plt.xticks(x, all_lang)  
+    plt.legend()
+    plt.grid(axis="y", linestyle="--", alpha=0.7)
+    plt.tight_layout()
+    plt.show()
+
+
+    # plt.bar(x, total_count)
+    # plt.show()
+
+    # plt.bar(x, lx_count)
+    # plt.show()
+
+    # plt.bar(x, kulhmann_count)
+    # plt.show()
 
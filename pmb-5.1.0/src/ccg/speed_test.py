@@ -18,7 +18,7 @@ input_tokens = [f"w{i}" for i in range(1, 9)]
 
 # Timing CKY parse
 start_time = time.time()
-naive_item = cky_parse(lexicon, input_tokens)
+naive_parses, naive_chart = cky_parse(lexicon, input_tokens)
 cky_duration = time.time() - start_time
 print(f"CKY Parse time: {cky_duration:.6f} seconds")
 
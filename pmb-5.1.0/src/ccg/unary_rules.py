@@ -0,0 +1,98 @@
+from typing import Callable, Dict, Iterable, List, Set, Tuple
+from categories import CATEGORIES
+from ccg import Item
+
+# a unary rule as (argument, result), e.g. ('N', 'NP') for the PMB node lx(np, n, ...)
+UnaryRule = Tuple[str, str]
+
+
+class UnaryRules:
+    """
+    The unary type changing and type raising rules of a grammar (the lx nodes of the PMB), compiled into
+    their closure: every category maps to all the categories one or more of the rules rewrite it into.
+    A parser then adds the unary items of a new item with one lookup instead of applying the rules to
+    every cell until nothing changes. Only the items built by the other rules are rewritten, the closure
+    of an item already holds everything its rewrites could be rewritten into, so chains and cycles of
+    rules end after one step. An argument without features also rewrites a category with features,
+    as for the binary rules (see categories.CategoryTable.unifies).
+    The closure of a category is computed the first time it is looked up and kept, so one UnaryRules
+    can be shared by all the sentences over a grammar.
+
+    >>> unary = UnaryRules([("N", "NP"), ("NP", "S/(S\\\\NP)")])
+    >>> [CATEGORIES.string(category) for category in unary.closure(CATEGORIES.intern("N"))]
+    ['NP', 'S/(S\\\\NP)']
+    """
+
+    def __init__(self, rules: Iterable[UnaryRule] = ()):
+        """
+        :param rules: (argument, result) pairs, e.g. from pmb_reader.SentenceRecord.unary_rules
+        """
+        self.rules: Tuple[UnaryRule, ...] = tuple(sorted(set(rules)))
+        categories = CATEGORIES.categories
+        # argument id -> result ids, and plain argument id -> argument ids
+        self._results: Dict[int, List[int]] = {}
+        self._arguments: Dict[int, List[int]] = {}
+        for argument, result in self.rules:
+            argument_id = CATEGORIES.intern(argument)
+            if argument_id not in self._results:
+                self._arguments.setdefault(categories[argument_id].plain, []).append(argument_id)
+            self._results.setdefault(argument_id, []).append(CATEGORIES.intern(result))
+        self._closures: Dict[int, Tuple[int, ...]] = {}
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def __bool__(self) -> bool:
+        return bool(self.rules)
+
+    def results(self) -> Set[str]:
+        """
+        :return: the categories the rules rewrite into
+        """
+        return {result for _, result in self.rules}
+
+    def categories(self) -> Set[str]:
+        """
+        :return: the categories the rules rewrite and rewrite into
+        """
+        return {category for rule in self.rules for category in rule}
+
+    def _rewrites(self, category_id: int) -> Iterable[int]:
+        # the results of the rules whose argument is the category, up to features
+        for argument in self._arguments.get(CATEGORIES[category_id].plain, ()):
+            if argument == category_id or CATEGORIES.unifies(argument, category_id):
+                yield from self._results[argument]
+
+    def closure(self, category_id: int) -> Tuple[int, ...]:
+        """
+        :return: the ids of every category the rules rewrite the category into, in the order they are reached,
+                 without the category itself
+        """
+        found = self._closures.get(category_id)
+        if found is None:
+            seen = {category_id}
+            found = []
+            agenda = [category_id]
+            while agenda:
+                for result in self._rewrites(agenda.pop(0)):
+                    if result not in seen:
+                        seen.add(result)
+                        found.append(result)
+                        agenda.append(result)
+            found = self._closures[category_id] = tuple(found)
+        return found
+
+    def wrap_add(self, add: Callable) -> Callable:
+        """
+        Wraps the function a parser adds items with, to add the unary items of every new item to its cell,
+        under the rule 'lx' with the item as their left premise. Derivation contexts are not rewritten.
+        """
+        closure = self.closure
+
+        def rewriting(cell, item, rule, left=None, right=None):
+            is_new = add(cell, item, rule, left, right)
+            if is_new and rule != 'lx' and not hasattr(item, 'beta_id'):
+                for category in closure(item.cat_id):
+                    add(cell, Item(category, item.i, item.j), 'lx', item)
+            return is_new
+        return rewriting
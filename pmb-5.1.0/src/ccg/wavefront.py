@@ -0,0 +1,78 @@
+import multiprocessing
+import os
+from typing import Callable, List, Optional, Sequence
+
+# the task of the current wavefront, set before the workers are forked so that they inherit it
+_TASK: Optional[Callable] = None
+
+
+def _run_task(argument):
+    return _TASK(argument)
+
+
+class Wavefront:
+    """
+    Parallel chart filling for fast_ccg. All cells of the same span length only depend on shorter spans,
+    so every anti-diagonal of the chart is filled by a pool of worker processes, and the next one is
+    only started once it is complete. The pool is forked per span length, so the workers see the chart
+    of the shorter spans (and the category table) as it is, without copying it, and only send back the
+    items of their cells.
+    Forking and sending the items back costs a few milliseconds per span length, so short sentences
+    and small anti-diagonals are filled serially: a span length is only parallelised if the sentence has
+    at least min_length words and the pairs of items to combine (the product of the sizes of the cells
+    that are combined) are at least min_pairs. Processes are used rather than threads since the rules
+    are pure python and would not run in parallel under the GIL.
+    """
+
+    def __init__(self, workers: Optional[int] = None, min_length: int = 12, min_pairs: int = 20000):
+        """
+        :param workers: number of worker processes, None for one per CPU
+        :param min_length: shorter sentences are always filled serially
+        :param min_pairs: span lengths with fewer pairs of items to combine are filled serially
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.min_length = min_length
+        self.min_pairs = min_pairs
+        # number of span lengths filled in parallel and serially
+        self.parallel = 0
+        self.serial = 0
+
+    @staticmethod
+    def available() -> bool:
+        # the workers get the chart by forking, which is not available on every platform
+        return 'fork' in multiprocessing.get_all_start_methods()
+
+    def use_pool(self, chart, n: int, length: int) -> bool:
+        """
+        The cost model: whether the cells of the given span length are worth filling in parallel.
+        """
+        cells = n - length + 1
+        if self.workers < 2 or cells < 2 or n < self.min_length or not self.available():
+            self.serial += 1
+            return False
+        pairs = 0
+        for i in range(cells):
+            j = i + length - 1
+            row = chart[i]
+            for k in range(i, j):
+                pairs += len(row[k]) * len(chart[k + 1][j])
+        if pairs < self.min_pairs:
+            self.serial += 1
+            return False
+        self.parallel += 1
+        return True
+
+    def map(self, task: Callable, arguments: Sequence) -> List:
+        """
+        Runs task on every argument in forked worker processes.
+        :param task: any callable, also a closure, it is not pickled. Its results have to be picklable
+        :return: the results in the order of the arguments
+        """
+        global _TASK
+        _TASK = task
+        try:
+            workers = min(self.workers, len(arguments))
+            with multiprocessing.get_context('fork').Pool(workers) as pool:
+                return pool.map(_run_task, arguments, chunksize=max(1, len(arguments) // (4 * workers)))
+        finally:
+            _TASK = None